@@ -0,0 +1,199 @@
+"""Suchergebnisse spaltenweise: Apache Arrow (IPC-Stream) und Parquet.
+
+Analyse-Clients (pandas, Polars, DuckDB, ...) holen große Treffermengen bisher als JSON und bauen daraus wieder einen DataFrame:
+pro Flug ein Dict in der API, pro Flug ein Dict im Client. Arrow und Parquet speichern dagegen Spalten am Stück,
+der Client liest den Stream ohne Umwandlung pro Zeile (pa.ipc.open_stream(...).read_pandas()).
+
+Auch in der API entsteht kein Python-Objekt pro Zeile: PostgreSQL schickt die Treffer per COPY (SELECT ...) TO STDOUT als CSV-Bytes,
+der CSV-Leser von Arrow (C++) macht daraus blockweise Record Batches, die sofort als Arrow-Stream bzw. Parquet-Row-Group rausgehen.
+Speicher bleibt bei wenigen Blöcken, egal wie viele Treffer es gibt.
+
+Was macht der Code?:
+    - negotiate: Accept-Header --> "arrow", "parquet" oder None (dann JSON/NDJSON wie bisher).
+    - arrow_schema: Arrow-Typen aus den Spalten von models.py (String --> string, Float --> float64, TIMESTAMP --> timestamp[us], ...).
+    - BatchEncoder: sammelt CSV-Bytes, schneidet an Zeilengrenzen, parst einen Block und schreibt ihn als Batch / Row Group.
+    - stream_export / stream_export_async: COPY über psycopg2 (Thread + Queue) bzw. asyncpg --> BatchEncoder --> Bytes für StreamingResponse.
+      Andere Datenbanken (SQLite in Tests): serverseitiger Cursor, Spalten über zip(*rows).
+"""
+import io
+import queue
+import asyncio
+import threading
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from sqlalchemy import Boolean, Integer, Float, DateTime
+from database import engine, async_engine
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+FORMATS = {"arrow": (ARROW_STREAM, "arrow"), "parquet": (PARQUET, "parquet")} # Name --> (Media-Type, Dateiendung)
+BLOCK_BYTES = 4 << 20 # CSV-Bytes pro Record Batch bzw. Row Group (bei flights ca. 15.000 Zeilen)
+QUEUE_CHUNKS = 64 # COPY-Pakete zwischen Datenbank und Encoder (Gegendruck: ist die Queue voll, wartet COPY)
+QUEUE_BYTES = 256 << 10 # psycopg2: Zeilen bündeln, bevor sie in die Queue gehen
+FALLBACK_BATCH = 10000 # Zeilen pro Batch ohne COPY
+
+def negotiate(accept: str):
+    if not accept: return None
+    if ARROW_STREAM in accept: return "arrow"
+    if PARQUET in accept or "application/x-parquet" in accept: return "parquet"
+    return None
+
+def arrow_type(column):
+    t = column.type
+    if isinstance(t, Boolean): return pa.bool_()
+    if isinstance(t, Integer): return pa.int64()
+    if isinstance(t, Float): return pa.float64()
+    if isinstance(t, DateTime): return pa.timestamp("us") # TIMESTAMP ist eine Unterklasse von DateTime
+    return pa.string()
+
+def arrow_schema(columns) -> pa.Schema:
+    return pa.schema([pa.field(c.name, arrow_type(c)) for c in columns])
+
+def _record_end(data: bytes) -> int:
+    # Ende der letzten vollständigen CSV-Zeile. Ein Zeilenumbruch innerhalb eines Feldes steht zwischen Anführungszeichen
+    # --> nur ein "\n" mit gerader Anzahl '"' davor ist eine Zeilengrenze (COPY verdoppelt '"' im Feld, die Parität stimmt also).
+    pos = data.rfind(b"\n")
+    while pos != -1:
+        if data.count(b'"', 0, pos) % 2 == 0: return pos + 1
+        pos = data.rfind(b"\n", 0, pos)
+    return 0
+
+class _Sink(io.RawIOBase): # Schreibziel für Arrow/Parquet: sammelt die Bytes, drain() gibt sie an die Antwort weiter
+    def __init__(self):
+        self.parts, self.position = [], 0
+    def writable(self): return True
+    def write(self, b):
+        self.parts.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+    def tell(self): return self.position # Parquet merkt sich Offsets der Row Groups für den Footer
+    def drain(self) -> bytes:
+        out, self.parts = b"".join(self.parts), []
+        return out
+
+class BatchEncoder:
+    def __init__(self, columns, fmt: str):
+        self.schema = arrow_schema(columns)
+        self.sink = _Sink()
+        self.writer = pa.ipc.new_stream(self.sink, self.schema) if fmt == "arrow" else pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+        self.read_options = pa_csv.ReadOptions(column_names=self.schema.names)
+        # COPY ... (FORMAT csv): NULL = leeres Feld, leerer String = "" --> nur ungequotete leere Felder sind NULL; Booleans als t/f.
+        # Eigene null_values: Arrows Standardliste würde z.B. den String "NA" oder die Zahl NaN zu NULL machen.
+        self.convert_options = pa_csv.ConvertOptions(column_types=self.schema, null_values=[""], strings_can_be_null=True,
+                                                     quoted_strings_can_be_null=False, true_values=["t"], false_values=["f"])
+        self.parts, self.size, self.rows = [], 0, 0
+
+    def add(self, chunk: bytes) -> bool: # COPY-Paket übernehmen. True --> genug für einen Block, jetzt flush() aufrufen
+        self.parts.append(chunk)
+        self.size += len(chunk)
+        return self.size >= BLOCK_BYTES
+
+    def flush(self, final=False) -> bytes: # Vollständige Zeilen parsen und schreiben, Rest bleibt für den nächsten Block
+        data = b"".join(self.parts)
+        cut = len(data) if final else _record_end(data)
+        self.parts, self.size = [data[cut:]], len(data) - cut
+        if cut: self._write(pa_csv.read_csv(pa.BufferReader(data[:cut]), read_options=self.read_options, convert_options=self.convert_options))
+        return self.sink.drain()
+
+    def write_rows(self, rows) -> bytes: # Ohne COPY: Zeilen (Tupel) spaltenweise in Arrow-Arrays
+        columns = list(zip(*rows)) if rows else [[] for _ in self.schema]
+        self._write(pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, self.schema)], schema=self.schema))
+        return self.sink.drain()
+
+    def _write(self, table: pa.Table):
+        self.rows += table.num_rows
+        self.writer.write_table(table)
+
+    def close(self) -> bytes:
+        out = self.flush(final=True) if self.size else b""
+        self.writer.close() # Arrow: Ende-Markierung, Parquet: Footer mit Schema und Row-Group-Offsets
+        return out + self.sink.drain()
+
+def _copy_sql(stmt, dialect):
+    # COPY kennt keine Parameter --> Statement kompilieren (IN-Listen ausgeschrieben), Werte setzt der Treiber selbst korrekt ein.
+    compiled = stmt.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    return compiled, str(compiled)
+
+class _QueueWriter: # "Datei" für copy_expert: sammelt Pakete, gibt sie gebündelt in die Queue; bricht ab, wenn niemand mehr liest (Client weg)
+    def __init__(self, chunks, cancelled):
+        self.chunks, self.cancelled = chunks, cancelled
+        self.parts, self.size = [], 0
+    def write(self, data): # psycopg2 ruft write pro Zeile auf --> erst ab QUEUE_BYTES weiterreichen, nicht jede Zeile einzeln
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= QUEUE_BYTES: self.flush()
+    def flush(self):
+        data, self.parts, self.size = b"".join(self.parts), [], 0
+        while data:
+            try: return self.chunks.put(data, timeout=1)
+            except queue.Full:
+                if self.cancelled.is_set(): raise RuntimeError("Export abgebrochen")
+
+def stream_export(stmt, columns, fmt):
+    # Synchron (DB_ASYNC=0): copy_expert blockiert bis zum Ende --> läuft in einem eigenen Thread, der Generator liest die Queue.
+    encoder = BatchEncoder(columns, fmt)
+    if engine.dialect.name != "postgresql":
+        with engine.connect() as conn:
+            for rows in conn.execution_options(stream_results=True, yield_per=FALLBACK_BATCH).execute(stmt).partitions():
+                yield encoder.write_rows(rows)
+        yield encoder.close()
+        return
+    chunks, cancelled, done = queue.Queue(QUEUE_CHUNKS), threading.Event(), object()
+
+    def produce():
+        try:
+            raw = engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                compiled, sql = _copy_sql(stmt, engine.dialect)
+                query = cursor.mogrify(sql, compiled.params).decode()
+                writer = _QueueWriter(chunks, cancelled)
+                cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", writer)
+                writer.flush()
+                raw.rollback()
+            finally:
+                raw.close()
+            chunks.put(done)
+        except BaseException as e: # Fehler an den Generator weitergeben
+            if not cancelled.is_set(): chunks.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while (chunk := chunks.get()) is not done:
+            if isinstance(chunk, BaseException): raise chunk
+            if encoder.add(chunk): yield encoder.flush()
+        yield encoder.close()
+    finally:
+        cancelled.set()
+
+async def stream_export_async(stmt, columns, fmt):
+    # Asynchron (DB_ASYNC=1): asyncpg copy_from_query ruft für jedes Paket output auf --> asyncio.Queue.
+    # Das Parsen eines Blocks (einige ms CPU) läuft in einem Thread, damit der Event Loop andere Requests weiter bedient.
+    encoder = BatchEncoder(columns, fmt)
+    async with async_engine.connect() as conn:
+        if conn.dialect.name != "postgresql":
+            result = await conn.stream(stmt.execution_options(yield_per=FALLBACK_BATCH))
+            async for rows in result.partitions(FALLBACK_BATCH):
+                yield encoder.write_rows(rows)
+            yield encoder.close()
+            return
+        driver = (await conn.get_raw_connection()).driver_connection
+        compiled, sql = _copy_sql(stmt, conn.dialect)
+        chunks = asyncio.Queue(QUEUE_CHUNKS)
+
+        async def produce(): # Ende (None) bzw. Fehler über die Queue melden; bei Abbruch (Client weg) nichts mehr einreihen
+            try: await driver.copy_from_query(sql, *[compiled.params[k] for k in compiled.positiontup], output=chunks.put, format="csv")
+            except Exception as e: return await chunks.put(e)
+            await chunks.put(None)
+
+        task = asyncio.create_task(produce())
+        try:
+            while (chunk := await chunks.get()) is not None:
+                if isinstance(chunk, Exception): raise chunk
+                if encoder.add(chunk): yield await asyncio.to_thread(encoder.flush)
+            yield await asyncio.to_thread(encoder.close)
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
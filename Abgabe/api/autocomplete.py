@@ -0,0 +1,119 @@
+"""Autovervollständigung für Flughäfen, Airlines und Flugzeugmodelle.
+
+Die Eingabefelder im Dashboard sind Freitext --> man rät Codes ("NYC"? "JFK"?) und bekommt leere Suchen.
+GET /autocomplete liefert passende Werte schon beim Tippen, ganz ohne Datenbank:
+Beim Start (und nach jeder neuen Ingestion) werden die verschiedenen Werte einmal per GROUP BY gelesen und im Speicher abgelegt
+(PostgreSQL: aus den kleinen Dimensionstabellen airports/airlines/aircraft, siehe dimensions.py).
+
+Was macht der Code?:
+    - AutocompleteIndex.rebuild: liest Flughäfen (origin/destination + Namen), Airlines (airline_id + Name) und Modelle (model + Hersteller).
+    - Präfix-Suche: sortierte Listen der Codes und der Namen/Wörter im Namen (kleingeschrieben)
+      --> bisect findet den ersten Treffer in O(log n), danach werden nur so viele Einträge gelesen, wie zurückkommen.
+    - Teilstring-Suche (z.B. "kennedy" in "John F. Kennedy International"): alle Texte stehen in einem langen String,
+      str.find springt in C von Treffer zu Treffer, bisect über die Startpositionen ordnet den Treffer seinem Eintrag zu.
+    - Reihenfolge: Code beginnt mit q > Name/Wort beginnt mit q > irgendwo enthalten, jeweils alphabetisch (exakter Code zuerst).
+    - Je Art (airport/airline/aircraft) eigene Listen --> Filter auf eine Art kostet nichts.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from sqlalchemy import select, func, literal, union_all
+from models import Flight, Airport, Airline, Aircraft
+import dimensions
+
+KINDS = ("airport", "airline", "aircraft")
+SEPARATOR = "\x00" # Trennt die Texte im Suchstring, kommt in keinem Wert vor
+
+def _section(items: list, members: list):
+    # Suchstrukturen über einen Teil der Einträge (eine Art oder alle):
+    # (Codes sortiert, Eintrag je Code, Namen/Wörter sortiert, Eintrag je Name/Wort, Suchstring, Startpositionen, Einträge)
+    codes = sorted((items[i]["value"].lower(), i) for i in members)
+    words = set()
+    for i in members:
+        if items[i]["label"]:
+            label = items[i]["label"].lower()
+            words.add((label, i))
+            words.update((w, i) for w in label.split()) # Jedes Wort ist ein eigener Präfix-Schlüssel ("kennedy" --> John F. Kennedy ...)
+    words = sorted(words)
+    texts = [f"{items[i]['value']} {items[i]['label'] or ''}".lower() for i in members] # Pro Eintrag ein Text "wert label"
+    starts, position = [], 0
+    for text in texts:
+        starts.append(position)
+        position += len(text) + 1
+    return [k for k, _ in codes], [i for _, i in codes], [k for k, _ in words], [i for _, i in words], SEPARATOR.join(texts), starts, members
+
+def _build(entries: dict):
+    # entries: (art, wert) --> label. Ein Abschnitt pro Art und einer über alles (kind=None) --> der Art-Filter kostet beim Suchen nichts.
+    items = [{"kind": kind, "value": value, "label": label} for (kind, value), label in sorted(entries.items())]
+    sections = {kind: _section(items, [i for i, item in enumerate(items) if item["kind"] == kind]) for kind in KINDS}
+    sections[None] = _section(items, list(range(len(items))))
+    return items, sections
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._state = _build({}) # Ein Tupel, wird als Ganzes ausgetauscht --> Suchen lesen immer einen konsistenten Stand
+        self.generation = None # Cache-Generation, zu der der Index gebaut wurde
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def rebuild(self, db, generation=None):
+        # db: normale (synchrone) Session oder Connection --> in main.py über db.run_sync.
+        sources = [
+            ("airport", Flight.origin, Flight.name_origin),
+            ("airport", Flight.destination, Flight.name_destination),
+            ("airline", Flight.airline_id, Flight.airline),
+            ("aircraft", Flight.model, Flight.manufacturer),
+        ] if not dimensions.enabled(db) else [ # Dimensionstabellen: jeder Wert steht schon (fast) nur einmal da
+            ("airport", Airport.code, Airport.name),
+            ("airline", Airline.airline_id, Airline.name),
+            ("aircraft", Aircraft.model, Aircraft.manufacturer),
+        ]
+        queries = [select(literal(kind).label("kind"), value.label("value"), func.max(label).label("label"))
+                   .where(value.isnot(None)).group_by(value) for kind, value, label in sources]
+        entries = {}
+        for kind, value, label in db.execute(union_all(*queries)):
+            if value and not entries.get((kind, value)): entries[(kind, value)] = label # Origin ohne Namen, Destination mit --> Name gewinnt
+        state = _build(entries)
+        with self._lock:
+            self._state, self.generation = state, generation
+            self.rebuilds += 1
+
+    def add_flights(self, flights: list):
+        # Werte neu angelegter Flüge sofort aufnehmen (Neuaufbau im Speicher, ohne Datenbank). Nur wenn wirklich etwas Neues dabei ist.
+        with self._lock:
+            entries = {(item["kind"], item["value"]): item["label"] for item in self._state[0]}
+            before = len(entries)
+            for f in flights:
+                for kind, value, label in (("airport", f.get("origin"), f.get("name_origin")), ("airport", f.get("destination"), f.get("name_destination")),
+                                           ("airline", f.get("airline_id"), f.get("airline")), ("aircraft", f.get("model"), f.get("manufacturer"))):
+                    if value and (kind, value) not in entries: entries[(kind, value)] = label
+            if len(entries) != before: self._state = _build(entries)
+
+    def search(self, q: str, kind=None, limit: int = 10) -> list:
+        items, sections = self._state
+        codes, code_items, words, word_items, haystack, starts, members = sections[kind]
+        q = q.strip().lower().replace(SEPARATOR, "")
+        if not q: return []
+        out, seen = [], set()
+        # 1. Code beginnt mit q, 2. Name/Wort beginnt mit q: bisect auf den Anfang, dann der Reihe nach (alphabetisch) bis limit voll ist
+        for keys, key_items in ((codes, code_items), (words, word_items)):
+            for pos in range(bisect_left(keys, q), len(keys)):
+                if len(out) >= limit or not keys[pos].startswith(q): break
+                i = key_items[pos]
+                if i not in seen:
+                    seen.add(i)
+                    out.append(i)
+        # 3. q irgendwo enthalten: str.find springt in C von Treffer zu Treffer, bisect über die Startpositionen liefert den Eintrag
+        pos = haystack.find(q) if len(out) < limit else -1
+        while pos != -1 and len(out) < limit:
+            n = bisect_right(starts, pos) - 1
+            if members[n] not in seen:
+                seen.add(members[n])
+                out.append(members[n])
+            pos = haystack.find(q, starts[n + 1]) if n + 1 < len(starts) else -1 # Rest dieses Eintrags überspringen
+        return [items[i] for i in out]
+
+    def stats(self) -> dict:
+        items, sections = self._state
+        return {"entries": len(items), "rebuilds": self.rebuilds, **{kind: len(sections[kind][6]) for kind in KINDS}}
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,250 @@
+"""Read-Through-Cache für Flug-Abfragen.
+
+GET /flights/{flight_id} und POST /flights/search fragen sonst bei jedem Aufruf PostgreSQL ab,
+obwohl sich die Daten nur durch add_flight, delete_flight und eine neue Ingestion ändern.
+Gespeichert wird der fertig kodierte JSON-Body --> ein Treffer kostet weder Datenbank noch Serialisierung.
+
+Was macht der Code?:
+    - LRUCache: Cache im Prozess, begrenzt durch Anzahl Einträge, Gesamtgröße (Bytes) und TTL. Zählt Hits, Misses und Evictions.
+    - SharedCacheBackend: Schnittstelle für einen gemeinsamen Cache mehrerer API-Prozesse (z.B. Redis).
+      InMemorySharedBackend ist der Platzhalter dafür (gleiches Verhalten, liegt aber im Prozess).
+    - FlightCache: Schlüssel für Flug-IDs und normalisierte Suchanfragen, Invalidierung nach Schreibzugriffen
+      und komplettes Leeren, wenn sich die Ingestion-Generation (Tabelle ingest_state) ändert.
+    - epoch: zählt jede Invalidierung/Leerung hoch. Wer vor einer Abfrage epoch merkt und danach einen anderen Wert sieht,
+      weiß, dass sich dazwischen Daten geändert haben (Cache-Eintrag nicht schreiben, laufende Suche nicht teilen, siehe coalesce.py).
+    - ETags: flight_etag aus der Version des Flugs (flight_versions, +1 bei add/delete) und der Ingestion-Generation,
+      search_etag aus epoch (jede Änderung der Tabelle) und dem Suchschlüssel. Beides steht im Speicher --> main.py kann
+      If-None-Match ohne Datenbank und ohne Kodierung mit 304 beantworten. Mit INSTANCE (zufällig pro Prozess) im ETag:
+      die Zähler gelten nur in diesem Prozess, ein ETag aus einem anderen Prozess oder vor einem Neustart passt nie.
+    - Mehrere API-Prozesse (uvicorn --workers, mehrere Container): add/delete zählen in derselben Transaktion einen Schreibzähler
+      in ingest_state hoch (bump_writes, Zeile WRITES_SOURCE). Sieht ein Prozess bei seiner Prüfung (alle GENERATION_CHECK_SECONDS)
+      einen Stand, den nicht er selbst geschrieben hat, leert er den Cache und ändert alle ETags --> höchstens so lange ein veraltetes 304.
+
+Jeder Eintrag hat ein "Tag", das beschreibt, wovon er abhängt:
+    ("flight", flight_id)       --> Einzelabfrage eines Flugs
+    ("search", {spalte: wert})  --> Suche mit diesen Filtern
+Beim Hinzufügen/Löschen eines Flugs werden genau die Einträge entfernt, deren Tag zu diesem Flug passt.
+"""
+import os
+import time
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional
+import orjson
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import IngestState
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local") # local = LRU im Prozess, shared = gemeinsamer Cache, off = kein Cache
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024))) # 64 MB
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+GENERATION_CHECK_SECONDS = float(os.getenv("CACHE_GENERATION_CHECK_SECONDS", "5")) # So oft wird ingest_state auf eine neue Ingestion geprüft.
+FLIGHT_VERSION_SLOTS = 65536 # Versionen pro Flug als feste Tabelle (Hash der flight_id) --> Speicher bleibt gleich, auch nach großen Bulks.
+INSTANCE = os.urandom(4).hex() # Kennung dieses Prozesses im ETag
+WRITES_SOURCE = "api_writes" # Zeile in ingest_state (keine Quelldatei): Schreibzähler aller API-Prozesse
+
+class CacheBackend(ABC): # Gemeinsame Schnittstelle aller Cache-Speicher (fehlt eine Methode, schlägt schon das Anlegen fehl).
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: ...
+    @abstractmethod
+    def set(self, key: str, value: bytes, tag) -> None: ...
+    @abstractmethod
+    def invalidate(self, match: Callable[[tuple], bool]) -> int: ... # Entfernt alle Einträge, deren Tag passt.
+    @abstractmethod
+    def clear(self) -> None: ...
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+class LRUCache(CacheBackend):
+    # Least Recently Used: bei vollem Cache fliegt der Eintrag raus, der am längsten nicht gelesen wurde.
+    # Thread-sicher (Lock): get/set/invalidate laufen in der Event-Loop, refresh_generation (clear) aber über db.run_sync,
+    # mit DB_ASYNC=0 also in einem Thread des Threadpools, gleichzeitig zu den Requests.
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries, self.max_bytes, self.ttl = max_entries, max_bytes, ttl
+        self._data = OrderedDict() # key --> (value, tag, ablaufzeit)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < time.monotonic(): # abgelaufen
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key) # zuletzt benutzt --> ans Ende
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tag):
+        if len(value) > self.max_bytes: return # passt gar nicht rein
+        with self._lock:
+            if key in self._data: self._remove(key)
+            self._data[key] = (value, tag, time.monotonic() + self.ttl)
+            self._bytes += len(value)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes: # älteste Einträge verdrängen
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, match):
+        with self._lock:
+            keys = [k for k, (_, tag, _) in self._data.items() if match(tag)]
+            for k in keys: self._remove(k)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "bytes": self._bytes, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations, "invalidations": self.invalidations}
+
+    def _remove(self, key):
+        value, _, _ = self._data.pop(key)
+        self._bytes -= len(value)
+
+class SharedCacheBackend(CacheBackend):
+    # Schnittstelle für einen Cache, den sich mehrere API-Prozesse/Container teilen (z.B. Redis).
+    # Eine echte Implementierung würde die Tags als Sets im Store ablegen, damit invalidate() ohne Scan auskommt.
+    pass
+
+class InMemorySharedBackend(LRUCache, SharedCacheBackend):
+    # Platzhalter für einen gemeinsamen Cache: verhält sich wie der spätere Shared-Store, liegt aber im Prozess.
+    # So kann man den shared-Pfad lokal und in Tests benutzen, ohne zusätzlichen Dienst.
+    pass
+
+class NoCache(CacheBackend): # CACHE_BACKEND=off --> jeder Zugriff geht an die Datenbank.
+    def get(self, key): return None
+    def set(self, key, value, tag): pass
+    def invalidate(self, match): return 0
+    def clear(self): pass
+    def stats(self): return {}
+
+def make_backend(kind=CACHE_BACKEND) -> CacheBackend:
+    if kind == "off": return NoCache()
+    if kind == "shared": return InMemorySharedBackend()
+    return LRUCache()
+
+SEARCH_FILTER_COLUMNS = {"airline": "airline_id", "origin": "origin", "destination": "destination", "weekday": "weekday"} # FlightSearch-Feld --> Spalte
+
+class FlightCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.generation = None # Zuletzt gesehener Stand von ingest_state
+        self.generation_checked = 0.0
+        self.generation_flushes = 0
+        self.writes = None # Zuletzt bekannter Stand des Schreibzählers (ingest_state, WRITES_SOURCE)
+        self.write_flushes = 0 # Geleert, weil ein anderer Prozess Flüge geändert hat
+        self.epoch = 0 # +1 bei jeder Änderung der Daten, die der API bekannt wird
+        # Version pro Flug: zwei Flüge im selben Slot ändern gegenseitig ihr ETag (nur ein unnötiges 200, nie ein falsches 304).
+        self.flight_versions = [0] * FLIGHT_VERSION_SLOTS
+        self._lock = threading.Lock()
+
+    # Schlüssel
+    @staticmethod
+    def flight_key(flight_id: str, fields: Optional[str]) -> str:
+        return f"flight:{flight_id}:{fields or ''}"
+
+    @staticmethod
+    def search_key(payload: dict, **params) -> str:
+        # Normalisiert: leere Filter weglassen, Schlüssel sortieren --> gleiche Suche = gleicher Schlüssel, egal in welcher Reihenfolge.
+        normalized = {k: v for k, v in {**payload, **params}.items() if v not in (None, "", [])}
+        return "search:" + orjson.dumps(normalized, option=orjson.OPT_SORT_KEYS).decode()
+
+    @staticmethod
+    def etag(*parts) -> str: # Starkes ETag (in Anführungszeichen): gleiche Teile = gleiche Bytes der Antwort
+        return '"' + hashlib.blake2b("|".join(map(str, (INSTANCE, *parts))).encode(), digest_size=12).hexdigest() + '"'
+
+    def flight_etag(self, flight_id: str, fields: Optional[str]) -> str:
+        return self.etag("flight", self.generation_flushes, self.write_flushes, self.flight_versions[hash(flight_id) % FLIGHT_VERSION_SLOTS], flight_id, fields or "")
+
+    def search_etag(self, key: str) -> str: # key: search_key (Suche + Seite + Felder bzw. Format)
+        return self.etag("search", self.epoch, key)
+
+    @staticmethod
+    def search_tag(payload: dict):
+        return ("search", {col: payload[f] for f, col in SEARCH_FILTER_COLUMNS.items() if payload.get(f)})
+
+    # Lesen/Schreiben
+    def get(self, key): return self.backend.get(key)
+    def set(self, key, body: bytes, tag): self.backend.set(key, body, tag)
+
+    def invalidate_flights(self, flights: list) -> int:
+        # Nach add/delete (auch Bulk): Einzelabfragen dieser Flüge und alle Suchen, deren Filter auf mindestens einen davon passen.
+        if not flights: return 0
+        self.epoch += 1
+        ids = {values.get("flight_id") for values in flights}
+        for flight_id in ids: self.flight_versions[hash(flight_id) % FLIGHT_VERSION_SLOTS] += 1
+        projections = {} # Filterspalten --> Werte-Tupel aller Flüge. Einmal pro Spaltenkombination statt pro Cache-Eintrag und Flug.
+        def affected(tag):
+            kind, data = tag
+            if kind == "flight": return data in ids
+            cols = tuple(sorted(data))
+            if cols not in projections: projections[cols] = {tuple(values.get(c) for c in cols) for values in flights}
+            return tuple(data[c] for c in cols) in projections[cols]
+        return self.backend.invalidate(affected)
+
+    def invalidate_flight(self, values: dict) -> int: return self.invalidate_flights([values])
+
+    def generation_due(self) -> bool:
+        # Geprüft wird höchstens alle GENERATION_CHECK_SECONDS, damit nicht jeder Treffer doch wieder die DB fragt.
+        now = time.monotonic()
+        if now - self.generation_checked < GENERATION_CHECK_SECONDS: return False
+        with self._lock:
+            if now - self.generation_checked < GENERATION_CHECK_SECONDS: return False
+            self.generation_checked = now
+            return True
+
+    def refresh_generation(self, db):
+        # Eine neue Ingestion ändert ingest_state --> alles im Cache kann veraltet sein --> komplett leeren.
+        # db ist eine normale (synchrone) Session; main.py ruft das über db.run_sync(...) auf, wenn generation_due() True ist.
+        rows = db.execute(select(IngestState.source, IngestState.generation, IngestState.loaded_at).order_by(IngestState.source)).all()
+        current = tuple(r for r in rows if r.source != WRITES_SOURCE) # Der Schreibzähler baut keine Speicher-Indizes neu (generation)
+        writes = next((r.generation for r in rows if r.source == WRITES_SOURCE), 0)
+        with self._lock:
+            if current != self.generation:
+                if self.generation is not None:
+                    self.epoch += 1
+                    self.backend.clear()
+                    self.generation_flushes += 1
+                self.generation = current
+            elif self.writes is not None and writes != self.writes: # Ein anderer Prozess hat Flüge geändert, welche, wissen wir nicht
+                self.epoch += 1
+                self.backend.clear()
+                self.write_flushes += 1
+            self.writes = writes
+
+    @staticmethod
+    def bump_writes(db) -> int:
+        # In der Transaktion von add/delete/bulk, direkt vor dem Commit (db.run_sync): Schreibzähler +1, gibt den neuen Stand zurück.
+        # Die Zeilensperre hält nur bis zum Commit; Schreibzugriffe aller Prozesse bekommen so fortlaufende Nummern.
+        table = IngestState.__table__
+        ins = (pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert)(table).values(source=WRITES_SOURCE, generation=1)
+        return db.execute(ins.on_conflict_do_update(index_elements=[table.c.source], set_={"generation": table.c.generation + 1})
+                          .returning(table.c.generation)).scalar()
+
+    def wrote(self, writes: int):
+        # Nach dem Commit mit dem Wert von bump_writes. Direkt auf den bekannten Stand folgend --> nur dieser Prozess hat seitdem
+        # geschrieben, invalidate_flights hat das schon erledigt. Sonst bleibt der alte Stand und die nächste Prüfung leert den Cache.
+        with self._lock:
+            if self.writes is not None and writes == self.writes + 1: self.writes = writes
+
+    def stats(self):
+        return {"backend": type(self.backend).__name__, "generation_flushes": self.generation_flushes, "write_flushes": self.write_flushes,
+                **self.backend.stats()}
+
+flight_cache = FlightCache(make_backend())
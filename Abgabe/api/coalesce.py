@@ -0,0 +1,83 @@
+"""Zusammenfassen gleicher, gleichzeitiger Suchen (Single-Flight).
+
+Zur Spitzenzeit schicken viele Dashboards innerhalb derselben Sekunde dieselbe Suche (gleiche Airline/Route/Wochentag).
+Der Cache (cache.py) hilft erst, wenn die erste Antwort fertig ist: bis dahin läuft jede dieser Anfragen ihre eigene Abfrage
+und ihre eigene JSON-Kodierung --> N-mal dieselbe Arbeit, N Verbindungen aus dem Pool.
+
+Was macht der Code?:
+    - SingleFlight.run(key, fetch, version): die erste Anfrage zu einem Schlüssel führt fetch aus ("Leader"), alle weiteren mit
+      gleichem Schlüssel warten auf genau dieses Ergebnis (gleicher fertiger JSON-Body, keine eigene Abfrage).
+    - Kurzes Fenster: ein fertiges Ergebnis bleibt COALESCE_WINDOW_SECONDS im Speicher, auch wenn der Cache es nicht nimmt
+      (CACHE_BACKEND=off/shared, Body größer als CACHE_MAX_BYTES) --> Nachzügler eines Schwungs bekommen es ohne Datenbank.
+    - version: Stand der Daten (flight_cache.epoch). Nach einem Schreibzugriff schließt sich niemand mehr einer älteren Abfrage
+      an und das Fenster gilt nicht mehr --> man sieht nie weniger aktuelle Daten als ohne Zusammenfassen.
+    - Bricht der Leader ab (Client weg), führt der nächste Wartende die Abfrage selbst aus. Fehler (z.B. Datenbank) bekommen alle Wartenden.
+    - stats: leaders (echte Abfragen), coalesced (an laufende angehängt), window_hits, failures --> GET /cache/stats und GET /metrics.
+Gilt pro API-Prozess (eine Event-Loop, daher ohne Lock).
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "1")) # 0 = nur gleichzeitige Anfragen zusammenfassen
+COALESCE_WINDOW_ENTRIES = int(os.getenv("COALESCE_WINDOW_ENTRIES", "256"))
+
+class SingleFlight:
+    def __init__(self, window=COALESCE_WINDOW_SECONDS, max_entries=COALESCE_WINDOW_ENTRIES):
+        self.window, self.max_entries = window, max_entries
+        self._flights = {} # Schlüssel --> (version, Future des Leaders)
+        self._recent = OrderedDict() # Schlüssel --> (version, gültig bis, Ergebnis); Reihenfolge = Ablaufzeit (festes Fenster)
+        self.leaders = self.coalesced = self.window_hits = self.failures = 0
+
+    async def run(self, key, fetch, version=None):
+        loop = asyncio.get_running_loop()
+        while True:
+            recent = self._recent.get(key)
+            if recent and recent[0] == version and recent[1] > time.monotonic():
+                self.window_hits += 1
+                return recent[2]
+            flight = self._flights.get(key)
+            if flight is None or flight[0] != version or flight[1].get_loop() is not loop: # Ältere Daten oder andere Loop (Tests) --> selbst
+                return await self._lead(key, fetch, version, loop)
+            try:
+                result = await asyncio.shield(flight[1]) # shield: bricht dieser Request ab, läuft die Abfrage für die anderen weiter
+            except asyncio.CancelledError:
+                if flight[1].cancelled(): continue # Leader abgebrochen --> neu versuchen (dieser Request wird ggf. selbst Leader)
+                raise
+            self.coalesced += 1
+            return result
+
+    async def _lead(self, key, fetch, version, loop):
+        future = loop.create_future()
+        self._flights[key] = (version, future)
+        self.leaders += 1
+        try:
+            result = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            self.failures += 1
+            future.set_exception(exc)
+            future.exception() # als abgeholt markieren (sonst Warnung, wenn niemand gewartet hat)
+            raise
+        finally:
+            if self._flights.get(key, (None, None))[1] is future: del self._flights[key]
+        future.set_result(result)
+        self._remember(key, version, result)
+        return result
+
+    def _remember(self, key, version, result):
+        if self.window <= 0: return
+        now = time.monotonic()
+        self._recent.pop(key, None)
+        self._recent[key] = (version, now + self.window, result)
+        while self._recent and (len(self._recent) > self.max_entries or next(iter(self._recent.values()))[1] <= now): # Abgelaufene vorne
+            self._recent.popitem(last=False)
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "window_hits": self.window_hits, "failures": self.failures,
+                "in_flight": len(self._flights), "window_entries": len(self._recent)}
+
+search_flight = SingleFlight()
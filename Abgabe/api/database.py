@@ -6,12 +6,27 @@ Was macht der Code?:
     - engine: Stellt die eigentliche Datenbankverbindung her.
     - SessionLocal: Für die Erstellung von Datenbank-Sessions, die für CRUD-Operationen
                     (Create, Read, Update, Delete) in den FastAPI-Endpunkten benötigt werden.
+    - async_engine / AsyncSessionLocal: Dasselbe asynchron (asyncpg). Die Endpunkte warten dann auf PostgreSQL,
+                    ohne einen Thread aus dem Threadpool zu blockieren. Umschaltbar über DB_ASYNC (fehlt der Treiber, synchron).
+    - Pool: Größe, Overflow, Recycle, Pre-Ping und Timeout über DB_POOL_* einstellbar. PoolMetrics zählt pro Engine
+            Checkouts, Wartezeit beim Checkout, belegte Verbindungen, Overflow-Treffer, Timeouts und Invalidierungen (GET /pool/stats).
+    - get_db: Dependency für die Endpunkte. Liefert je nach DB_ASYNC eine AsyncSession oder eine
+              normale Session in einer Hülle mit derselben (await-baren) Schnittstelle.
+    - instrument: before/after_cursor_execute an beiden Engines --> Dauer und Zeilen jeder Abfrage an metrics.py (GET /metrics, Slow-Query-Log).
     - Base: Die deklarative Basisklasse, von der alle Datenmodelle (in models.py) erben.
 """
 import os # brauch man für die .env
 from dotenv import load_dotenv  # .env-Unterstützung für lokale Entwicklung
-from sqlalchemy import create_engine # zum erstellen der engine
+import time
+import threading
+import importlib.util # Ist der asynchrone Treiber installiert?
+from sqlalchemy import create_engine, event, make_url # zum erstellen der engine; event für die Pool-Zähler; make_url zerlegt DATABASE_URL
+from sqlalchemy.exc import TimeoutError as PoolTimeout # Kein freier Platz im Pool innerhalb von pool_timeout
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base # Importiert Klassen zur Session-Erstellung und Modell-Basis.
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker # Asynchrone Variante von engine und SessionLocal.
+from starlette.concurrency import run_in_threadpool # Führt blockierende Funktionen im Threadpool aus (synchroner Modus).
+import metrics # Dauer und Zeilen jeder Abfrage, Slow-Query-Log (before/after_cursor_execute)
 
 # .env-Datei laden (in Docker übernimmt Compose das automatisch)
 load_dotenv()
@@ -24,12 +39,127 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 # PostgreSQL-Verbindungsstring, wie in Docker-Compose. 
 # Innerhalb des Docker-Netzwerks muss der Service-Name des Datenbank-Containers als Hostname verwendet werden --> "db"
 # Durch den f-String werden Benutzername und Passwort aus der .env eingesetzt.
-DATABASE_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/flights"  
+DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/flights")
 # Wer will zugreifen? --> //{POSTGRES_USER}:{POSTGRES_PASSWORD} + Welche Datenbank? --> @db:5432/flights
+# Docker Compose setzt DATABASE_URL für die API ohnehin, lokal kann man so auch z.B. sqlite:///test.db nutzen.
+
+# Asynchron (Standard) oder synchron? DB_ASYNC=0 schaltet auf den alten, synchronen Weg zurück.
+DB_ASYNC = os.getenv("DB_ASYNC", "1") == "1"
+# Gleiche Datenbank, aber mit asynchronem Treiber: postgresql:// bzw. postgresql+psycopg2:// --> asyncpg, sqlite --> aiosqlite
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"} # Datenbank --> asynchroner Treiber (gleichnamiges Python-Paket)
+_url = make_url(DATABASE_URL)
+ASYNC_DRIVER = ASYNC_DRIVERS.get(_url.get_backend_name())
+ASYNC_DATABASE_URL = _url.set(drivername=f"{_url.get_backend_name()}+{ASYNC_DRIVER}").render_as_string(hide_password=False) if ASYNC_DRIVER else DATABASE_URL
+if DB_ASYNC and (ASYNC_DRIVER is None or importlib.util.find_spec(ASYNC_DRIVER) is None):
+    # Kein asynchroner Treiber da (z.B. aiosqlite für lokale Tests nicht installiert) --> synchroner Weg statt Absturz beim Start
+    print(f"DB_ASYNC: asynchroner Treiber {ASYNC_DRIVER or '(keiner bekannt)'} für {_url.get_backend_name()} fehlt --> synchron (wie DB_ASYNC=0)")
+    DB_ASYNC = False
+
+# Connection-Pool
+# Jede Engine hält einen Pool offener Verbindungen. Standardwerte von SQLAlchemy: 5 + 10 Overflow, ohne Recycle/Pre-Ping.
+# Über die Umgebung einstellbar, damit man den Pool an die echte Last anpassen kann (Zahlen dazu: GET /pool/stats).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))             # Dauerhaft offene Verbindungen
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))      # Zusätzliche Verbindungen bei Lastspitzen (werden danach wieder geschlossen)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))    # Sekunden, die ein Request auf eine freie Verbindung wartet --> danach Fehler
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # Verbindungen nach x Sekunden erneuern (-1 = nie), gegen von PostgreSQL/Firewall getrennte Verbindungen
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"   # Vor jeder Ausgabe kurz prüfen, ob die Verbindung noch lebt
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0) # Obergrenzen (Sekunden) für das Histogramm der Checkout-Wartezeit
+
+class PoolMetrics:
+    # Zähler eines Pools. Wird über Pool-Events und TimedPool._do_get gefüllt, ausgegeben über stats().
+    def __init__(self, name):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = self.checkins = self.connects = 0
+        self.overflow_hits = 0  # Checkouts, nach denen mehr als DB_POOL_SIZE Verbindungen belegt sind (Pool läuft im Overflow)
+        self.timeouts = 0       # Kein Platz im Pool innerhalb von DB_POOL_TIMEOUT
+        self.invalidations = 0  # Verbindungen, die verworfen wurden (Pre-Ping fehlgeschlagen, Verbindungsfehler, ...)
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1) # letzter Eintrag: länger als WAIT_BUCKETS[-1]
+
+    def observe_wait(self, seconds):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self.wait_buckets[next((i for i, b in enumerate(WAIT_BUCKETS) if seconds <= b), len(WAIT_BUCKETS))] += 1
+
+    def count(self, name):
+        with self._lock: setattr(self, name, getattr(self, name) + 1)
+
+    def attach(self, pool):
+        # Events hängen am Pool-Objekt; engine.dispose() erzeugt zwar einen neuen Pool, übernimmt aber die Listener.
+        self.pool = pool
+        event.listen(pool, "connect", lambda *a: self.count("connects"))
+        event.listen(pool, "checkout", lambda *a: self.count("checkouts"))
+        event.listen(pool, "checkin", lambda *a: self.count("checkins"))
+        event.listen(pool, "invalidate", lambda *a: self.count("invalidations"))
+        event.listen(pool, "soft_invalidate", lambda *a: self.count("invalidations"))
+
+    def stats(self):
+        pool = self.pool
+        with self._lock:
+            return {
+                "pool_size": pool.size(), "max_overflow": pool._max_overflow,
+                "in_use": pool.checkedout(), "idle": pool.checkedin(), "overflow": max(pool.overflow(), 0),
+                "checkouts": self.checkouts, "checkins": self.checkins, "connects": self.connects,
+                "overflow_hits": self.overflow_hits, "timeouts": self.timeouts, "invalidations": self.invalidations,
+                "wait_count": self.wait_count, "wait_sum_seconds": self.wait_sum, "wait_max_seconds": self.wait_max,
+                "wait_avg_seconds": self.wait_sum / self.wait_count if self.wait_count else None,
+                "wait_buckets": {**{str(b): n for b, n in zip(WAIT_BUCKETS, self.wait_buckets)}, "+Inf": self.wait_buckets[-1]}, # nicht kumulativ
+            }
+
+class TimedPool:
+    # Mixin für QueuePool: misst, wie lange ein Checkout auf eine Verbindung wartet (inkl. Verbindungsaufbau).
+    # Das Checkout-Event kommt erst, wenn die Verbindung schon da ist --> die Wartezeit sieht man nur hier.
+    metrics: PoolMetrics
+    def _do_get(self):
+        self.metrics.pool = self # nach engine.dispose() zeigt stats() so auf den neuen Pool
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeout:
+            self.metrics.count("timeouts")
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - start)
+        if self.checkedout() > self.size(): self.metrics.count("overflow_hits")
+        return conn
+
+class TimedQueuePool(TimedPool, QueuePool): metrics = PoolMetrics("sync")
+class TimedAsyncPool(TimedPool, AsyncAdaptedQueuePool): metrics = PoolMetrics("async")
+
+def pool_options(url, poolclass):
+    # SQLite (lokale Tests) hat eigene Pool-Klassen ohne diese Einstellungen --> dort bleibt alles beim Standard.
+    if url.startswith("sqlite"): return {}
+    return {"poolclass": poolclass, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE, "pool_pre_ping": DB_POOL_PRE_PING}
+
+def pool_stats(): # Für GET /pool/stats: Zähler aller Pools, die tatsächlich benutzt werden
+    return {m.name: m.stats() for m in (TimedQueuePool.metrics, TimedAsyncPool.metrics) if m.pool is not None}
 
 # Engine erstellen.
 # Stellt die Verbindung her.
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL, TimedQueuePool))
+if isinstance(engine.pool, TimedQueuePool): TimedQueuePool.metrics.attach(engine.pool)
+
+# Zeitmessung pro Abfrage (metrics.py): Start vor cursor.execute am Execution-Context merken, danach Dauer + Zeilen melden.
+# Gilt für beide Engines (die asynchrone feuert die Events über ihre sync_engine). Schlägt eine Abfrage fehl, kommt kein after-Event.
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics.record_query(statement, parameters, time.perf_counter() - context.query_start, cursor.rowcount) # rowcount: -1, wenn unbekannt (serverseitiger Cursor)
+
+def instrument(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+instrument(engine)
 
 # SessionFactory für DB-Zugriffe
 SessionLocal = sessionmaker(autocommit=False, bind=engine)
@@ -37,6 +167,34 @@ SessionLocal = sessionmaker(autocommit=False, bind=engine)
 # auf Abruf werden neue, isolierte Datenbank-Sitzungen (Sessions) erstellt --> Nur in einer Session können anwender etwas an der Datenbank ändern oder abfragen
 # autocommit=False: Operationen (INSERT, UPDATE, DELETE) werden nicht automatisch gespeichert — nur bei db.commit(). Das wird in main.py genutzt :) 
 
+# Asynchrone Engine + SessionFactory (nur wenn DB_ASYNC aktiv ist, sonst wird asyncpg gar nicht gebraucht)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL, TimedAsyncPool)) if DB_ASYNC else None
+if DB_ASYNC and isinstance(async_engine.sync_engine.pool, TimedAsyncPool): TimedAsyncPool.metrics.attach(async_engine.sync_engine.pool)
+if DB_ASYNC: instrument(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False) if DB_ASYNC else None
+# expire_on_commit=False: Objekte bleiben nach dem Commit lesbar, ohne dass sie (asynchron) neu geladen werden müssen.
+
+class SyncSession:
+    # Hülle um eine normale Session mit derselben Schnittstelle wie AsyncSession (execute, get, commit, ... mit await).
+    # Jeder Datenbankzugriff läuft im Threadpool --> die Endpunkte können in beiden Modi gleich geschrieben werden.
+    def __init__(self, session):
+        self.sync_session = session
+    async def execute(self, *args, **kwargs): return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+    async def get(self, *args, **kwargs): return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+    async def delete(self, obj): self.sync_session.delete(obj) # löscht erst beim commit()
+    async def commit(self): await run_in_threadpool(self.sync_session.commit)
+    async def rollback(self): await run_in_threadpool(self.sync_session.rollback)
+    async def refresh(self, obj): await run_in_threadpool(self.sync_session.refresh, obj)
+    async def run_sync(self, fn, *args, **kwargs): return await run_in_threadpool(fn, self.sync_session, *args, **kwargs) # wie AsyncSession.run_sync
+    async def close(self): await run_in_threadpool(self.sync_session.close)
+    def add(self, obj): self.sync_session.add(obj)
+    def get_bind(self): return self.sync_session.get_bind()
+
+async def get_db(): # Dependency für die Endpunkte: eine Session pro Request, wird am Ende geschlossen.
+    db = AsyncSessionLocal() if DB_ASYNC else SyncSession(SessionLocal())
+    try: yield db
+    finally: await db.close()
+
 # Base-Klasse für Modelle
 Base = declarative_base()
 # schafft eine Basisklasse, von der alle Ihre Datenmodelle erben. Ist in models erklärt! :)
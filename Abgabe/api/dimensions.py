@@ -0,0 +1,273 @@
+"""Normalisierte Speicherung der Flüge: Faktentabelle + Dimensionstabellen (nur PostgreSQL).
+
+In der breiten flights-Tabelle wiederholt jede Zeile Flughafen-Namen, Koordinaten, Airline-Name, Hersteller, Modell, Baujahr,
+Triebwerke, Sitze und max_weight_pounds. Das bläht Tabelle, Indizes und den Buffer-Cache auf. Stattdessen:
+    - airports, airlines, aircraft: jede verschiedene Wertekombination genau einmal, mit Integer-Surrogat-Schlüssel.
+    - flight_facts: pro Flug nur die eigenen Werte (Zeiten, Verspätungen, ...) und vier Integer-Schlüssel.
+    - View flights: setzt beides per LEFT JOIN wieder zusammen, mit exakt den Spalten von Flight (models.py).
+      Die API (FlightBase), die Rollups, die Suche usw. lesen weiterhin "flights" und merken keinen Unterschied.
+      Filter wie origin = 'JFK' gehen erst an die winzige airports-Tabelle, dann über idx_facts_origin_key an die Fakten.
+    - INSTEAD OF-Trigger auf der View: INSERT (add_flight, Bulk) legt fehlende Dimensionszeilen an und schreibt den Fakt,
+      DELETE löscht den Fakt. Dimensionszeilen bleiben stehen (klein, werden beim kompletten Neuladen geleert).
+
+Was macht der Code?:
+    - ensure_schema: legt alles an bzw. übernimmt eine bestehende breite flights-Tabelle einmalig (API-Start, ingest.py).
+    - insert_from: mengenbasiertes Laden aus einer Tabelle mit den Flight-Spalten (Staging von ingest.py), ohne Trigger pro Zeile.
+    - wide_select: SELECT mit den Flight-Spalten über eine Faktentabelle (View, abgehängte Partitionen in partitions.py).
+    - report: Größe auf der Platte und Scan-Zeiten breit (vorher) gegen normalisiert (nachher).
+
+Aufruf als Skript (im api-Ordner):  python dimensions.py report [--repeat 5]
+"""
+import sys
+import argparse
+import statistics
+from sqlalchemy import select, insert, delete, union, and_, or_, func, text, Table, MetaData, Column
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import Flight, FlightFact, Airport, Airline, Aircraft
+import partitions
+
+VIEW = Flight.__tablename__ # "flights"
+FACT = FlightFact.__table__
+
+# Dimensionen: (Alias in der View, Modell, Schlüssel in flight_facts, {Spalte der Dimension: Spalte von Flight})
+DIMENSIONS = [
+    ("al", Airline, "airline_key", {"airline_id": "airline_id", "name": "airline"}),
+    ("ac", Aircraft, "aircraft_key", {"aircraft_id": "aircraft_id", "manufacturer": "manufacturer", "model": "model", "year": "year",
+                                      "engines": "engines", "seats": "seats", "max_weight_pounds": "max_weight_pounds"}),
+    ("o", Airport, "origin_key", {"code": "origin", "name": "name_origin", "latitude": "latitude_origin", "longitude": "longitude_origin"}),
+    ("d", Airport, "destination_key", {"code": "destination", "name": "name_destination", "latitude": "latitude_destination", "longitude": "longitude_destination"}),
+]
+KEY_COLUMNS = {key for _, _, key, _ in DIMENSIONS}
+FLIGHT_ID_LOCK = 0x666C6967 # "flig": erster Schlüssel von pg_advisory_xact_lock(int, int) --> trennt die flight_id-Sperren von anderen Advisory Locks
+FACT_COLUMNS = [c.name for c in FACT.columns if c.name not in KEY_COLUMNS] # Spalten, die 1:1 in flight_facts stehen
+
+def _dialect(conn): # Funktioniert mit Session und Connection (wie in rollups.py)
+    return conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+
+def enabled(conn) -> bool:
+    return _dialect(conn).name == "postgresql"
+
+def fact_table(conn): # Physische Tabelle für Löschen per flight_id (ingest.py): an der View vorbei, ohne Trigger pro Zeile
+    return FACT if enabled(conn) else Flight.__table__
+
+def _primary_key(model):
+    return model.__table__.primary_key.columns.values()[0].name
+
+def _attribute_columns(model):
+    return [c for c in model.__table__.columns if not c.primary_key]
+
+# View und Trigger
+
+def wide_select(facts=None):
+    # Alle Spalten von Flight aus einer Faktentabelle (Standard flight_facts, oder z.B. eine einzelne Partition) + LEFT JOIN der Dimensionen
+    facts = FACT if facts is None else facts
+    joined, columns = facts, {c: facts.c[c] for c in FACT_COLUMNS}
+    for alias, model, key, mapping in DIMENSIONS:
+        dim = model.__table__.alias(alias)
+        joined = joined.outerjoin(dim, dim.c[_primary_key(model)] == facts.c[key])
+        columns.update({flight_column: dim.c[column] for column, flight_column in mapping.items()})
+    return select(*[columns[c.name].label(c.name) for c in Flight.__table__.columns]).select_from(joined)
+
+def _sql_type(column):
+    return column.type.compile(dialect=postgresql.dialect())
+
+def _lookup_function(model):
+    # PL/pgSQL: Schlüssel einer Wertekombination suchen, fehlt sie --> anlegen. Alle Werte NULL --> NULL (kein Verweis).
+    # Erste Spalte (Code) mit "=" --> nutzt den Unique-Index; NULL-Code separat, weil "IS NOT DISTINCT FROM" keinen Index nutzt.
+    # Liefert das INSERT nichts, hat eine parallele Transaktion die Zeile gerade angelegt --> Schleife sucht nochmal.
+    table, key, cols = model.__tablename__, _primary_key(model), _attribute_columns(model)
+    params = ", ".join(f"p_{c.name} {_sql_type(c)}" for c in cols)
+    rest = " AND ".join(f"{c.name} IS NOT DISTINCT FROM p_{c.name}" for c in cols[1:])
+    first = cols[0].name
+    return f"""
+CREATE OR REPLACE FUNCTION flights_dim_{table}({params}) RETURNS integer AS $$
+DECLARE k integer;
+BEGIN
+    IF {" AND ".join(f"p_{c.name} IS NULL" for c in cols)} THEN RETURN NULL; END IF;
+    LOOP
+        IF p_{first} IS NULL THEN
+            SELECT {key} INTO k FROM {table} WHERE {first} IS NULL AND {rest};
+        ELSE
+            SELECT {key} INTO k FROM {table} WHERE {first} = p_{first} AND {rest};
+        END IF;
+        EXIT WHEN k IS NOT NULL;
+        INSERT INTO {table} ({", ".join(c.name for c in cols)}) VALUES ({", ".join(f"p_{c.name}" for c in cols)})
+            ON CONFLICT DO NOTHING RETURNING {key} INTO k;
+        EXIT WHEN k IS NOT NULL;
+    END LOOP;
+    RETURN k;
+END $$ LANGUAGE plpgsql;"""
+
+def _trigger_functions_sql():
+    # DELETE gibt OLD zurück --> RETURNING (Bulk-Delete) und die Zeilenzahl, die das ORM beim Löschen prüft, funktionieren wie bei einer Tabelle.
+    # INSERT: PostgreSQL ignoriert ON CONFLICT eines INSERT auf eine View mit INSTEAD OF-Trigger --> der Trigger selbst macht
+    # ON CONFLICT DO NOTHING. Kein Fakt eingefügt --> RETURN NULL: die Zeile fehlt im RETURNING und zählt nicht als eingefügt.
+    # Partitioniert ist flight_id nur pro Monat eindeutig (partitions.py) --> vorher Sperre auf die flight_id bis zum Ende der Transaktion
+    # und Suche über alle Partitionen. Eine parallele Transaktion mit derselben flight_id wartet auf die Sperre und sieht danach deren Zeile.
+    keys = [f"flights_dim_{model.__tablename__}({', '.join(f'NEW.{mapping[c.name]}' for c in _attribute_columns(model))})"
+            for _, model, _, mapping in DIMENSIONS]
+    columns = FACT_COLUMNS + [key for _, _, key, _ in DIMENSIONS]
+    values = [f"NEW.{c}" for c in FACT_COLUMNS] + keys
+    return f"""
+CREATE OR REPLACE FUNCTION flights_view_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock({FLIGHT_ID_LOCK}, hashtext(NEW.flight_id));
+    IF EXISTS (SELECT 1 FROM {FACT.name} WHERE flight_id = NEW.flight_id) THEN RETURN NULL; END IF;
+    INSERT INTO {FACT.name} ({", ".join(columns)}) VALUES ({", ".join(values)})
+        ON CONFLICT DO NOTHING;
+    IF NOT FOUND THEN RETURN NULL; END IF;
+    RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION flights_view_delete() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM {FACT.name} WHERE flight_id = OLD.flight_id;
+    IF NOT FOUND THEN RETURN NULL; END IF;
+    RETURN OLD;
+END $$ LANGUAGE plpgsql;"""
+
+def _trigger_sql():
+    return _trigger_functions_sql() + f"""
+
+CREATE TRIGGER flights_insert INSTEAD OF INSERT ON {VIEW} FOR EACH ROW EXECUTE FUNCTION flights_view_insert();
+CREATE TRIGGER flights_delete INSTEAD OF DELETE ON {VIEW} FOR EACH ROW EXECUTE FUNCTION flights_view_delete();"""
+
+def create_view(conn):
+    view_sql = str(wide_select().compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    conn.execute(text(f"CREATE VIEW {VIEW} AS {view_sql}"))
+    for model in (Airline, Aircraft, Airport):
+        conn.exec_driver_sql(_lookup_function(model))
+    conn.exec_driver_sql(_trigger_sql())
+
+# Anlegen / Übernehmen
+
+def ensure_schema(conn):
+    # Aufruf in einer Transaktion (engine.begin()), vor Base.metadata.create_all (das eine vorhandene View flights als "Tabelle existiert" sieht).
+    if not enabled(conn): return
+    kind = partitions.relkind(conn, VIEW)
+    if kind == "v" and not partitions.needs_migration(conn): # Alles da. Trigger-Funktionen trotzdem ersetzen --> Änderungen erreichen bestehende Datenbanken
+        conn.exec_driver_sql(_trigger_functions_sql())
+        return
+    if kind == "v": conn.execute(text(f"DROP VIEW {VIEW}")) # flight_facts wird gleich umgebaut --> View hängt daran, danach neu anlegen
+    wide = kind in ("r", "p") # Bisherige breite Tabelle (auch partitioniert) --> Daten übernehmen
+    if wide:
+        print("Breite flights-Tabelle gefunden --> wird einmalig in flight_facts + airports/airlines/aircraft aufgeteilt")
+        conn.execute(text(f"ALTER TABLE {VIEW} RENAME TO flights_wide"))
+    for model in (Airport, Airline, Aircraft):
+        model.__table__.create(conn, checkfirst=True)
+    partitions.ensure_fact_table(conn) # Partitioniert (FLIGHTS_PARTITIONED=1) ...
+    FACT.create(conn, checkfirst=True) # ... sonst als normale Tabelle mit Primary Key
+    if wide:
+        source = Table("flights_wide", MetaData(), *[Column(c.name, c.type) for c in Flight.__table__.columns])
+        partitions.ensure_partitions(conn, conn.execute(select(func.date_trunc("month", source.c.scheduled_departure)).distinct()).scalars().all())
+        insert_from(conn, source)
+        conn.execute(text("DROP TABLE flights_wide")) # Partitionen und alte Indizes gehen mit
+    create_view(conn)
+    ensure_indexes(conn)
+
+def ensure_indexes(conn): # Indizes aus models.py anlegen, falls neu (auf flight_facts bzw. auf der echten Tabelle flights ohne PostgreSQL)
+    for index in fact_table(conn).indexes: index.create(conn, checkfirst=True)
+
+def truncate(conn): # Komplett neu laden (INGEST_MODE=stream): Fakten und Dimensionen leeren, Schlüssel wieder ab 1
+    if enabled(conn): conn.execute(text(f"TRUNCATE {FACT.name}, {Airport.__tablename__}, {Airline.__tablename__}, {Aircraft.__tablename__} RESTART IDENTITY"))
+    else: conn.execute(delete(Flight.__table__))
+
+# Mengenbasiertes Laden
+
+def _match(dim, source, mapping):
+    # Gleiche Wertekombination, NULL = NULL. coalesce auf der ersten Spalte --> PostgreSQL kann per Hash Join verbinden.
+    pairs = [(dim.c[column], source.c[flight_column]) for column, flight_column in mapping.items()]
+    return and_(func.coalesce(pairs[0][0], "") == func.coalesce(pairs[0][1], ""), *[d.isnot_distinct_from(s) for d, s in pairs])
+
+def insert_from(conn, source):
+    # source: Tabelle (oder Subquery) mit den Spalten von Flight, z.B. die Staging-Tabelle von ingest.py.
+    # 1. Fehlende Dimensionszeilen: ein INSERT ... SELECT DISTINCT ... ON CONFLICT DO NOTHING pro Dimension
+    # 2. Fakten: ein INSERT ... SELECT mit LEFT JOIN auf die Dimensionen (Hash Join, keine Trigger pro Zeile)
+    names = [c.name for c in Flight.__table__.columns]
+    if not enabled(conn):
+        conn.execute(insert(Flight.__table__).from_select(names, select(*[source.c[n] for n in names])))
+        return
+    for model in (Airline, Aircraft, Airport):
+        usages = [mapping for _, m, _, mapping in DIMENSIONS if m is model] # airports: einmal als origin, einmal als destination
+        selects = [select(*[source.c[f] for f in mapping.values()]).where(or_(*[source.c[f].isnot(None) for f in mapping.values()])) for mapping in usages]
+        columns = list(usages[0].keys())
+        rows = union(*selects) if len(selects) > 1 else selects[0].distinct() # union() mit nur einem SELECT wäre ohne DISTINCT --> jede Zeile zöge einen Schlüssel
+        conn.execute(pg_insert(model.__table__).from_select(columns, rows).on_conflict_do_nothing())
+    joined, keys = source, []
+    for alias, model, key, mapping in DIMENSIONS:
+        dim = model.__table__.alias(alias)
+        joined = joined.outerjoin(dim, _match(dim, source, mapping))
+        keys.append(dim.c[_primary_key(model)])
+    conn.execute(insert(FACT).from_select(FACT_COLUMNS + [key for _, _, key, _ in DIMENSIONS],
+                                          select(*[source.c[c] for c in FACT_COLUMNS], *keys).select_from(joined)))
+
+# Bericht: vorher (breit) gegen nachher (normalisiert)
+
+def _sizes(conn, table): # Tabelle + Indizes in Bytes
+    return conn.execute(text("SELECT pg_table_size(CAST(:t AS regclass)), pg_indexes_size(CAST(:t AS regclass))"), {"t": table}).one()
+
+def _timed(conn, sql, repeat): # Median der Ausführungszeit (EXPLAIN ANALYZE ohne Zeitmessung pro Knoten, die Joins sonst stark verteuert; erster Lauf wärmt an) + gelesene Blöcke
+    runs = []
+    for _ in range(repeat + 1):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, TIMING OFF, BUFFERS, FORMAT JSON) {sql}")).scalar()[0]
+        runs.append((plan["Execution Time"], plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0)))
+    return statistics.median(t for t, _ in runs[1:]), runs[-1][1]
+
+def _copy(conn, name, sql, indexes): # Frisch geschriebene, nicht partitionierte Kopie mit Primary Key und den Indizes aus models.py
+    conn.execute(text(f"CREATE TABLE {name} AS {sql}"))
+    conn.execute(text(f"ALTER TABLE {name} ADD PRIMARY KEY (flight_id)"))
+    for index in indexes:
+        conn.execute(text(f"CREATE INDEX ON {name} ({', '.join(c.name for c in index.columns)})"))
+    conn.execute(text(f"ANALYZE {name}"))
+
+def report(conn, repeat=5) -> dict:
+    # Baut in der laufenden Transaktion zwei Kopien derselben Flüge: breit (wie früher flights) und als Fakten (wie flight_facts).
+    # Beide frisch geschrieben und ohne Partitionen --> der Vergleich zeigt nur den Unterschied im Zeilenformat, nicht tote Zeilen
+    # aus inkrementellen Läufen oder die Aufteilung nach Monaten. Der Aufrufer rollt danach zurück --> es bleibt nichts übrig.
+    _copy(conn, "report_wide", f"SELECT * FROM {VIEW}", Flight.__table__.indexes)
+    _copy(conn, "report_facts", f"SELECT * FROM {FACT.name}", FACT.indexes)
+    for model in (Airport, Airline, Aircraft): conn.execute(text(f"ANALYZE {model.__tablename__}"))
+    view_sql = str(wide_select(partitions.table_like_facts("report_facts")).compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+    wide, facts = _sizes(conn, "report_wide"), _sizes(conn, "report_facts")
+    dims = [_sizes(conn, m.__tablename__) for m in (Airport, Airline, Aircraft)]
+    code = conn.execute(select(Flight.origin).where(Flight.origin.isnot(None)).group_by(Flight.origin).order_by(func.count().desc()).limit(1)).scalar()
+    queries = { # Name --> (SQL breit, SQL normalisiert)
+        "Scan: count + avg(departure_delay)": ("SELECT count(*), avg(departure_delay) FROM report_wide",
+                                               "SELECT count(*), avg(departure_delay) FROM report_facts"),
+        "Scan: alle Spalten (über die View)": ("SELECT * FROM report_wide", f"SELECT * FROM ({view_sql}) AS v"),
+        f"Suche: origin = {code}, 1001 Zeilen": (f"SELECT * FROM report_wide WHERE origin = '{code}' ORDER BY flight_id LIMIT 1001",
+                                                 f"SELECT * FROM ({view_sql}) AS v WHERE origin = '{code}' ORDER BY flight_id LIMIT 1001"),
+    }
+    return {
+        "rows": conn.execute(text("SELECT count(*) FROM report_facts")).scalar(),
+        "size_wide": {"table": wide[0], "indexes": wide[1]},
+        "size_normalized": {"table": facts[0] + sum(d[0] for d in dims), "indexes": facts[1] + sum(d[1] for d in dims),
+                            "facts": facts[0], "dimensions": sum(d[0] for d in dims)},
+        "queries": {name: {"wide": _timed(conn, a, repeat), "normalized": _timed(conn, b, repeat)} for name, (a, b) in queries.items()},
+    }
+
+def print_report(r):
+    mb = lambda b: f"{b / 1024 / 1024:8.2f} MB"
+    w, n = r["size_wide"], r["size_normalized"]
+    print(f"{r['rows']} Flüge")
+    print(f"{'':36} {'breit (vorher)':>16} {'normalisiert':>16}")
+    print(f"{'Tabelle(n)':36} {mb(w['table']):>16} {mb(n['table']):>16}   (Fakten {mb(n['facts']).strip()}, Dimensionen {mb(n['dimensions']).strip()})")
+    print(f"{'Indizes':36} {mb(w['indexes']):>16} {mb(n['indexes']):>16}")
+    for name, q in r["queries"].items():
+        (a, ab), (b, bb) = q["wide"], q["normalized"]
+        print(f"{name:36} {a:10.2f} ms {ab:>5} Bl. {b:10.2f} ms {bb:>5} Bl.")
+
+if __name__ == "__main__":
+    from database import engine
+    parser = argparse.ArgumentParser(description="Größe und Scan-Zeiten: breite Tabelle gegen Fakten + Dimensionen")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    with engine.connect() as conn:
+        if not enabled(conn) or partitions.relkind(conn, VIEW) != "v": sys.exit("flights ist keine View (PostgreSQL, Schema wird beim API-Start bzw. von ingest.py angelegt).")
+        try:
+            print_report(report(conn, args.repeat))
+        finally:
+            conn.rollback() # Breite Kopie wieder entfernen
@@ -0,0 +1,108 @@
+"""Räumlicher Index über die Flughäfen (Umkreissuche).
+
+Jeder Flug hat Koordinaten für origin und destination, aber es gibt nur wenige hundert verschiedene Flughäfen.
+Statt für jede Zeile in flights eine Großkreis-Entfernung zu rechnen, wird einmal eine Liste der Flughäfen
+in ein Gitter (1° x 1° Zellen) im Speicher gelegt. Eine Umkreissuche schaut nur in die Zellen, die den Kreis
+berühren, und prüft die wenigen Flughäfen darin exakt (Haversine). Das Ergebnis sind Flughafen-Codes,
+die als origin IN (...) bzw. destination IN (...) an die normale Suche gehen --> die Indizes auf origin/destination greifen.
+
+Was macht der Code?:
+    - haversine_km: Großkreis-Entfernung zweier Punkte in km.
+    - AirportIndex.rebuild: liest alle Flughäfen (PostgreSQL: aus der kleinen airports-Tabelle, siehe dimensions.py; sonst origin + destination aus flights)
+      und baut das Gitter neu
+      (API-Start und nach jeder neuen Ingestion, erkannt über die Cache-Generation, siehe cache.py).
+    - AirportIndex.add_flights: nimmt Flughäfen neu angelegter Flüge (add/bulk) sofort auf.
+    - AirportIndex.within: Flughäfen im Umkreis, nach Entfernung sortiert.
+"""
+import math
+import threading
+from sqlalchemy import select, func, union_all
+from models import Flight, Airport
+import dimensions
+
+EARTH_RADIUS_KM = 6371.0088 # Mittlerer Erdradius
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180 # ~111 km pro Breitengrad
+CELL_DEGREES = 1.0 # Kantenlänge einer Gitterzelle
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+COLUMNS = int(360 / CELL_DEGREES)
+
+def _column(c): # Spalte auf -180..180 zurückrechnen (Datumsgrenze, lon = 180 ist dieselbe Stelle wie -180)
+    return (c + COLUMNS // 2) % COLUMNS - COLUMNS // 2
+
+def _cell(lat, lon):
+    return math.floor(lat / CELL_DEGREES), _column(math.floor(lon / CELL_DEGREES))
+
+class AirportIndex:
+    def __init__(self):
+        self.airports = {} # code --> {"code", "name", "lat", "lon"}
+        self.grid = {} # (zeile, spalte) --> Liste von Codes
+        self.generation = None # Cache-Generation, zu der das Gitter gebaut wurde
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def rebuild(self, db, generation=None):
+        # db: normale (synchrone) Session oder Connection --> in main.py über db.run_sync. Ein GROUP BY pro Richtung, kein Scan im Request.
+        sources = (((Airport.code, Airport.name, Airport.latitude, Airport.longitude),) if dimensions.enabled(db) else # ein paar hundert Zeilen statt Scan über die Flüge
+                   ((Flight.origin, Flight.name_origin, Flight.latitude_origin, Flight.longitude_origin),
+                    (Flight.destination, Flight.name_destination, Flight.latitude_destination, Flight.longitude_destination)))
+        queries = [select(code.label("code"), func.max(name).label("name"), func.min(lat).label("lat"), func.min(lon).label("lon")) # Koordinaten sind pro Flughafen gleich --> min() statt avg() (keine Rundungsreste)
+                   .where(code.isnot(None), lat.isnot(None), lon.isnot(None)).group_by(code)
+                   for code, name, lat, lon in sources]
+        airports = {}
+        for row in db.execute(union_all(*queries) if len(queries) > 1 else queries[0]).mappings():
+            airports.setdefault(row["code"], {"code": row["code"], "name": row["name"], "lat": float(row["lat"]), "lon": float(row["lon"])})
+        grid = {}
+        for a in airports.values(): grid.setdefault(_cell(a["lat"], a["lon"]), []).append(a["code"])
+        with self._lock: # Austausch in einem Schritt --> parallele Suchen sehen entweder das alte oder das neue Gitter
+            self.airports, self.grid, self.generation = airports, grid, generation
+            self.rebuilds += 1
+
+    def add_flights(self, flights: list):
+        # Neue Flughäfen aus frisch angelegten Flügen (Dicts). Bekannte Codes bleiben unverändert; gelöschte Flüge werden nicht
+        # ausgetragen (ein Flughafen ohne Flüge liefert einfach keine Treffer), das erledigt der nächste rebuild.
+        with self._lock:
+            airports, grid = dict(self.airports), {k: list(v) for k, v in self.grid.items()}
+            for f in flights:
+                for prefix in ("origin", "destination"):
+                    code, lat, lon = f.get(prefix), f.get(f"latitude_{prefix}"), f.get(f"longitude_{prefix}")
+                    if code is None or lat is None or lon is None or code in airports: continue
+                    airports[code] = {"code": code, "name": f.get(f"name_{prefix}"), "lat": float(lat), "lon": float(lon)}
+                    grid.setdefault(_cell(lat, lon), []).append(code)
+            self.airports, self.grid = airports, grid
+
+    def _candidate_cells(self, lat, lon, radius_km):
+        # Alle Zellen im Rechteck um den Kreis. Längengrade werden zu den Polen hin enger --> Breite über cos(Breitengrad).
+        dlat = radius_km / KM_PER_DEGREE
+        lat_min, lat_max = lat - dlat, lat + dlat
+        max_abs = max(abs(lat_min), abs(lat_max))
+        if max_abs >= 89.0 or radius_km >= EARTH_RADIUS_KM * math.pi / 2: return None # Pol im Kreis oder halbe Erde --> alle Zellen prüfen
+        dlon = dlat / math.cos(math.radians(max_abs))
+        if dlon >= 180.0: return None
+        rows = range(math.floor(lat_min / CELL_DEGREES), math.floor(lat_max / CELL_DEGREES) + 1)
+        first, last = math.floor((lon - dlon) / CELL_DEGREES), math.floor((lon + dlon) / CELL_DEGREES)
+        return {(r, _column(c)) for r in rows for c in range(first, last + 1)} # Set: über die Datumsgrenze hinweg keine Zelle doppelt
+
+    def within(self, lat: float, lon: float, radius_km: float) -> list:
+        # Flughäfen im Umkreis, nächste zuerst: [{"code", "name", "lat", "lon", "distance_km"}]
+        with self._lock: airports, grid = self.airports, self.grid # Beide Referenzen zusammen lesen --> passen zueinander, auch wenn parallel neu gebaut wird
+        cells = self._candidate_cells(lat, lon, radius_km)
+        codes = (c for cell in cells for c in grid.get(cell, ())) if cells is not None else airports
+        out = []
+        for code in codes:
+            a = airports[code]
+            d = haversine_km(lat, lon, a["lat"], a["lon"])
+            if d <= radius_km: out.append({**a, "distance_km": round(d, 1)})
+        return sorted(out, key=lambda a: a["distance_km"])
+
+    def codes_within(self, lat: float, lon: float, radius_km: float) -> list:
+        return [a["code"] for a in self.within(lat, lon, radius_km)]
+
+    def stats(self) -> dict:
+        return {"airports": len(self.airports), "cells": len(self.grid), "rebuilds": self.rebuilds}
+
+airport_index = AirportIndex()
@@ -0,0 +1,244 @@
+"""Index-Berater für die Flugsuche (nur PostgreSQL).
+
+Welche Indizes auf flights helfen, hängt davon ab, welche Filter zusammen benutzt werden. Die API protokolliert
+das (query_log.py, GET /search/patterns). Dieses Skript nimmt diese Muster und
+    1. misst jede Kombination mit EXPLAIN (ANALYZE) als dieselbe Abfrage wie eine Seite von POST /flights/search,
+    2. schlägt zusammengesetzte Indizes (z.B. origin+destination+weekday) bzw. Teil-Indizes (WHERE weekday = 'Monday') vor,
+       wenn kein vorhandener Index die Kombination abdeckt,
+    3. misst auf Wunsch vorher/nachher:
+         --trial: Indizes in einer Transaktion anlegen, messen, zurückrollen (bleibt nichts übrig, sperrt aber Schreibzugriffe solange)
+         --apply: Indizes mit CREATE INDEX CONCURRENTLY dauerhaft anlegen und danach messen.
+Muster enthalten auch Regionen (IN-Listen) und Bereiche (RANGE_COLUMNS: Zeitfenster, Uhrzeit). Ein Bereich kommt als letzte Spalte
+in den Index: nach einer Bereichsbedingung kann ein B-Baum keine weitere Spalte mehr eingrenzen.
+Ist flights eine View (dimensions.py), gehören die Indizes auf flight_facts: airline_id/origin/destination werden dort zu
+airline_key/origin_key/destination_key, Werte eines Teil-Index zu den passenden Schlüsseln.
+
+Aufruf (im api-Ordner, DB-Verbindung wie in database.py):
+    python index_advisor.py                                   # Muster von der laufenden API (http://localhost:8000)
+    python index_advisor.py --patterns patterns.json --trial   # gespeicherte Muster (Ausgabe von GET /search/patterns)
+    python index_advisor.py --all --trial --output report.json # ohne Protokoll: alle Kombinationen der vier "="-Filter
+"""
+import re
+import sys
+import json
+import argparse
+import statistics
+import urllib.request
+from itertools import combinations
+from sqlalchemy import select, func, text, inspect
+from sqlalchemy.dialects import postgresql
+from database import engine
+from models import Flight, Airline, Airport
+from cache import SEARCH_FILTER_COLUMNS
+from query_log import RANGE_COLUMNS, parse_value
+import partitions
+import dimensions
+
+EQUAL_COLUMNS = list(SEARCH_FILTER_COLUMNS.values()) # airline_id, origin, destination, weekday ("=" bzw. IN bei Regionen)
+FILTER_COLUMNS = EQUAL_COLUMNS + list(RANGE_COLUMNS) # + scheduled_departure, scheduled_arrival, hour (Bereiche)
+PAGE = 1001 # Wie POST /flights/search mit Standard-limit (1000 + 1)
+PARTIAL_SHARE = 0.9 # Ein Wert in >= 90 % der Abfragen eines Musters ...
+PARTIAL_MAX_DISTINCT = 10 # ... einer Spalte mit wenigen verschiedenen Werten --> Teil-Index statt zusätzlicher Spalte
+PARTIAL_MIN_CALLS = 20 # ... aber erst, wenn das Muster oft genug vorkam
+KEY_COLUMNS = {"airline_id": ("airline_key", Airline.airline_key, Airline.airline_id), # Filterspalte --> (Spalte in flight_facts, Schlüssel, Wert in der Dimension)
+               "origin": ("origin_key", Airport.airport_key, Airport.code),
+               "destination": ("destination_key", Airport.airport_key, Airport.code)}
+
+def index_target(conn):
+    # Wohin gehören die Indizes? {"table": physische Tabelle, "columns": Filterspalte --> Spalte dort}
+    if dimensions.enabled(conn) and partitions.relkind(conn, Flight.__tablename__) == "v":
+        return {"table": dimensions.FACT.name, "columns": {c: KEY_COLUMNS[c][0] if c in KEY_COLUMNS else c for c in FILTER_COLUMNS + ["flight_id"]}}
+    return {"table": Flight.__tablename__, "columns": {c: c for c in FILTER_COLUMNS + ["flight_id"]}}
+
+def where_sql(conn, target, column, value):
+    # Bedingung eines Teil-Index; auf flight_facts über die Schlüssel (ein Code kann mehrere Dimensionszeilen haben, z.B. andere Namen)
+    quote = lambda v: "'" + str(v).replace("'", "''") + "'"
+    if target["columns"][column] == column: return f"{column} = {quote(value)}"
+    _, key, attr = KEY_COLUMNS[column]
+    keys = conn.execute(select(key).where(attr == value)).scalars().all() or [-1]
+    return f"{target['columns'][column]} IN ({', '.join(str(k) for k in keys)})"
+
+def load_patterns(args, conn):
+    if args.all: # Alle Kombinationen der "="-Filter, Werte aus der Tabelle (für Bereiche gibt es ohne Protokoll keine sinnvollen Grenzen)
+        return [{"columns": list(cols), "count": 0, "values": {}} for n in range(1, len(EQUAL_COLUMNS) + 1) for cols in combinations(EQUAL_COLUMNS, n)]
+    if args.patterns:
+        with open(args.patterns) as f: patterns = json.load(f)
+    else:
+        with urllib.request.urlopen(f"{args.api.rstrip('/')}/search/patterns", timeout=10) as r: patterns = json.load(r)
+    return [p for p in patterns if p["columns"] and p["count"] >= args.min_count] # Ohne Filter hilft kein Index
+
+def example_values(conn, pattern):
+    # Werte für EXPLAIN: die häufigste tatsächlich vorkommende Kombination. Mit Protokoll nur unter den benutzten Werten.
+    # Bereiche und IN-Listen (Regionen): jeweils der am häufigsten protokollierte Wert, unverändert.
+    logged = pattern.get("values") or {}
+    top = {c: parse_value(c, max(v, key=v.get)) for c, v in logged.items() if v}
+    fixed = {c: v for c, v in top.items() if c in RANGE_COLUMNS or isinstance(v, list)}
+    cols = [Flight.__table__.c[c] for c in pattern["columns"] if c not in fixed and c not in RANGE_COLUMNS]
+    if not cols: return fixed
+    stmt = select(*cols).where(*[c.isnot(None) for c in cols], *conditions(fixed)).group_by(*cols).order_by(func.count().desc()).limit(1)
+    for c in cols:
+        if logged.get(c.name): stmt = stmt.where(c.in_(list(logged[c.name])))
+    row = conn.execute(stmt).first()
+    if row is None: # Benutzte Werte kommen zusammen nicht vor --> jeweils häufigster Wert aus dem Protokoll
+        return top
+    return {**dict(zip([c.name for c in cols], row)), **fixed}
+
+def conditions(values):
+    # Wie search_conditions in main.py: Liste --> IN, Bereich (von, bis) --> >= von und < bis (hour: <= bis, von > bis über Mitternacht), sonst "="
+    table, out = Flight.__table__, []
+    for c, v in values.items():
+        column = table.c[c]
+        if isinstance(v, list): out.append(column.in_(v))
+        elif isinstance(v, tuple):
+            low, high = v
+            if c == "hour" and low is not None and high is not None and low > high: out.append((column >= low) | (column <= high))
+            else:
+                if low is not None: out.append(column >= low)
+                if high is not None: out.append(column <= high if c == "hour" else column < high)
+        else: out.append(column == v)
+    return out
+
+def search_sql(values):
+    # Dieselbe Abfrage wie eine Seite von POST /flights/search, mit eingesetzten Werten (EXPLAIN kennt keine Parameter).
+    table = Flight.__table__
+    stmt = select(table).where(*conditions(values)).order_by(table.c.flight_id).limit(PAGE)
+    return str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def scans(node):
+    # Alle Zugriffe auf Tabellen/Indizes im Plan, z.B. "Seq Scan flights" oder "Index Scan idx_route_weekday"
+    out = [f"{node['Node Type']} {node.get('Index Name', node.get('Relation Name', ''))}".strip()] if "Scan" in node["Node Type"] else []
+    for child in node.get("Plans", []): out += scans(child)
+    return out
+
+def explain(conn, sql, repeat):
+    # EXPLAIN (ANALYZE) mehrmals ausführen (erster Lauf wärmt den Cache an) --> Median der Ausführungszeit + Plan des letzten Laufs
+    times = []
+    for _ in range(repeat + 1):
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()[0]
+        times.append(plan["Execution Time"])
+    return {"ms": statistics.median(times[1:]), "rows": plan["Plan"]["Actual Rows"], "scans": scans(plan["Plan"])}
+
+def existing_indexes(conn, target):
+    # Spaltenlisten aller Indizes auf der physischen Tabelle, in Filterspalten übersetzt (Teil-Indizes zählen nur für ihre Bedingung --> hier nicht als Abdeckung)
+    insp, table = inspect(conn), target["table"]
+    names = {physical: column for column, physical in target["columns"].items()}
+    indexes = [(i["name"], i["column_names"]) for i in insp.get_indexes(table) if not i.get("dialect_options", {}).get("postgresql_where")]
+    indexes.append((f"{table}_pkey", insp.get_pk_constraint(table)["constrained_columns"])) # Partitioniert: kein Primary Key --> leere Liste
+    return [(name, [names.get(c, c) for c in cols]) for name, cols in indexes]
+
+def covered(columns, indexes):
+    # Ein B-Baum-Index hilft voll, wenn seine ersten Spalten genau die "="-Filterspalten sind (Reihenfolge egal bei "=")
+    # und, falls das Muster Bereiche hat, direkt danach einer davon folgt (nur der erste Bereich grenzt im Index ein).
+    equal = [c for c in columns if c not in RANGE_COLUMNS]
+    ranges = [c for c in columns if c in RANGE_COLUMNS]
+    return next((name for name, cols in indexes if set(cols[:len(equal)]) == set(equal) and (not ranges or len(cols) > len(equal) and cols[len(equal)] in ranges)), None)
+
+def distinct_counts(conn, target):
+    names = {physical: column for column, physical in target["columns"].items()}
+    rows = conn.execute(text("SELECT attname, n_distinct FROM pg_stats WHERE tablename = :t"), {"t": target["table"]}).all()
+    return {names.get(name, name): n for name, n in rows}
+
+def index_name(columns, where=None):
+    name = "idx_adv_" + "_".join(columns) + (f"_where_{where[0]}_{where[1]}" if where else "")
+    return re.sub(r"[^a-z0-9_]", "", name.lower())[:63] # PostgreSQL-Namen: max. 63 Zeichen
+
+def propose(conn, target, patterns, results, indexes, n_distinct, min_ms):
+    # Vorschläge für alle Muster ohne passenden Index, deren Plan die Tabelle komplett liest oder langsamer als min_ms ist.
+    # Ohne Bereich endet jeder Vorschlag mit flight_id: die Suche sortiert nach flight_id (Keyset-Paginierung) --> mit dem Index
+    # liest PostgreSQL die Seite direkt in der richtigen Reihenfolge und hört nach limit Zeilen auf (kein Sortieren aller Treffer).
+    # Mit Bereich(en) kommt der meistbenutzte Bereich als letzte Spalte hinter die "="-Spalten: nach einer Bereichsbedingung grenzt
+    # ein B-Baum keine weitere Spalte mehr ein, und die Treffer sind ohnehin nicht mehr nach flight_id sortiert.
+    usage = {c: sum(p["count"] or 1 for p in patterns if c in p["columns"]) for c in FILTER_COLUMNS}
+    order = lambda cols: sorted(cols, key=lambda c: (-usage[c], -abs(n_distinct.get(c) or 0))) # Häufig benutzte Spalten zuerst --> kürzere Muster nutzen den Anfang mit
+    proposals = {}
+    for p, r in zip(patterns, results):
+        # Seq Scans auf den winzigen Dimensionstabellen und der (fast leeren) Default-Partition zählen nicht
+        seq_scan = any(s.startswith(f"Seq Scan {target['table']}") and s != f"Seq Scan {partitions.DEFAULT}" for s in r["scans"])
+        if covered(p["columns"], indexes) or (not seq_scan and r["ms"] < min_ms): continue
+        ranges = order([c for c in p["columns"] if c in RANGE_COLUMNS])
+        columns, where = order([c for c in p["columns"] if c not in RANGE_COLUMNS]), None
+        for c, values in (p.get("values") or {}).items(): # Teil-Index, wenn ein Wert fast immer benutzt wird
+            if c in RANGE_COLUMNS: continue
+            total = sum(values.values())
+            top, n = max(values.items(), key=lambda kv: kv[1]) if values else (None, 0)
+            distinct = n_distinct.get(c)
+            if len(columns) > 1 and total >= PARTIAL_MIN_CALLS and n / total >= PARTIAL_SHARE and distinct is not None and 0 < distinct <= PARTIAL_MAX_DISTINCT:
+                columns, where = [x for x in columns if x != c], (c, top)
+                break
+        columns = [target["columns"][c] for c in columns + (ranges[:1] or ["flight_id"])]
+        name = index_name(columns, where)
+        ddl = f"CREATE INDEX {{concurrently}}IF NOT EXISTS {name} ON {target['table']} ({', '.join(columns)})"
+        if where: ddl += f" WHERE {where_sql(conn, target, *where)}"
+        proposals[name] = {"name": name, "columns": columns, "where": where, "ddl": ddl, "for": proposals.get(name, {}).get("for", []) + [p["columns"]],
+                           "reason": "Seq Scan" if seq_scan else f"{r['ms']:.1f} ms"}
+    return list(proposals.values())
+
+def index_usage(conn, target): # Vorhandene Indizes: wie oft benutzt, wie groß --> ungenutzte Indizes kosten nur Schreibzeit und Platz (partitioniert: pro Partition)
+    return [dict(r) for r in conn.execute(text(
+        "SELECT indexrelname AS name, idx_scan AS scans, pg_size_pretty(pg_relation_size(indexrelid)) AS size "
+        "FROM pg_stat_user_indexes WHERE relid IN (SELECT relid FROM pg_partition_tree(CAST(:t AS regclass))) ORDER BY idx_scan"),
+        {"t": target["table"]}).mappings()]
+
+def measure_all(conn, values, repeat):
+    return [explain(conn, search_sql(v), repeat) for v in values]
+
+def print_report(report):
+    print(f"{'Muster':40} {'Aufrufe':>8} {'vorher ms':>10} {'nachher ms':>11} {'Faktor':>7}  Plan vorher --> nachher")
+    for row in report["patterns"]:
+        after = row.get("after")
+        factor = f"{row['before']['ms'] / after['ms']:.1f}x" if after and after["ms"] else ""
+        after_ms = f"{after['ms']:.2f}" if after else ""
+        plan = ", ".join(row["before"]["scans"]) + (f" --> {', '.join(after['scans'])}" if after else "")
+        print(f"{'+'.join(row['columns']):40} {row['count']:>8} {row['before']['ms']:>10.2f} {after_ms:>11} {factor:>7}  {plan}")
+    print("\nVorschläge:" if report["proposals"] else "\nKeine Vorschläge: alle Muster sind durch vorhandene Indizes abgedeckt.")
+    for p in report["proposals"]: print(f"  {p['ddl'].format(concurrently='')};  -- {p['reason']}, für {p['for']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api", default="http://localhost:8000", help="API, von der GET /search/patterns gelesen wird")
+    parser.add_argument("--patterns", help="JSON-Datei mit Mustern (Ausgabe von GET /search/patterns) statt --api")
+    parser.add_argument("--all", action="store_true", help="Alle Filter-Kombinationen statt protokollierter Muster")
+    parser.add_argument("--min-count", type=int, default=1, help="Nur Muster mit mindestens so vielen Aufrufen")
+    parser.add_argument("--repeat", type=int, default=5, help="EXPLAIN-ANALYZE-Läufe pro Muster (Median)")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="Schnellere Muster (ohne Seq Scan) bekommen keinen Vorschlag")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--trial", action="store_true", help="Vorschläge testweise anlegen, messen, zurückrollen")
+    mode.add_argument("--apply", action="store_true", help="Vorschläge dauerhaft anlegen (CONCURRENTLY) und messen")
+    parser.add_argument("--output", help="Bericht zusätzlich als JSON speichern")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql": sys.exit("index_advisor.py braucht PostgreSQL (EXPLAIN ANALYZE, pg_stats).")
+    with engine.connect() as conn:
+        patterns = load_patterns(args, conn)
+        if not patterns: sys.exit("Keine Suchmuster protokolliert (erst suchen oder --all benutzen).")
+        values = [example_values(conn, p) for p in patterns]
+        before = measure_all(conn, values, args.repeat)
+        target = index_target(conn)
+        proposals = propose(conn, target, patterns, before, existing_indexes(conn, target), distinct_counts(conn, target), args.min_ms)
+        usage = index_usage(conn, target)
+        after = None
+        if args.trial and proposals: # Alles in einer Transaktion: DDL ist in PostgreSQL transaktional --> Rollback entfernt die Indizes wieder
+            for p in proposals: conn.execute(text(p["ddl"].format(concurrently="")))
+            conn.execute(text(f"ANALYZE {target['table']}"))
+            after = measure_all(conn, values, args.repeat)
+        conn.rollback()
+    if args.apply and proposals:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn: # CONCURRENTLY geht nicht in einer Transaktion
+            # Partitionierte flights-Tabelle (partitions.py): CONCURRENTLY geht dort nicht --> normaler CREATE INDEX (sperrt Schreibzugriffe kurz)
+            concurrently = "" if partitions.is_partitioned(conn) else "CONCURRENTLY "
+            for p in proposals:
+                print(f"Lege an: {p['name']} ...")
+                conn.execute(text(p["ddl"].format(concurrently=concurrently)))
+            conn.execute(text(f"ANALYZE {target['table']}"))
+            after = measure_all(conn, values, args.repeat)
+
+    report = {"mode": "trial" if args.trial else "apply" if args.apply else "report", "proposals": proposals, "index_usage": usage,
+              "patterns": [{"columns": p["columns"], "count": p["count"], "values": v, "before": b, **({"after": a} if after else {})}
+                           for p, v, b, a in zip(patterns, values, before, after or before)]}
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f: json.dump(report, f, indent=2, default=str)
+        print(f"\nBericht gespeichert: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -10,20 +10,47 @@ Sie ist verantwortlich für:
 
 """
 
-from fastapi import FastAPI, Depends, HTTPException # Importiert FastAPI für die API-Erstellung und Komponenten zur Abhängigkeitsinjektion (Depends) und Fehlerbehandlung (HTTPException).
+from fastapi import FastAPI, Depends, HTTPException, Query, Header # Importiert FastAPI für die API-Erstellung und Komponenten zur Abhängigkeitsinjektion (Depends) und Fehlerbehandlung (HTTPException).
+from fastapi.responses import StreamingResponse, Response # Für NDJSON-Streaming und fertig kodierte JSON-Antworten.
 from sqlalchemy.orm import Session # Importiert die Session-Klasse von SQLAlchemy für Datenbank-Interaktionen.
-from pydantic import BaseModel # Importiert die Basisklasse für die Datenmodelle (Schemas) zur Validierung.
-from typing import List, Optional # Importiert Typ-Annotationen, um Listen und optionale Felder zu definieren.
+from sqlalchemy.ext.asyncio import AsyncSession # Asynchrone Session (Standard, siehe DB_ASYNC in database.py).
+from sqlalchemy import select, func, case, literal, Float # Core-Select (ohne ORM-Objekte) und SQL-Funktionen für Aggregationen.
+from sqlalchemy import delete, any_, bindparam, String # Für die Bulk-Endpunkte (DELETE ... WHERE flight_id = ANY(:ids)).
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY # INSERT ... ON CONFLICT für PostgreSQL
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert # ... und für SQLite (lokale Tests)
+from pydantic import BaseModel, Field # Importiert die Basisklasse für die Datenmodelle (Schemas) zur Validierung.
+from typing import List, Optional, Literal # Importiert Typ-Annotationen, um Listen und optionale Felder zu definieren.
 from datetime import datetime, timedelta # Importiert datetime für die Behandlung von Zeitstempel-Feldern.
-from database import SessionLocal, engine # Importiert die Session Factory und die Datenbank Engine aus database.py.
+from database import engine, async_engine, get_db, pool_stats, DB_ASYNC # Importiert die Datenbank Engines und die Session-Dependency aus database.py.
 from models import Flight, Base, User # Importiert das Flight-Datenbankmodell und die Base-Klasse aus models.py.
-from passlib.context import CryptContext # Importiert CryptContext für das sichere Hashing von Passwörtern.
+from password_pool import password_pool, AuthSaturated, AuthPoolBroken, AUTH_RETRY_AFTER # bcrypt in eigenen Prozessen, begrenzt (siehe password_pool.py).
 from jose import JWTError, jwt # Importiert JWT für die Token-Erstellung (OAuth2).
 from fastapi.security import OAuth2PasswordBearer # Importiert OAuth2 Standard für die Token-Abfrage.
 import pyotp # Importiert pyotp für die Zwei-Faktor-Authentifizierung (für Duo Mobile).
+import rollups # Vorberechnete Kennzahlen (flight_rollups), siehe rollups.py.
+import sketches # Verteilung der Verspätungen pro Airline/Route/Wochentag (flight_delay_sketches) für schnelle Perzentile, siehe sketches.py.
+from sketches import sketch_index
+import dimensions # flights als View über Fakten + Dimensionstabellen (nur PostgreSQL), siehe dimensions.py.
+from cache import flight_cache, SEARCH_FILTER_COLUMNS # Read-Through-Cache für Flug-Abfragen, siehe cache.py.
+from coalesce import search_flight # Gleiche gleichzeitige Suchen teilen sich eine Abfrage, siehe coalesce.py.
+from query_log import search_patterns, range_value, list_value # Welche Filter-Kombinationen werden benutzt? --> index_advisor.py
+from geo import airport_index # Räumlicher Index über die Flughäfen (Umkreissuche), siehe geo.py.
+from autocomplete import autocomplete_index # Vorschläge für Flughäfen, Airlines und Modelle, siehe autocomplete.py.
+import arrow_export # Suchergebnisse als Arrow-Stream / Parquet (spaltenweise, direkt aus COPY), siehe arrow_export.py.
+import metrics # Latenz pro Route, Zeitanteile (DB/JSON/Rest), Slow-Query-Log, GET /metrics, siehe metrics.py.
+import time
+import base64 # Für den Cursor der Paginierung.
+import orjson # Schneller JSON-Encoder (in C/Rust), kann datetime direkt serialisieren.
 
+with engine.begin() as conn: dimensions.ensure_schema(conn) # PostgreSQL: flight_facts (partitioniert) + Dimensionen + View flights anlegen (bzw. einmalig umbauen), bevor create_all flights als normale Tabelle anlegt.
 Base.metadata.create_all(bind=engine) #  Weist die Base-Klasse an, das Modell (Flight) zu nehmen und die entsprechende Tabelle in der Datenbank zu erstellen.
+with engine.begin() as conn: dimensions.ensure_indexes(conn) # create_all legt Indizes nur mit neuen Tabellen an --> neue Indizes aus models.py auch für bestehende Tabellen.
+with engine.connect() as conn: # Indizes im Speicher (Umkreissuche, Autovervollständigung) einmal beim Start bauen, neu bei neuer Ingestion-Generation.
+    flight_cache.refresh_generation(conn)
+    airport_index.rebuild(conn, flight_cache.generation)
+    autocomplete_index.rebuild(conn, flight_cache.generation)
 app = FastAPI(title="Flights API")    # Erstellt die zentrale FastAPI-Anwendung mit dem Titel "Flights API".
+app.add_middleware(metrics.MetricsMiddleware) # Misst jede Anfrage pro Route (Histogramm + Server-Timing-Header).
 
 # OAUTH2 & SICHERHEIT
 SECRET_KEY = "FlughafenABC_Super_Secret_Key_2025" # Geheimschlüssel für JWT Tokens.
@@ -32,14 +59,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 300 # Token-Gültigkeitsdauer. Wenn das abgelaufen
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login") # Definiert den Token-Endpunkt.
 
 # Passwort-Sicherheit 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-# 'deprecated="auto"' sorgt dafür, dass die Bibliothek veraltete (unsichere) Hashes erkennt 
-# und diese bei einem Login automatisch auf den neuesten Stand (Bcrypt) aktualisiert.
+# pwd_context (bcrypt) kommt aus password_pool.py. Hashen und Prüfen laufen dort in einem eigenen Prozess-Pool:
+# Logins belegen weder den Threadpool noch mehr als AUTH_WORKERS Kerne, ist der Pool voll, gibt es sofort 503.
+async def password_job(job): # job: password_pool.hash(...) bzw. verify(...), voll --> 503 mit Retry-After statt langer Warteschlange
+    try: return await job
+    except AuthSaturated: raise HTTPException(status_code=503, detail="Zu viele Anmeldungen gleichzeitig, bitte gleich erneut versuchen",
+                                              headers={"Retry-After": str(AUTH_RETRY_AFTER)})
+    except AuthPoolBroken: raise HTTPException(status_code=500, detail="Passwortprüfung fehlgeschlagen (bcrypt-Worker abgestürzt)")
 
-def get_db():
-    db = SessionLocal()              # Erstellt eine neue SQLAlchemy-Session
-    try: yield db                    # Gibt die Session an den API-Endpunkt weiter, der sie benötigt.
-    finally: db.close()              # Schließt die Sesssion am Ende.
+# get_db kommt aus database.py: liefert pro Request eine AsyncSession (DB_ASYNC=1) bzw. eine normale Session
+# mit derselben await-baren Schnittstelle (DB_ASYNC=0). Alle Endpunkte sind "async def" und blockieren so keinen Thread,
+# während sie auf PostgreSQL warten.
 
 # AUTH
 def create_access_token(data: dict): # Erstellt einen zeitlich befristeten JWT-Ausweis.
@@ -107,11 +137,53 @@ class FlightBase(BaseModel): # Pydantic-Schema für die Datenstruktur der Flugda
     class Config:
         from_attributes = True  # Erlaubt Pydantic, Daten direkt aus SQLAlchemy-Modellen (Objekt-Attributen) zu lesen.
 
+class GeoCircle(BaseModel): # Umkreis um einen Punkt, z.B. {"lat": 40.7, "lon": -74.0, "radius_km": 50} für New York.
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    radius_km: float = Field(gt=0, le=20038) # 20038 km = halber Erdumfang --> ganze Erde
+
 class FlightSearch(BaseModel): # Pydantic-Schema für die Suchkriterien im POST /flights/search Endpunkt. --> Erbt von Basemodel!
     airline: Optional[str] = None
     origin: Optional[str] = None
     destination: Optional[str] = None
     weekday: Optional[str] = None
+    # Zeitfenster, jeweils halboffen [from, to): departure_from=2023-03-01, departure_to=2023-04-01 --> genau der März.
+    # Bei partitionierter flights-Tabelle liest PostgreSQL nur die Monate im Fenster (Partition Pruning).
+    departure_from: Optional[datetime] = None # scheduled_departure >= departure_from
+    departure_to: Optional[datetime] = None # scheduled_departure < departure_to
+    arrival_from: Optional[datetime] = None # scheduled_arrival >= arrival_from
+    arrival_to: Optional[datetime] = None # scheduled_arrival < arrival_to
+    # Uhrzeit-Fenster (Spalte hour, 0-23, beide Grenzen inklusive). hour_from > hour_to geht über Mitternacht, z.B. 22 bis 5.
+    hour_from: Optional[int] = Field(None, ge=0, le=23)
+    hour_to: Optional[int] = Field(None, ge=0, le=23)
+    # Regionen: Flughäfen im Umkreis werden im Speicher gesucht (geo.py) und als origin/destination IN (...) gefiltert.
+    origin_near: Optional[GeoCircle] = None # Abflug im Umkreis
+    destination_near: Optional[GeoCircle] = None # Ankunft im Umkreis
+
+class FlightPage(BaseModel): # Antwort von POST /flights/search: eine Seite Flüge + Cursor für die nächste Seite.
+    items: List[FlightBase]
+    next_cursor: Optional[str] = None # None = letzte Seite erreicht.
+
+class FlightStatsQuery(FlightSearch): # Suchkriterien für POST /flights/stats: dieselben Filter wie FlightSearch + Gruppierung.
+    group_by: List[Literal["airline", "origin", "destination", "weekday", "hour"]] = [] # Leer = eine Zeile über alle Treffer.
+    percentiles: bool = False # Perzentile brauchen einen Scan über alle passenden Flüge. Ohne werden die Kennzahlen aus den Rollups gelesen.
+
+class FlightStats(BaseModel): # Eine Ergebniszeile von POST /flights/stats. Gruppenfelder sind nur gesetzt, wenn danach gruppiert wurde.
+    airline: Optional[str] = None
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    weekday: Optional[str] = None
+    hour: Optional[int] = None
+    count: int # Anzahl Flüge in der Gruppe.
+    avg_departure_delay: Optional[float] = None # Verspätungen in Minuten.
+    std_departure_delay: Optional[float] = None # Standardabweichung.
+    p50_departure_delay: Optional[float] = None # Perzentile nur mit percentiles=true und PostgreSQL, sonst None.
+    p90_departure_delay: Optional[float] = None
+    avg_arrival_delay: Optional[float] = None
+    std_arrival_delay: Optional[float] = None
+    p50_arrival_delay: Optional[float] = None
+    p90_arrival_delay: Optional[float] = None
+    cancelled_rate: Optional[float] = None # Anteil ausgefallener Flüge (0..1).
 
 class FlightCreate(BaseModel): # Pydantic-Schema für die Daten, die beim Hinzufügen eines neuen Fluges erwartet werden. 
     flight_id: str # flight_id ist hier zwingend erforderlich, alles andere ist optional!
@@ -144,21 +216,33 @@ class FlightCreate(BaseModel): # Pydantic-Schema für die Daten, die beim Hinzuf
     hour: Optional[int] = None
     cancelled: Optional[bool] = None
 
+class FlightBulkDelete(BaseModel): # Body für POST /flights/bulk/delete
+    flight_ids: List[str]
+
+class BulkItem(BaseModel): # Ergebnis pro Eintrag eines Bulk-Requests (gleiche Reihenfolge wie im Request).
+    flight_id: str
+    status: str # add: created / exists / duplicate, delete: deleted / not_found / duplicate
+
+class BulkResult(BaseModel):
+    counts: dict # Anzahl pro Status
+    items: List[BulkItem]
+
 # Endpunkte
 @app.post("/register", response_model=UserOut) # Endpunkt für die Registrierung neuer User.
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Domain-Prüfung für die E-Mail --> groß / klein schreibung ist egal --> .lower()
     if not user.email.lower().endswith("@flughafenabc"):
         raise HTTPException(status_code=400, detail="Registrierung nur mit @FlughafenABC E-Mail erlaubt!")  
     # Prüfen ob User bereits existiert
-    if db.query(User).filter(User.username == user.username).first(): # Hier hätte man auch den Primary Key auf den Username setzen können. --> Macht man aber eigenlich nicht da es ja sein könnte, dass man den username ändern möchte... auch wenn ich das nicht implementiert habe...
+    if (await db.execute(select(User).where(User.username == user.username))).scalars().first(): # Hier hätte man auch den Primary Key auf den Username setzen können. --> Macht man aber eigenlich nicht da es ja sein könnte, dass man den username ändern möchte... auch wenn ich das nicht implementiert habe...
         raise HTTPException(status_code=400, detail="Username bereits vergeben")
+    await db.rollback() # Lesetransaktion beenden --> Verbindung zurück in den DB-Pool, solange bcrypt rechnet (sonst leert ein Login-Schwung den Pool)
     
     # 2FA Secret generieren (Duo Mobile TOTP)
     otp_secret = pyotp.random_base32() # Dieses Secret wird später im Dashboard als QR-Code angezeigt und mit Duo Mobile gescannt.
     
     # Passwort hashen und User anlegen
-    hashed_pwd = pwd_context.hash(user.password) # Hashing des Passworts mit Bcrypt. --> bedeutet nur verschlüselt gespeichert wird. --> Sicherheit
+    hashed_pwd = await password_job(password_pool.hash(user.password)) # Hashing des Passworts mit Bcrypt. --> bedeutet nur verschlüselt gespeichert wird. --> Sicherheit
     new_user = User(
         username=user.username, 
         email=user.email, 
@@ -166,61 +250,482 @@ def register_user(user: UserCreate, db: Session = Depends(get_db)):
         otp_secret=otp_secret # Speichert das Secret für Duo Mobile.
     )
     db.add(new_user) # Das neue User-Objekt wird für die Datenbank vorgemerkt.
-    db.commit() # db.commit() schreibt die Daten permanent in die PostgreSQL-Tabelle.
-    db.refresh(new_user) # Lädt die von der Datenbank generierte ID (Auto-Increment) zurück in das Objekt.
+    await db.commit() # db.commit() schreibt die Daten permanent in die PostgreSQL-Tabelle.
+    await db.refresh(new_user) # Lädt die von der Datenbank generierte ID (Auto-Increment) zurück in das Objekt.
     return new_user
 
 @app.post("/login", response_model=Token) # Endpunkt für Login mit OAuth2 und Duo Mobile (TOTP).
-def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     # User suchen. --> # .first() gibt das User-Objekt zurück oder 'None', falls der Name nicht existiert.
-    user = db.query(User).filter(User.username == user_data.username).first()
+    user = (await db.execute(select(User).where(User.username == user_data.username))).scalars().first()
+    hashed_password, otp_secret = (user.hashed_password, user.otp_secret) if user else (None, None)
+    await db.rollback() # Verbindung zurück in den DB-Pool, bevor auf bcrypt gewartet wird (rollback verwirft user --> Werte vorher kopiert)
     
     # Passwort-Check --> # pwd_context.verify vergleicht das eingegebene Klartext-Passwort mit dem Bcrypt-Hash aus der DB.
-    if not user or not pwd_context.verify(user_data.password, user.hashed_password):
+    # bcrypt ist absichtlich langsam (CPU) --> im Prozess-Pool (password_pool.py), sonst stünde die Event-Loop und damit alle anderen Requests.
+    if not user or not await password_job(password_pool.verify(user_data.password, hashed_password)):
         raise HTTPException(status_code=401, detail="Ungültiger Username oder Passwort") # generischer Fehler. Best practice, so weiß niemand ob der Username oder das Passwort falsch war.
     
     # Zwei-Faktor-Check (Duo Mobile Code wird erzwungen)
-    if user.otp_secret:
+    if otp_secret:
         if not user_data.otp_code: # Falls Name/Passwort korrekt, aber das Feld für den Duo-Code leer ist
             raise HTTPException(status_code=401, detail="Duo Code benötigt!")
         
-        totp = pyotp.TOTP(user.otp_secret)  # initialisieren des TOTP (Time-based One-Time Password) mit dem gespeicherten Secret.
+        totp = pyotp.TOTP(otp_secret)  # initialisieren des TOTP (Time-based One-Time Password) mit dem gespeicherten Secret.
         if not totp.verify(user_data.otp_code): # totp.verify prüft, ob der vom User eingegebene 6-stellige Code mit dem aktuell gültigen Code übereinstimmt.
             raise HTTPException(status_code=401, detail="  Falscher Duo-Code!") # Fehler, wenn der Code nicht stimmt.
 
     # 3. OAuth2 Token erstellen
-    access_token = create_access_token(data={"sub": user.username}) # Wenn beide Faktoren (Passwort + Duo) korrekt sind, wird ein JWT-Token erstellt.
+    access_token = create_access_token(data={"sub": user_data.username}) # Wenn beide Faktoren (Passwort + Duo) korrekt sind, wird ein JWT-Token erstellt.
     return {"access_token": access_token, "token_type": "bearer"} # Gibt den Token zurück. Das Dashboard speichert diesen im "session_state". --> erkläre ich im dashboard.py-code :)
 
+# Projektion & schnelle Serialisierung für Flug-Abfragen
+# Lesende Endpunkte holen die Spalten mit SQLAlchemy Core (keine Flight-Objekte, keine Identity-Map)
+# und schreiben die Zeilen direkt mit orjson als JSON --> keine Pydantic-Validierung pro Zeile.
+# Mit ?fields=flight_id,origin,destination werden nur diese Spalten gelesen und zurückgegeben.
+FLIGHT_FIELDS = list(FlightBase.model_fields) # Alle erlaubten Feldnamen (gleiche Reihenfolge wie FlightBase).
+
+def select_columns(fields: Optional[str]): # Übersetzt "?fields=a,b,c" in die passenden Tabellenspalten.
+    if not fields: return [Flight.__table__.c[f] for f in FLIGHT_FIELDS]
+    names = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in names if f not in FLIGHT_FIELDS]
+    if unknown: raise HTTPException(400, f"Unbekannte Felder: {', '.join(unknown)}. Erlaubt: {', '.join(FLIGHT_FIELDS)}")
+    if "flight_id" not in names: names.insert(0, "flight_id") # flight_id ist immer dabei (Schlüssel + Cursor).
+    return [Flight.__table__.c[f] for f in dict.fromkeys(names)] # dict.fromkeys entfernt doppelte Felder, Reihenfolge bleibt.
+
+def encode_json(content) -> bytes: # orjson, Zeit zählt als "encode" im Server-Timing/GET /metrics.
+    with metrics.encoding(): return orjson.dumps(content)
+
+def json_response(content) -> Response: # Fertig kodierte JSON-Antwort --> FastAPI validiert/kodiert nicht noch einmal.
+    return body_response(encode_json(content))
+
+def body_response(body: bytes, etag: Optional[str] = None) -> Response: # Antwort aus bereits kodierten Bytes (z.B. aus dem Cache).
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
+
+# Bedingte Anfragen: Antworten tragen ein ETag (cache.py, aus Versionszählern im Speicher). Schickt der Client es als If-None-Match zurück
+# und hat sich nichts geändert --> 304 ohne Body, ohne Datenbank und ohne Kodierung. Das ETag wird vor der Abfrage berechnet:
+# ändert sich währenddessen etwas, passt es beim nächsten Mal nicht mehr (im Zweifel ein 200 zu viel, nie ein falsches 304).
+# Die Suche ist ein POST, ändert aber nichts --> wird hier wie ein GET behandelt.
+def etag_headers(etag: Optional[str]):
+    return {"ETag": etag, "Cache-Control": "no-cache"} if etag else None # no-cache: Client darf speichern, muss aber nachfragen
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool: # If-None-Match: "a", W/"b" oder * (schwacher Vergleich wie bei GET)
+    if not if_none_match: return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
+
+async def refresh_cache_generation(db): # Neue Ingestion seit dem letzten Blick? --> Cache leeren. Fragt die DB nur alle paar Sekunden.
+    if flight_cache.generation_due(): await db.run_sync(flight_cache.refresh_generation)
+
+async def refresh_memory_index(index, db): # airport_index/autocomplete_index neu bauen, wenn seit dem letzten Bau neu geladen wurde.
+    await refresh_cache_generation(db)
+    if index.generation != flight_cache.generation: await db.run_sync(index.rebuild, flight_cache.generation)
+
 @app.get("/flights/{flight_id}", response_model=FlightBase) # Definiert einen GET-Endpunkt zum Abrufen eines einzelnen Fluges anhand seiner ID.
-def get_flight(flight_id: str, db: Session = Depends(get_db)): # Nimmt flight_id aus der URL und die DB-Session über Dependency Injection entgegen.
-    f = db.query(Flight).filter(Flight.flight_id == flight_id).first() # Führt die Datenbankabfrage durch (suche nach Primary Key).
-    if not f: raise HTTPException(404,"Flug nicht gefunden") # Falls kein Flug gefunden wird, wird der HTTP-Fehler 404 zurückgegeben.
-    return f # Gibt das gefundene Flight-Objekt zurück.
-
-@app.post("/flights/search", response_model=List[FlightBase]) # Definiert einen POST-Endpunkt für komplexe Suchanfragen. Gibt eine Liste von Flügen zurück.
-def search_flights(s: FlightSearch, db: Session = Depends(get_db)): # Nimmt das FlightSearch-Schema (Suchkriterien) und die DB-Session entgegen.
-    q = db.query(Flight) # Beginnt die Datenbankabfrage auf das Flight-Modell.
-    if s.airline: q = q.filter(Flight.airline_id==s.airline) # Fügt einen Filter hinzu, wenn das Suchkriterium "airline" vorhanden ist.
-    if s.origin: q = q.filter(Flight.origin==s.origin) # Fügt einen Filter hinzu, wenn das Suchkriterium "origin" vorhanden ist.
-    if s.destination: q = q.filter(Flight.destination==s.destination) # Fügt einen Filter hinzu, wenn das Suchkriterium "destination" vorhanden ist.
-    if s.weekday: q = q.filter(Flight.weekday==s.weekday) # Fügt einen Filter hinzu, wenn das Suchkriterium "weekday" vorhanden ist.
-    return q.all() # Führt die endgültige Abfrage aus und gibt alle passenden Ergebnisse zurück.
+async def get_flight(flight_id: str, fields: Optional[str] = None, if_none_match: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)): # Nimmt flight_id aus der URL, optional die gewünschten Felder und die DB-Session über Dependency Injection entgegen.
+    columns = select_columns(fields) # Prüft die Felder auch bei einem Cache-Treffer.
+    await refresh_cache_generation(db)
+    etag = flight_cache.flight_etag(flight_id, fields)
+    if etag_matches(if_none_match, etag): return not_modified(etag) # Client hat diese Version schon (gelöschter Flug --> neue Version, also kein 304).
+    key = flight_cache.flight_key(flight_id, fields)
+    body = flight_cache.get(key) # Treffer --> fertiger JSON-Body, keine Datenbankabfrage.
+    if body is None:
+        epoch = flight_cache.epoch
+        row = (await db.execute(select(*columns).where(Flight.flight_id == flight_id))).mappings().first() # Führt die Datenbankabfrage durch (suche nach Primary Key).
+        if not row: raise HTTPException(404,"Flug nicht gefunden") # Falls kein Flug gefunden wird, wird der HTTP-Fehler 404 zurückgegeben.
+        body = encode_json(dict(row))
+        if flight_cache.epoch == epoch: flight_cache.set(key, body, ("flight", flight_id)) # Veraltetes nicht cachen.
+    return body_response(body, etag) # Gibt den gefundenen Flug zurück.
+
+# Paginierung & Streaming für die Suche
+# Keyset-Paginierung: statt OFFSET wird "flight_id > letzte flight_id der vorherigen Seite" abgefragt.
+# Das nutzt den Primary-Key-Index --> jede Seite ist gleich schnell, egal wie weit man schon geblättert hat.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+STREAM_BATCH = 1000 # So viele Zeilen holt der serverseitige Cursor beim Streaming auf einmal.
+NDJSON = "application/x-ndjson" # Eine JSON-Zeile pro Flug.
+
+def encode_cursor(flight_id: str) -> str: # Cursor ist die letzte flight_id der Seite, URL-sicher kodiert.
+    return base64.urlsafe_b64encode(flight_id.encode()).decode()
+
+def decode_cursor(cursor: str) -> str:
+    try: return base64.b64decode(cursor.encode(), altchars=b"-_", validate=True).decode()
+    except Exception: raise HTTPException(400, "Ungültiger Cursor")
+
+def search_conditions(s: FlightSearch): # Übersetzt die Suchkriterien in WHERE-Bedingungen. Wird von allen Such-Varianten genutzt.
+    conds = []
+    if s.airline: conds.append(Flight.airline_id==s.airline) # Fügt einen Filter hinzu, wenn das Suchkriterium "airline" vorhanden ist.
+    if s.origin: conds.append(Flight.origin==s.origin) # Fügt einen Filter hinzu, wenn das Suchkriterium "origin" vorhanden ist.
+    if s.destination: conds.append(Flight.destination==s.destination) # Fügt einen Filter hinzu, wenn das Suchkriterium "destination" vorhanden ist.
+    if s.weekday: conds.append(Flight.weekday==s.weekday) # Fügt einen Filter hinzu, wenn das Suchkriterium "weekday" vorhanden ist.
+    if s.departure_from: conds.append(Flight.scheduled_departure >= s.departure_from) # Zeitfenster: halboffen, "to" gehört nicht mehr dazu.
+    if s.departure_to: conds.append(Flight.scheduled_departure < s.departure_to)
+    if s.arrival_from: conds.append(Flight.scheduled_arrival >= s.arrival_from)
+    if s.arrival_to: conds.append(Flight.scheduled_arrival < s.arrival_to)
+    if s.hour_from is not None and s.hour_to is not None and s.hour_from > s.hour_to: # Über Mitternacht: 22-5 = ab 22 Uhr ODER bis 5 Uhr.
+        conds.append((Flight.hour >= s.hour_from) | (Flight.hour <= s.hour_to))
+    else:
+        if s.hour_from is not None: conds.append(Flight.hour >= s.hour_from)
+        if s.hour_to is not None: conds.append(Flight.hour <= s.hour_to)
+    origins, destinations = region_codes(s.origin_near, s.origin), region_codes(s.destination_near, s.destination)
+    if origins is not None: conds.append(Flight.origin.in_(origins)) # Keine Entfernung pro Zeile: nur IN über die vorher gefundenen Codes.
+    if destinations is not None: conds.append(Flight.destination.in_(destinations))
+    return conds
+
+def region_codes(circle: Optional[GeoCircle], code: Optional[str]): # Flughafen-Codes im Umkreis (None = kein Umkreis-Filter).
+    if circle is None: return None
+    codes = airport_index.codes_within(circle.lat, circle.lon, circle.radius_km)
+    return [c for c in codes if c == code] if code else codes # Zusätzlich ein fester Code gesetzt --> nur der, wenn er im Umkreis liegt.
+
+def has_time_window(s: FlightSearch) -> bool: # Zeit- oder Uhrzeit-Fenster gesetzt? --> die Rollups kennen keine Daten, nur Stunden als Gruppe.
+    return any(v is not None for v in (s.departure_from, s.departure_to, s.arrival_from, s.arrival_to, s.hour_from, s.hour_to))
+
+def search_filters(s: FlightSearch) -> dict: # Alle Prädikate aus search_conditions als {spalte: wert} --> für das Protokoll der Suchmuster.
+    filters = {col: getattr(s, field) for field, col in SEARCH_FILTER_COLUMNS.items() if getattr(s, field)}
+    for column, circle, code in (("origin", s.origin_near, s.origin), ("destination", s.destination_near, s.destination)):
+        codes = region_codes(circle, code)
+        if codes is not None: filters[column] = list_value(codes) # Region --> IN-Liste statt eines Codes
+    for column, low, high in (("scheduled_departure", s.departure_from, s.departure_to), ("scheduled_arrival", s.arrival_from, s.arrival_to),
+                              ("hour", s.hour_from, s.hour_to)):
+        if low is not None or high is not None: filters[column] = range_value(low, high)
+    return filters
+
+def stream_flights(columns, conds): # Generator für NDJSON: liest die Treffer über einen serverseitigen Cursor in Paketen und gibt sie sofort weiter.
+    # Eigene Verbindung statt der Request-Session, weil der Generator erst nach dem Endpunkt (beim Senden der Antwort) läuft.
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=STREAM_BATCH).execute(select(*columns).where(*conds))
+        keys = list(result.keys())
+        for rows in result.partitions(): # Speicher bleibt bei STREAM_BATCH Zeilen, egal wie viele Treffer es gibt.
+            yield b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n" for row in rows)
+
+async def stream_flights_async(columns, conds): # Dasselbe mit der asynchronen Engine (DB_ASYNC=1).
+    async with async_engine.connect() as conn:
+        result = await conn.stream(select(*columns).where(*conds).execution_options(yield_per=STREAM_BATCH))
+        keys = list(result.keys())
+        async for rows in result.partitions(STREAM_BATCH):
+            yield b"".join(orjson.dumps(dict(zip(keys, row))) + b"\n" for row in rows)
+
+def columnar_response(stmt, columns, fmt: str, download=False, etag=None) -> StreamingResponse: # Arrow-Stream bzw. Parquet, Batch für Batch aus COPY.
+    media_type, extension = arrow_export.FORMATS[fmt]
+    stream = (arrow_export.stream_export_async if DB_ASYNC else arrow_export.stream_export)(stmt, columns, fmt)
+    headers = {"Content-Disposition": f'attachment; filename="flights.{extension}"'} if download else {}
+    return StreamingResponse(stream, media_type=media_type, headers={**headers, **(etag_headers(etag) or {})})
+
+@app.post("/flights/search", response_model=FlightPage) # Definiert einen POST-Endpunkt für komplexe Suchanfragen. Gibt eine Seite von Flügen zurück.
+async def search_flights(s: FlightSearch, # Nimmt das FlightSearch-Schema (Suchkriterien) und die DB-Session entgegen.
+                   limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), # Seitengröße.
+                   cursor: Optional[str] = None, # next_cursor der vorherigen Seite.
+                   accept: Optional[str] = Header(None), # "Accept: application/x-ndjson" (bzw. Arrow/Parquet) --> alle Treffer als Stream statt Seite.
+                   fields: Optional[str] = None, # Nur diese Felder zurückgeben, z.B. "origin,destination,departure_delay".
+                   if_none_match: Optional[str] = Header(None), # ETag einer früheren Antwort auf dieselbe Suche --> ggf. 304.
+                   db: AsyncSession = Depends(get_db)):
+    if s.origin_near or s.destination_near: await refresh_memory_index(airport_index, db)
+    columns = select_columns(fields)
+    conds = search_conditions(s)
+    if cursor: conds.append(Flight.flight_id > decode_cursor(cursor)) # Keyset: nur Flüge nach dem Cursor.
+    if accept and NDJSON in accept: # Streams werden nicht gecacht (beliebig groß).
+        search_patterns.record(search_filters(s)) # Laufzeit hängt am Client (Stream) --> nur zählen.
+        return StreamingResponse((stream_flights_async if DB_ASYNC else stream_flights)(columns, conds), media_type=NDJSON)
+    fmt = arrow_export.negotiate(accept)
+    if fmt: # "Accept: application/vnd.apache.arrow.stream" bzw. "application/vnd.apache.parquet": alle Treffer spaltenweise, wie NDJSON ohne Cache.
+        search_patterns.record(search_filters(s))
+        return columnar_response(select(*columns).where(*conds), columns, fmt)
+    await refresh_cache_generation(db)
+    payload = s.model_dump()
+    key = flight_cache.search_key(payload, limit=limit, cursor=cursor, fields=fields) # Normalisierte Suche + Seite als Schlüssel.
+    etag = flight_cache.search_etag(key)
+    if etag_matches(if_none_match, etag): return not_modified(etag)
+    body = flight_cache.get(key)
+    if body is None:
+        epoch = flight_cache.epoch # Stand vor der Abfrage. Ändert sich in der Zwischenzeit ein Flug, ist das Ergebnis evtl. schon veraltet.
+        async def run_search(): # Nur der erste von mehreren gleichen gleichzeitigen Requests führt das aus, die anderen bekommen denselben Body.
+            started = time.perf_counter()
+            result = await db.execute(select(*columns).where(*conds).order_by(Flight.flight_id).limit(limit + 1)) # Ein Flug mehr als nötig --> so weiß man, ob es eine weitere Seite gibt.
+            keys = list(result.keys())
+            rows = [dict(zip(keys, row)) for row in result] # Reine Dicts statt ORM-Objekte.
+            search_patterns.record(search_filters(s), time.perf_counter() - started) # Nur Abfragen, die wirklich an die DB gehen (keine Cache-Treffer).
+            next_cursor = encode_cursor(rows[limit - 1]["flight_id"]) if len(rows) > limit else None
+            body = encode_json({"items": rows[:limit], "next_cursor": next_cursor})
+            if flight_cache.epoch == epoch: flight_cache.set(key, body, flight_cache.search_tag(payload)) # Veraltetes nicht cachen.
+            return body
+        body = await search_flight.run(key, run_search, epoch)
+    return body_response(body, etag)
+
+@app.post("/flights/export") # Treffer einer Suche als Datei für Analyse-Tools (pandas, Polars, DuckDB, ...): Arrow IPC-Stream oder Parquet.
+async def export_flights(s: FlightSearch,
+                         fmt: Literal["arrow", "parquet"] = Query("arrow", alias="format"),
+                         fields: Optional[str] = None, # Wie bei der Suche: nur diese Spalten.
+                         limit: Optional[int] = Query(None, ge=1), # Ohne limit: alle Treffer (ungeordnet). Mit limit: die ersten nach flight_id.
+                         after: Optional[str] = None, # Blättern (Dashboard): nur Flüge mit flight_id > after, mit limit = die nächste Seite.
+                         if_none_match: Optional[str] = Header(None),
+                         db: AsyncSession = Depends(get_db)):
+    if s.origin_near or s.destination_near: await refresh_memory_index(airport_index, db)
+    columns = select_columns(fields)
+    etag = None
+    if limit: # Nur Seiten (sortiert nach flight_id) haben ein ETag: ohne limit ist die Reihenfolge nicht fest --> nicht Byte für Byte gleich.
+        await refresh_cache_generation(db)
+        etag = flight_cache.search_etag(flight_cache.search_key(s.model_dump(), format=fmt, fields=fields, limit=limit, after=after))
+        if etag_matches(if_none_match, etag): return not_modified(etag)
+    stmt = select(*columns).where(*search_conditions(s))
+    if after is not None: stmt = stmt.where(Flight.flight_id > after)
+    if limit: stmt = stmt.order_by(Flight.flight_id).limit(limit)
+    search_patterns.record(search_filters(s))
+    return columnar_response(stmt, columns, fmt, download=True, etag=etag)
+
+# Aggregierte Statistiken
+# Die Datenbank rechnet Anzahl, Mittelwerte, Perzentile und Ausfallquote per GROUP BY aus.
+# Übertragen wird nur eine Zeile pro Gruppe statt aller Flüge --> Kilobytes statt Megabytes.
+# Ohne Perzentile reichen die vorberechneten Summen aus flight_rollups --> es wird gar nicht über flights gescannt.
+GROUP_COLUMNS = {"airline": Flight.airline_id, "origin": Flight.origin, "destination": Flight.destination, "weekday": Flight.weekday, "hour": Flight.hour} # "airline" filtert/gruppiert wie die Suche auf airline_id.
+
+def postgres_only(expr, db: AsyncSession): # percentile_cont/stddev_pop gibt es nur in PostgreSQL --> in SQLite (Tests) bleibt das Feld leer.
+    return expr if db.get_bind().dialect.name == "postgresql" else literal(None)
+
+def percentile(p: float, column, db: AsyncSession):
+    return postgres_only(func.percentile_cont(p).within_group(column), db)
+
+@app.post("/flights/stats", response_model=List[FlightStats]) # Aggregationen über dieselben Filter wie /flights/search.
+async def flight_stats(s: FlightStatsQuery, db: AsyncSession = Depends(get_db)):
+    group_by = list(dict.fromkeys(s.group_by)) # Doppelte Angaben ignorieren.
+    if s.origin_near or s.destination_near: await refresh_memory_index(airport_index, db)
+    if not s.percentiles and not has_time_window(s): # Schneller Weg: Summen aus den Rollups addieren (ohne Zeitfenster).
+        filters = {"airline_id": s.airline, "origin": s.origin, "destination": s.destination, "weekday": s.weekday}
+        filters = {k: v for k, v in filters.items() if v}
+        for column, codes in (("origin", region_codes(s.origin_near, s.origin)), ("destination", region_codes(s.destination_near, s.destination))):
+            if codes is not None: filters[column] = codes # Liste --> IN (...) in query_rollups
+        return json_response(await db.run_sync(rollups.query_rollups, filters, group_by))
+    groups = [GROUP_COLUMNS[g].label(g) for g in group_by] # Gruppenspalten.
+    aggregates = [ # nicht "metrics": das ist das Modul metrics.py
+        func.count().label("count"),
+        func.avg(Flight.departure_delay).label("avg_departure_delay"),
+        postgres_only(func.stddev_pop(Flight.departure_delay), db).label("std_departure_delay"),
+        percentile(0.5, Flight.departure_delay, db).label("p50_departure_delay"),
+        percentile(0.9, Flight.departure_delay, db).label("p90_departure_delay"),
+        func.avg(Flight.arrival_delay).label("avg_arrival_delay"),
+        postgres_only(func.stddev_pop(Flight.arrival_delay), db).label("std_arrival_delay"),
+        percentile(0.5, Flight.arrival_delay, db).label("p50_arrival_delay"),
+        percentile(0.9, Flight.arrival_delay, db).label("p90_arrival_delay"),
+        func.avg(case((Flight.cancelled, 1.0), else_=0.0)).cast(Float).label("cancelled_rate"), # cast: avg über Zahlenliterale wäre sonst NUMERIC (Decimal).
+    ]
+    stmt = select(*groups, *aggregates).where(*search_conditions(s))
+    if groups: stmt = stmt.group_by(*groups).order_by(*groups)
+    started = time.perf_counter()
+    result = await db.execute(stmt)
+    keys = list(result.keys())
+    rows = [dict(zip(keys, row)) for row in result]
+    search_patterns.record(search_filters(s), time.perf_counter() - started)
+    return json_response(rows)
+
+# Perzentile aus Sketches (sketches.py)
+# Pro Airline/Route/Wochentag liegen die Verspätungen als Bucket-Zählungen im Speicher. Jede Gruppierung entsteht durch Addieren
+# der passenden Zellen --> Millisekunden statt Sortieren aller Flüge, dafür höchstens SKETCH_ALPHA (1 %) relative Abweichung.
+class PercentileQuery(BaseModel): # Filter wie FlightSearch, aber nur die Zell-Spalten (keine Zeitfenster: die Sketches kennen keine Daten/Stunden).
+    airline: Optional[str] = None
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    weekday: Optional[str] = None
+    origin_near: Optional[GeoCircle] = None
+    destination_near: Optional[GeoCircle] = None
+    group_by: List[Literal["airline", "origin", "destination", "weekday"]] = [] # Leer = eine Zeile über alle Treffer.
+    quantiles: List[float] = Field([0.5, 0.9, 0.99], min_length=1, max_length=20) # 0..1, Antwortfelder p50, p90, p99, ...
+
+@app.post("/flights/percentiles") # p50/p90/p99 (bzw. quantiles) von departure_delay und arrival_delay, pro Gruppe.
+async def flight_percentiles(s: PercentileQuery, db: AsyncSession = Depends(get_db)):
+    if any(not 0 <= q <= 1 for q in s.quantiles): raise HTTPException(400, "quantiles müssen zwischen 0 und 1 liegen")
+    if s.origin_near or s.destination_near: await refresh_memory_index(airport_index, db)
+    await refresh_memory_index(sketch_index, db) # Erste Abfrage bzw. neue Ingestion --> Sketch-Tabelle einmal lesen
+    filters = {k: v for k, v in {"airline_id": s.airline, "origin": s.origin, "destination": s.destination, "weekday": s.weekday}.items() if v}
+    for column, codes in (("origin", region_codes(s.origin_near, s.origin)), ("destination", region_codes(s.destination_near, s.destination))):
+        if codes is not None: filters[column] = codes
+    return json_response(sketch_index.query(filters, list(dict.fromkeys(s.group_by)), list(dict.fromkeys(s.quantiles))))
 
 @app.post("/flights/add", response_model=FlightBase) # Definiert einen POST-Endpunkt zum Hinzufügen eines neuen Flugdatensatzes.
-def add_flight(f: FlightCreate, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)): # Geschützt durch OAuth2 Token !!!!!! --> dieses ist 300 min gültig.
-    if db.get(Flight, f.flight_id): # Prüft, ob ein Flug mit dieser flight_id bereits existiert (Duplikatprüfung). --> Primary Key nutzen! Empfehlung von Max :)
+async def add_flight(f: FlightCreate, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)): # Geschützt durch OAuth2 Token !!!!!! --> dieses ist 300 min gültig.
+    if await db.get(Flight, f.flight_id): # Prüft, ob ein Flug mit dieser flight_id bereits existiert (Duplikatprüfung). --> Primary Key nutzen! Empfehlung von Max :)
         raise HTTPException(400,"Flug mit dieser flight_id existiert bereits") # Gibt Fehler 400 zurück, falls der Flug bereits existiert.
-    new = Flight(**f.dict()) # Erstellt ein neues SQLAlchemy Flight-Modell-Objekt aus den empfangenen Pydantic-Daten.
-    db.add(new) # Markiert das neue Objekt für das Einfügen (Insertion) in die Datenbank.
-    db.commit() #  db.commit!!!!!: Schreibt die vorgemerkte Änderung (den neuen Flug) permanent in die Datenbank.
-    db.refresh(new) # Aktualisiert das Objekt, um Werte abzurufen, die von der DB generiert wurden (wichtig nach dem Commit).
-    return new # Gibt das neu hinzugefügte Objekt zurück.
+    values = f.dict() # Einmal als Dict --> für Insert, Rollups, Sketches, Cache und Indizes.
+    # Einfügen wie beim Bulk (ON CONFLICT DO NOTHING, zählt Rollups und Verspätungs-Buckets in derselben Transaktion mit).
+    # Nichts eingefügt --> ein paralleler Request hat die flight_id gerade angelegt (auch in einer anderen Monats-Partition).
+    if not await db.run_sync(bulk_insert_flights, [values]):
+        raise HTTPException(400,"Flug mit dieser flight_id existiert bereits")
+    writes = await db.run_sync(flight_cache.bump_writes) # Schreibzähler in der DB --> andere API-Prozesse leeren ihren Cache (cache.py).
+    await db.commit() #  db.commit!!!!!: Schreibt die vorgemerkte Änderung (den neuen Flug) permanent in die Datenbank.
+    flight_cache.invalidate_flight(values) # Erst nach dem Commit: Cache-Einträge entfernen, die diesen Flug enthalten könnten.
+    flight_cache.wrote(writes)
+    sketch_index.apply_flights([values], +1) # Perzentile im Speicher nachziehen.
+    airport_index.add_flights([values]) # Neuer Flughafen? --> sofort in der Umkreissuche.
+    autocomplete_index.add_flights([values]) # ... und in den Vorschlägen.
+    return await db.get(Flight, values["flight_id"]) # Liest den Flug nach dem Commit so, wie er in der Datenbank steht, und gibt ihn zurück.
 
 @app.delete("/flights/{flight_id}") # Definiert einen DELETE-Endpunkt zum Löschen eines Fluges anhand seiner ID.
-def delete_flight(flight_id: str, db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)): #  Geschützt durch OAuth2 Token!!! wie zuvor --> Mehr Sicherheit
-    f = db.query(Flight).filter(Flight.flight_id==flight_id).first() # Sucht den zu löschenden Flug.
+async def delete_flight(flight_id: str, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)): #  Geschützt durch OAuth2 Token!!! wie zuvor --> Mehr Sicherheit
+    f = await db.get(Flight, flight_id) # Sucht den zu löschenden Flug.
     if not f: raise HTTPException(404,"Flug nicht gefunden") # Fehler 404, wenn der Flug nicht existiert.
-    db.delete(f) # Markiert das gefundene Objekt zum Löschen.
-    db.commit() # db. commit!!! Führt die Löschung permanent in der Datenbank durch.
-    return {"detail": f"Flug {flight_id} gelöscht"}
\ No newline at end of file
+    values = rollups.flight_values(f) # Werte merken, bevor das Objekt gelöscht wird.
+    await db.delete(f) # Markiert das gefundene Objekt zum Löschen.
+    await db.run_sync(rollups.apply_flights, [values], -1) # Flug aus seiner Rollup-Zelle herausrechnen (gleiche Transaktion).
+    await db.run_sync(sketches.apply_flights, [values], -1)
+    writes = await db.run_sync(flight_cache.bump_writes)
+    await db.commit() # db. commit!!! Führt die Löschung permanent in der Datenbank durch.
+    flight_cache.invalidate_flight(values) # Cache-Einträge entfernen, die diesen Flug enthalten könnten.
+    flight_cache.wrote(writes)
+    sketch_index.apply_flights([values], -1)
+    return {"detail": f"Flug {flight_id} gelöscht"}
+
+# Bulk-Endpunkte
+# Statt pro Flug get + INSERT + commit + refresh (mehrere Round-Trips pro Flug) wird pro Paket von BULK_CHUNK Flügen
+# genau ein Statement geschickt: ein mehrzeiliges INSERT ... ON CONFLICT DO NOTHING RETURNING flight_id bzw.
+# DELETE ... WHERE flight_id = ANY(:ids) RETURNING *. Duplikate: eine ID-Abfrage pro Paket, dazu ON CONFLICT DO NOTHING (PostgreSQL: im
+# INSERT-Trigger der View flights, siehe dimensions.py) --> ein gleichzeitig eingefügter Flug wird "exists" statt eines Fehlers.
+# Alles läuft in einer Transaktion --> entweder der ganze Request oder gar nichts.
+BULK_CHUNK = 1000 # Flüge pro Statement (~30 Spalten --> 30.000 Parameter, PostgreSQL erlaubt 65.535, SQLite 32.766)
+BULK_MAX_ITEMS = 100000 # Größere Requests bitte aufteilen (Dashboard schickt Pakete)
+
+def chunked(items: list, size: int = BULK_CHUNK):
+    for i in range(0, len(items), size): yield items[i:i + size]
+
+def bulk_statuses(ids: List[str], found: set, hit: str, miss: str) -> BulkResult: # Status pro Eintrag, Wiederholungen im Request --> duplicate
+    seen, items, counts = set(), [], {}
+    for fid in ids:
+        status = "duplicate" if fid in seen else hit if fid in found else miss
+        seen.add(fid)
+        items.append({"flight_id": fid, "status": status})
+        counts[status] = counts.get(status, 0) + 1
+    return {"counts": counts, "items": items}
+
+def bulk_insert_flights(session: Session, rows: List[dict]) -> set:
+    # Läuft synchron über db.run_sync (wie rollups.apply_flights). Gibt die tatsächlich eingefügten flight_ids zurück.
+    table = Flight.__table__
+    ins = (pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert)(table)
+    # SQLite: flights ist eine Tabelle, ON CONFLICT greift direkt. PostgreSQL: flights ist eine View, deren INSTEAD OF-Trigger das ON CONFLICT
+    # hier ignoriert --> der Trigger fügt selbst mit ON CONFLICT DO NOTHING ein und lässt übersprungene Zeilen aus dem RETURNING weg.
+    stmt = ins.on_conflict_do_nothing().returning(table.c.flight_id)
+    created = set()
+    # Sortiert nach flight_id: der Trigger sperrt pro flight_id --> zwei parallele Bulks sperren in derselben Reihenfolge (kein Deadlock).
+    for chunk in chunked(sorted(rows, key=lambda r: r["flight_id"])):
+        # Vorhandene IDs vorher mengenbasiert aussortieren (spart Trigger-Aufrufe). Verbindlich prüft erst das INSERT (Trigger bzw. Primary Key).
+        existing = set(session.execute(select(table.c.flight_id).where(table.c.flight_id.in_([r["flight_id"] for r in chunk]))).scalars())
+        chunk = [r for r in chunk if r["flight_id"] not in existing]
+        if not chunk: continue
+        # executemany mit RETURNING: SQLAlchemy ("insertmanyvalues") schickt daraus ein mehrzeiliges INSERT pro Paket,
+        # das Statement wird aber nur einmal kompiliert (ins.values(chunk) würde bei jedem Paket alle Zeilen neu kompilieren).
+        created.update(session.execute(stmt, chunk).scalars())
+    rollups.apply_flights(session, [r for r in rows if r["flight_id"] in created], +1) # Nur neue Flüge zählen
+    sketches.apply_flights(session, [r for r in rows if r["flight_id"] in created], +1)
+    return created
+
+def bulk_delete_flights(session: Session, ids: List[str]) -> List[dict]:
+    # Gibt die gelöschten Zeilen zurück (RETURNING) --> Werte für Rollups und Cache ohne zusätzliches SELECT.
+    table = Flight.__table__
+    postgres = session.get_bind().dialect.name == "postgresql"
+    deleted = []
+    for chunk in chunked(ids):
+        # PostgreSQL: ein einziger Array-Parameter statt tausend einzelner IN-Parameter
+        cond = table.c.flight_id == any_(bindparam("ids", chunk, type_=ARRAY(String))) if postgres else table.c.flight_id.in_(chunk)
+        deleted.extend(dict(r) for r in session.execute(delete(table).where(cond).returning(*table.c)).mappings())
+    rollups.apply_flights(session, deleted, -1)
+    sketches.apply_flights(session, deleted, -1)
+    return deleted
+
+@app.post("/flights/bulk", response_model=BulkResult) # Viele Flüge auf einmal hinzufügen, z.B. aus einer CSV (Dashboard).
+async def bulk_add_flights(flights: List[FlightCreate], db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    if len(flights) > BULK_MAX_ITEMS: raise HTTPException(413, f"Maximal {BULK_MAX_ITEMS} Flüge pro Request")
+    rows, seen = [], set()
+    for f in flights: # Je flight_id nur das erste Vorkommen einfügen, Wiederholungen meldet bulk_statuses als duplicate
+        if f.flight_id not in seen:
+            seen.add(f.flight_id)
+            rows.append(f.dict())
+    created = await db.run_sync(bulk_insert_flights, rows)
+    writes = await db.run_sync(flight_cache.bump_writes) if created else None
+    await db.commit() # Eine Transaktion für den ganzen Request
+    flight_cache.invalidate_flights([r for r in rows if r["flight_id"] in created])
+    if writes: flight_cache.wrote(writes)
+    airport_index.add_flights([r for r in rows if r["flight_id"] in created])
+    autocomplete_index.add_flights([r for r in rows if r["flight_id"] in created])
+    sketch_index.apply_flights([r for r in rows if r["flight_id"] in created], +1)
+    return json_response(bulk_statuses([f.flight_id for f in flights], created, "created", "exists"))
+
+@app.post("/flights/bulk/delete", response_model=BulkResult) # Viele Flüge auf einmal löschen (POST, weil DELETE mit Body von vielen Clients nicht unterstützt wird).
+async def bulk_delete(body: FlightBulkDelete, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme)):
+    if len(body.flight_ids) > BULK_MAX_ITEMS: raise HTTPException(413, f"Maximal {BULK_MAX_ITEMS} Flüge pro Request")
+    deleted = await db.run_sync(bulk_delete_flights, list(dict.fromkeys(body.flight_ids)))
+    writes = await db.run_sync(flight_cache.bump_writes) if deleted else None
+    await db.commit()
+    flight_cache.invalidate_flights(deleted)
+    if writes: flight_cache.wrote(writes)
+    sketch_index.apply_flights(deleted, -1)
+    return json_response(bulk_statuses(body.flight_ids, {r["flight_id"] for r in deleted}, "deleted", "not_found"))
+
+# Umkreissuche
+# Die Flughäfen liegen in einem Gitter im Speicher (geo.py). Entfernungen werden nur für die Flughäfen in den
+# Zellen um den Punkt gerechnet, nie pro Flug. Flüge im Umkreis: POST /flights/search mit origin_near/destination_near.
+class AirportNear(BaseModel):
+    code: str
+    name: Optional[str] = None
+    lat: float
+    lon: float
+    distance_km: float
+
+class RouteRegions(BaseModel): # Zwei Regionen: "welche Routen gibt es von A nach B?"
+    origin: GeoCircle
+    destination: GeoCircle
+    group_by: List[Literal["airline", "weekday", "hour"]] = [] # Zusätzlich zu origin und destination.
+
+@app.get("/airports/near", response_model=List[AirportNear]) # Flughäfen im Umkreis, nächste zuerst.
+async def airports_near(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180),
+                        radius_km: float = Query(100, gt=0, le=20038), db: AsyncSession = Depends(get_db)):
+    await refresh_memory_index(airport_index, db)
+    return json_response(airport_index.within(lat, lon, radius_km))
+
+@app.post("/routes/between", response_model=List[FlightStats]) # Alle Routen von Region A nach Region B mit Kennzahlen aus den Rollups.
+async def routes_between(r: RouteRegions, db: AsyncSession = Depends(get_db)):
+    await refresh_memory_index(airport_index, db)
+    filters = {"origin": airport_index.codes_within(r.origin.lat, r.origin.lon, r.origin.radius_km),
+               "destination": airport_index.codes_within(r.destination.lat, r.destination.lon, r.destination.radius_km)}
+    if not filters["origin"] or not filters["destination"]: return json_response([])
+    group_by = ["origin", "destination", *dict.fromkeys(r.group_by)]
+    return json_response(await db.run_sync(rollups.query_rollups, filters, group_by))
+
+# Autovervollständigung
+# Antwortet aus Listen im Speicher (autocomplete.py), ohne Datenbank --> schnell genug für jeden Tastendruck im Dashboard.
+class Suggestion(BaseModel):
+    kind: Literal["airport", "airline", "aircraft"]
+    value: str # Wert für den Filter (Flughafen-Code, airline_id, Modell)
+    label: Optional[str] = None # Name des Flughafens/der Airline bzw. Hersteller
+
+@app.get("/autocomplete", response_model=List[Suggestion]) # Präfix (Code, Name, Wort im Namen) und Teilstring, Groß-/Kleinschreibung egal.
+async def autocomplete(q: str = Query(..., min_length=1, max_length=100), kind: Optional[Literal["airport", "airline", "aircraft"]] = None,
+                       limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_db)):
+    await refresh_memory_index(autocomplete_index, db) # Fragt die DB nur alle paar Sekunden (Generation), sonst reiner Speicherzugriff.
+    return json_response(autocomplete_index.search(q, kind, limit))
+
+@app.get("/cache/stats") # Zähler des Flug-Caches (Hits, Misses, Evictions, ...) und der zusammengefassten Suchen.
+async def cache_stats():
+    return {**flight_cache.stats(), "coalesce": search_flight.stats()}
+
+@app.get("/search/patterns") # Benutzte Filter-Kombinationen mit Anzahl und Laufzeit (Grundlage für index_advisor.py).
+async def get_search_patterns():
+    return search_patterns.patterns()
+
+@app.get("/pool/stats") # Zähler der Connection-Pools (belegte Verbindungen, Wartezeit beim Checkout, Overflow, Timeouts, ...).
+async def get_pool_stats():
+    return pool_stats()
+
+# Metriken im Prometheus-Format: eigene Histogramme (metrics.py) + Zähler von Cache und Pools, gelesen erst beim Abruf.
+CACHE_COUNTERS = ("hits", "misses", "evictions", "expirations", "invalidations", "generation_flushes", "write_flushes")
+COALESCE_COUNTERS = ("leaders", "coalesced", "window_hits", "failures")
+POOL_COUNTERS = ("checkouts", "checkins", "connects", "overflow_hits", "timeouts", "invalidations", "wait_count", "wait_sum_seconds")
+metrics.register_collector(lambda: metrics.stat_lines("flights_cache", flight_cache.stats(), "Flug-Cache (GET /cache/stats)", CACHE_COUNTERS))
+metrics.register_collector(lambda: metrics.stat_lines("flights_search_coalesce", search_flight.stats(), "Zusammengefasste Suchen (coalesce.py)", COALESCE_COUNTERS))
+metrics.register_collector(lambda: metrics.stat_lines("flights_db_pool", pool_stats(), "Connection-Pool (GET /pool/stats)", POOL_COUNTERS, label="pool"))
+
+@app.get("/metrics") # Für Prometheus (scrape) oder curl: Latenz-Histogramme pro Route, Zeitanteile, Abfragen, Cache, Pool.
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/queries/slow") # Die letzten langsamen Abfragen (ab SLOW_QUERY_MS) mit SQL und gebundenen Filterwerten, neueste zuerst.
+async def get_slow_queries(token: str = Depends(oauth2_scheme)): # Geschützt durch OAuth2 Token: SQL und Filterwerte gehen nur angemeldete Nutzer etwas an
+    return json_response(list(reversed(metrics.slow_queries)))
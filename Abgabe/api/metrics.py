@@ -0,0 +1,209 @@
+"""Messwerte der API: Latenz pro Route, Zeitanteile pro Request (Datenbank, JSON, Rest), Abfragen, langsame Abfragen.
+
+Ist eine Suche langsam, sieht man von außen nur die Gesamtzeit. Hier wird sie zerlegt:
+    - db:     Zeit in cursor.execute (Abfragen inkl. Übertragung der Zeilen), gemessen über die SQLAlchemy-Events in database.py
+    - encode: JSON-Kodierung der Antwort (json_response/body in main.py)
+    - app:    der Rest (Routing, Validierung mit Pydantic, Zeilen in Dicts/Objekte umwandeln, Cache, ...)
+Pro Request zusätzlich im Header Server-Timing (Browser-Devtools zeigen das direkt an).
+
+Was macht der Code?:
+    - Counter / Histogram: Zähler bzw. Histogramm mit festen Buckets pro Label-Kombination (ein Lock, wenige Additionen pro Messung).
+    - MetricsMiddleware: reine ASGI-Middleware (kein BaseHTTPMiddleware --> keine zusätzliche Task pro Request), misst jede Anfrage
+      pro Route-Vorlage (z.B. /flights/{flight_id}, nicht jede ID einzeln) und legt RequestTiming in eine ContextVar.
+    - record_query: von database.py nach jeder Abfrage aufgerufen --> Histogramm, Zeilen, Zeitanteil des Requests, Slow-Query-Log.
+    - SLOW_QUERY_MS: Abfragen ab dieser Dauer landen im Log (Logger "flights.slow_queries", mit SQL und gebundenen Filterwerten)
+      und in den letzten SLOW_QUERY_KEEP Einträgen für GET /queries/slow (nur mit Token). 0 = aus.
+      Gebundene Werte nur bei Abfragen auf Flug-Tabellen (PARAMETER_TABLES), sonst ausgeblendet --> kein Passwort-Hash/OTP-Secret aus users im Log.
+    - render: alles im Prometheus-Textformat (GET /metrics), dazu Messwerte anderer Module über register bzw. register_collector (Cache, Pool, ...).
+"""
+import os
+import re
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_KEEP = int(os.getenv("SLOW_QUERY_KEEP", "100"))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Sekunden
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+MAX_SQL_CHARS = 2000 # Längere Statements werden im Slow-Query-Log gekürzt
+# Nur bei Abfragen, die ausschließlich diese Tabellen lesen/schreiben, stehen die gebundenen Werte im Slow-Query-Log (Filter der Suche).
+# Alles andere (users, ingest_state, ...) wird ausgeblendet.
+PARAMETER_TABLES = {"flights", "flight_facts", "flight_rollups", "flight_delay_sketches", "airports", "airlines", "aircraft"}
+TABLE_PATTERN = re.compile(r'\b(?:FROM|JOIN|INTO|(?<!DO )UPDATE)\s+"?(\w+)', re.IGNORECASE) # Tabellen eines Statements (nicht: ON CONFLICT DO UPDATE SET)
+slow_log = logging.getLogger("flights.slow_queries")
+
+def _labels(names, values) -> str:
+    if not names: return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{n}="{escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _number(x) -> str:
+    return repr(float(x)) if isinstance(x, float) else str(x)
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock: self._values[labels] = self._values.get(labels, 0) + amount
+
+    def lines(self):
+        with self._lock: values = sorted(self._values.items())
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter",
+                *[f"{self.name}{_labels(self.labels, k)} {_number(v)}" for k, v in values]]
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._values = {} # Labels --> [Anzahl pro Bucket (nicht kumulativ, letzter = über dem größten), Summe, Anzahl]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value) # erster Bucket mit value <= Obergrenze
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None: entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def lines(self):
+        with self._lock: values = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = (*self.labels, "le")
+        for key, (counts, total, count) in values:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts): # Prometheus erwartet kumulative Buckets
+                cumulative += n
+                out.append(f"{self.name}_bucket{_labels(names, (*key, bound))} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return out
+
+class RequestTiming: # Zeitanteile eines Requests; database.py und main.py addieren hier, die Middleware liest am Ende
+    __slots__ = ("scope", "db", "queries", "encode")
+    def __init__(self, scope):
+        self.scope, self.db, self.queries, self.encode = scope, 0.0, 0, 0.0
+
+current_timing = ContextVar("current_timing", default=None)
+
+def route_of(scope) -> str: # Route-Vorlage (z.B. /flights/{flight_id}), die FastAPI beim Routing in den Scope schreibt
+    return getattr(scope.get("route"), "path", None) or "unmatched" # unbekannte Pfade nicht einzeln (sonst wächst die Label-Menge)
+
+requests_total = Counter("flights_http_requests_total", "Anfragen pro Route und Statuscode", ("method", "route", "status"))
+request_seconds = Histogram("flights_http_request_duration_seconds", "Dauer pro Route (bis die Antwort komplett gesendet ist)", ("method", "route"))
+phase_seconds = Histogram("flights_http_request_phase_seconds", "Zeitanteile pro Route: db, encode, app", ("route", "phase"))
+query_seconds = Histogram("flights_db_query_duration_seconds", "Dauer pro Abfrage (cursor.execute)", ("statement",))
+query_rows = Histogram("flights_db_query_rows", "Zeilen pro Abfrage (soweit der Treiber sie meldet)", ("statement",), ROW_BUCKETS)
+slow_queries_total = Counter("flights_db_slow_queries_total", f"Abfragen ab SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)", ("route",))
+slow_queries = deque(maxlen=SLOW_QUERY_KEEP) # die letzten langsamen Abfragen für GET /queries/slow
+
+METRICS = [requests_total, request_seconds, phase_seconds, query_seconds, query_rows, slow_queries_total]
+_collectors = [] # Funktionen --> Zeilen im Prometheus-Format (Werte anderer Module, erst beim Abruf von /metrics gelesen)
+
+def register(*items): # Counter/Histogram anderer Module (z.B. password_pool.py) mit ausgeben
+    METRICS.extend(items)
+    return items[0] if len(items) == 1 else items
+
+def register_collector(fn):
+    _collectors.append(fn)
+    return fn
+
+def statement_kind(statement: str) -> str: # Erstes Wort des Statements (SELECT, INSERT, ...) als Label --> wenige, feste Werte
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return word if word in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY") else "OTHER"
+
+def record_query(statement, parameters, seconds, rows):
+    kind = statement_kind(statement)
+    query_seconds.observe(seconds, kind)
+    if rows is not None and rows >= 0: query_rows.observe(rows, kind)
+    timing = current_timing.get()
+    if timing is not None:
+        timing.db += seconds
+        timing.queries += 1
+    if SLOW_QUERY_MS > 0 and seconds * 1000 >= SLOW_QUERY_MS:
+        route = route_of(timing.scope) if timing is not None else "-" # "-" = außerhalb eines Requests (Start, Skripte)
+        slow_queries_total.inc(route)
+        entry = {"at": time.time(), "route": route, "ms": round(seconds * 1000, 1), "rows": rows,
+                 "statement": statement[:MAX_SQL_CHARS], "parameters": _printable(parameters) if _flight_tables_only(statement) else "[ausgeblendet]"}
+        slow_queries.append(entry)
+        slow_log.warning("Langsame Abfrage %.1f ms (%s, %s Zeilen): %s Parameter: %s", entry["ms"], route, rows, entry["statement"], entry["parameters"])
+
+def _flight_tables_only(statement) -> bool: # Gebundene Werte zeigen? Nur wenn alle Tabellen des Statements Flug-Tabellen sind
+    tables = TABLE_PATTERN.findall(statement)
+    return bool(tables) and all(t.lower() in PARAMETER_TABLES or t.lower().startswith("flight_facts_") for t in tables)
+
+def _printable(parameters): # Gebundene Werte (Filter der Suche) lesbar und begrenzt; executemany (Liste) nur die ersten Sätze
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return [_printable(p) for p in parameters[:3]] + ([f"... {len(parameters) - 3} weitere"] if len(parameters) > 3 else [])
+    text = repr(parameters)
+    return text if len(text) <= 500 else text[:500] + "..."
+
+class encoding: # with metrics.encoding(): ... --> Zeit zählt als "encode" des laufenden Requests
+    __slots__ = ("start",)
+    def __enter__(self):
+        self.start = time.perf_counter()
+    def __exit__(self, *exc):
+        timing = current_timing.get()
+        if timing is not None: timing.encode += time.perf_counter() - self.start
+
+class MetricsMiddleware:
+    # Misst jede HTTP-Anfrage: Gesamtdauer bis zum letzten Byte, Statuscode, Zeitanteile. Die Route-Vorlage setzt FastAPI beim Routing
+    # in scope["route"] --> nach dem Aufruf lesbar. Server-Timing geht mit den Headern raus (Stand bei Antwortbeginn).
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        timing = RequestTiming(scope)
+        token = current_timing.set(timing)
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - start
+                header = (f"db;dur={timing.db * 1000:.1f};desc=\"{timing.queries} queries\", encode;dur={timing.encode * 1000:.1f}, "
+                          f"total;dur={elapsed * 1000:.1f}")
+                message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            seconds = time.perf_counter() - start
+            route = route_of(scope)
+            current_timing.reset(token)
+            requests_total.inc(scope["method"], route, str(status))
+            request_seconds.observe(seconds, scope["method"], route)
+            phase_seconds.observe(timing.db, route, "db")
+            phase_seconds.observe(timing.encode, route, "encode")
+            phase_seconds.observe(max(seconds - timing.db - timing.encode, 0.0), route, "app")
+
+def stat_lines(prefix, stats: dict, help, counters=(), label=None) -> list:
+    # Zahlen aus einem stats()-Dict (Cache, Pool, ...) als Prometheus-Zeilen. Namen in counters --> counter mit _total, Rest gauge.
+    # Mit label: stats ist {Label-Wert: stats-Dict} (z.B. Pools "sync"/"async") --> eine Metrik, ein Wert pro Label.
+    # Nicht-Zahlen (Namen, verschachtelte Dicts, None) werden übersprungen.
+    samples = {}
+    for value, values in (stats.items() if label else [(None, stats)]):
+        for key, x in values.items():
+            if isinstance(x, bool) or not isinstance(x, (int, float)): continue
+            samples.setdefault(key, []).append(f"{_labels((label,), (value,)) if label else ''} {_number(x)}")
+    out = []
+    for key, lines in samples.items():
+        name, kind = (f"{prefix}_{key}_total", "counter") if key in counters else (f"{prefix}_{key}", "gauge")
+        out += [f"# HELP {name} {help}: {key}", f"# TYPE {name} {kind}", *[name + line for line in lines]]
+    return out
+
+def render() -> str:
+    lines = [line for metric in METRICS for line in metric.lines()]
+    for collect in _collectors: lines += collect()
+    return "\n".join(lines) + "\n"
@@ -2,20 +2,33 @@
 
 Diese Datei definiert die Struktur der "flights"-Tabelle, die von SQLAlchemy verwendet wird.
 Sie erbt von der "Base"-Klasse aus database.py und legt die Spaltennamen, -typen
-und Schlüsseleigenschaften fest (z.B. flight_id als Primary Key)."""
+und Schlüsseleigenschaften fest (z.B. flight_id als Primary Key).
 
-from sqlalchemy import Column, String, Float, Boolean, TIMESTAMP, Integer, Index
+Auf PostgreSQL ist "flights" eine View über die schlanke Faktentabelle flight_facts und die Dimensionstabellen
+airports, airlines und aircraft (siehe dimensions.py). Flight beschreibt weiterhin die Spalten, die die API liest und schreibt."""
+
+from sqlalchemy import Column, String, Float, Boolean, TIMESTAMP, Integer, BigInteger, Index
 from database import Base
 
 class Flight(Base): # Importiert die Base-Klasse. Alle Datenmodelle müssen von dieser Klasse erben, damit SQLAlchemy sie erkennt und die Tabelle in der Datenbank erstellen kann.
                     # alle Eigenschaften und Fähigkeiten von Base werden übernommen. So funktioniert die Datenbank-Funktionalität von SQLAlchemy in meinem Python-Modell
     __tablename__ = "flights" # Weist die Klasse der physischen Datenbanktabelle mit dem Namen "flights" zu.
     __table_args__ = ( # spezielle Indizes zur Leistungssteigerung.habe ich unten erklärt! --> Man umgeht damit einen Full Table scan!
+        # Auf PostgreSQL ist flights eine View --> dort liegen die Indizes auf flight_facts (FlightFact), diese hier gelten für SQLite.
         Index("idx_airline", "airline"),
         Index("idx_origin", "origin"),
         Index("idx_destination", "destination"),
         Index("idx_weekday", "weekday"),
         Index("idx_flight_id","flight_id"),
+        # Zusammengesetzte Indizes für die Filter-Kombinationen der Suche (airline_id, origin, destination, weekday).
+        # Ein Index hilft für jede Kombination, die mit seinen ersten Spalten beginnt (z.B. origin oder origin+destination).
+        # Welche Kombinationen wirklich vorkommen und ob der Index etwas bringt: index_advisor.py (EXPLAIN ANALYZE, vorher/nachher).
+        Index("idx_airline_id_route", "airline_id", "origin", "destination"), # Suche filtert auf airline_id --> der alte idx_airline (Name) hilft da nicht.
+        Index("idx_route_weekday", "origin", "destination", "weekday"),
+        # Zeitfenster-Suche (departure_from/_to, arrival_from/_to). B-Tree statt BRIN: die Zeilen liegen nicht nach Zeit sortiert auf der Platte.
+        # Bei partitionierter Tabelle (partitions.py) gibt es diese Indizes pro Monat --> klein, und nur die passenden Monate werden gelesen.
+        Index("idx_scheduled_departure", "scheduled_departure"),
+        Index("idx_scheduled_arrival", "scheduled_arrival"),
     )
 
     flight_id = Column(String, primary_key=True)  # Wichtig --> Definiert die Spalte flight_id als eindeutigen Primärschlüssel (Primary Key).
@@ -49,6 +62,74 @@ class Flight(Base): # Importiert die Base-Klasse. Alle Datenmodelle müssen von
     hour = Column(Integer, nullable=True)
     cancelled = Column(Boolean, nullable=True)
 
+# Normalisierte Speicherung (nur PostgreSQL, siehe dimensions.py)
+# Name, Koordinaten, Hersteller, Modell, ... stehen nur einmal pro Flughafen/Airline/Flugzeug in einer Dimensionstabelle,
+# flight_facts verweist über kleine Integer-Schlüssel darauf. Eine Dimensionszeile pro verschiedener Wertekombination
+# (Unique-Index mit NULLS NOT DISTINCT) --> die View flights liefert exakt dieselben Werte wie vorher die breite Tabelle.
+
+class Airport(Base):
+    __tablename__ = "airports"
+    __table_args__ = (Index("uq_airports_natural", "code", "name", "latitude", "longitude", unique=True, postgresql_nulls_not_distinct=True),)
+
+    airport_key = Column(Integer, primary_key=True) # Surrogat-Schlüssel (SERIAL)
+    code = Column(String, nullable=True) # origin bzw. destination, z.B. "JFK"
+    name = Column(String, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+
+class Airline(Base):
+    __tablename__ = "airlines"
+    __table_args__ = (Index("uq_airlines_natural", "airline_id", "name", unique=True, postgresql_nulls_not_distinct=True),)
+
+    airline_key = Column(Integer, primary_key=True)
+    airline_id = Column(String, nullable=True) # z.B. "AA"
+    name = Column(String, nullable=True) # Spalte airline, z.B. "American Airlines Inc."
+
+class Aircraft(Base):
+    __tablename__ = "aircraft"
+    __table_args__ = (Index("uq_aircraft_natural", "aircraft_id", "manufacturer", "model", "year", "engines", "seats", "max_weight_pounds",
+                            unique=True, postgresql_nulls_not_distinct=True),)
+
+    aircraft_key = Column(Integer, primary_key=True)
+    aircraft_id = Column(String, nullable=True) # Kennzeichen
+    manufacturer = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    year = Column(Float, nullable=True)
+    engines = Column(Float, nullable=True)
+    seats = Column(Float, nullable=True)
+    max_weight_pounds = Column(String, nullable=True)
+
+class FlightFact(Base): # Schlanke Faktentabelle: nur was pro Flug verschieden ist + Schlüssel der Dimensionen.
+    __tablename__ = "flight_facts" # Bei FLIGHTS_PARTITIONED=1 nach Monaten partitioniert (partitions.py), dann ohne Primary Key.
+    __table_args__ = ( # Gleiche Such-Indizes wie bei Flight, nur auf den Schlüsseln. Keine Foreign Keys: würden jedes Laden per Trigger pro Zeile prüfen.
+        Index("idx_facts_airline_key", "airline_key"),
+        Index("idx_facts_origin_key", "origin_key"),
+        Index("idx_facts_destination_key", "destination_key"),
+        Index("idx_facts_weekday", "weekday"),
+        Index("idx_facts_flight_id", "flight_id"),
+        Index("idx_facts_airline_route", "airline_key", "origin_key", "destination_key"),
+        Index("idx_facts_route_weekday", "origin_key", "destination_key", "weekday"),
+        Index("idx_facts_scheduled_departure", "scheduled_departure"),
+        Index("idx_facts_scheduled_arrival", "scheduled_arrival"),
+    )
+
+    flight_id = Column(String, primary_key=True)
+    airline_key = Column(Integer, nullable=True) # --> airlines.airline_key
+    aircraft_key = Column(Integer, nullable=True) # --> aircraft.aircraft_key
+    origin_key = Column(Integer, nullable=True) # --> airports.airport_key
+    destination_key = Column(Integer, nullable=True) # --> airports.airport_key
+    scheduled_departure = Column(TIMESTAMP, nullable=True)
+    departure = Column(TIMESTAMP, nullable=True)
+    departure_delay = Column(Float, nullable=True)
+    scheduled_arrival = Column(TIMESTAMP, nullable=True)
+    arrival = Column(TIMESTAMP, nullable=True)
+    arrival_delay = Column(Float, nullable=True)
+    air_time = Column(Float, nullable=True)
+    distance = Column(Float, nullable=True)
+    weekday = Column(String, nullable=True)
+    hour = Column(Integer, nullable=True)
+    cancelled = Column(Boolean, nullable=True)
+
 class User(Base): # Definiert die User-Klasse, die von 'Base' erbt. --> SQLAlchemy erkennt diese Klasse als Datenbankmodell.
     __tablename__ = "users" # Name der physischen Tabelle in der PostgreSQL-Datenbank
 
@@ -58,6 +139,51 @@ class User(Base): # Definiert die User-Klasse, die von 'Base' erbt. --> SQLAlche
     hashed_password = Column(String, nullable=False) # Speichert das Passwort. Aber eben nur das gehashte Passwort, um Sicherheit zu gewährleisten. --> best Practice
     otp_secret = Column(String, nullable=True) # Spalte für das "Shared Secret", wird beim Scannen des QR-Codes an das Handy übertragen.  "nullable=True" erlaubt es, Nutzer erst anzulegen und das Secret danach zu generieren.
 
+class FlightFingerprint(Base): # Fingerabdruck jeder Zeile aus der CSV --> damit ingest.py nur neue oder geänderte Zeilen schreiben muss.
+    __tablename__ = "flight_fingerprints"
+
+    flight_id = Column(String, primary_key=True) # Gleiche flight_id wie in flights. Flüge aus POST /flights/add haben keinen Fingerabdruck und werden von der Ingestion nicht angefasst.
+    row_hash = Column(BigInteger, nullable=False) # 64-Bit Hash über alle Spalten der Zeile
+
+class FlightRollup(Base): # Vorberechnete Summen pro (Airline, Route, Wochentag, Stunde) --> Durchschnitte ohne Scan über flights.
+    __tablename__ = "flight_rollups" # Wird von ingest.py aufgebaut und von POST /flights/add bzw. DELETE /flights/{id} in derselben Transaktion mitgepflegt.
+
+    # Schlüssel. NULL ist in einem Primary Key nicht erlaubt --> fehlende Werte werden als "" bzw. -1 (hour) gespeichert.
+    airline_id = Column(String, primary_key=True)
+    origin = Column(String, primary_key=True)
+    destination = Column(String, primary_key=True)
+    weekday = Column(String, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+
+    flights = Column(Integer, nullable=False, default=0) # Anzahl Flüge in der Zelle
+    cancelled = Column(Integer, nullable=False, default=0) # davon ausgefallen
+    dep_count = Column(Integer, nullable=False, default=0) # Anzahl Flüge mit departure_delay (NULL zählt nicht mit, wie bei AVG in SQL)
+    dep_sum = Column(Float, nullable=False, default=0.0) # Summe departure_delay
+    dep_sumsq = Column(Float, nullable=False, default=0.0) # Summe departure_delay² --> Standardabweichung
+    arr_count = Column(Integer, nullable=False, default=0) # dasselbe für arrival_delay
+    arr_sum = Column(Float, nullable=False, default=0.0)
+    arr_sumsq = Column(Float, nullable=False, default=0.0)
+
+class FlightDelaySketch(Base): # Verteilung der Verspätungen pro (Airline, Route, Wochentag) als Buckets --> Perzentile ohne Sortieren aller Flüge.
+    __tablename__ = "flight_delay_sketches" # Aufbau und Pflege wie flight_rollups (ingest.py, add/delete in derselben Transaktion), siehe sketches.py.
+
+    airline_id = Column(String, primary_key=True) # Zelle, fehlende Werte als "" (wie bei flight_rollups)
+    origin = Column(String, primary_key=True)
+    destination = Column(String, primary_key=True)
+    weekday = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True) # "dep" (departure_delay) oder "arr" (arrival_delay)
+    bucket = Column(Integer, primary_key=True) # Logarithmischer Bucket, Vorzeichen = Vorzeichen der Verspätung, 0 = fast pünktlich
+    count = Column(Integer, nullable=False, default=0) # Anzahl Flüge in diesem Bucket
+
+class IngestState(Base): # Merkt sich pro Quelldatei, was zuletzt geladen wurde.
+    __tablename__ = "ingest_state"
+
+    source = Column(String, primary_key=True) # Dateiname der CSV, z.B. "flights_clean.csv"
+    file_hash = Column(String, nullable=True) # SHA-256 der Datei --> unverändert = nichts zu tun
+    rows = Column(Integer, nullable=True) # Anzahl Zeilen beim letzten Laden
+    generation = Column(Integer, nullable=False, default=0) # wird bei jedem Laden mit Änderungen hochgezählt
+    loaded_at = Column(TIMESTAMP, nullable=True)
+
 
 """
 Was die Flight-Klasse von Base erbt:
@@ -0,0 +1,154 @@
+"""Monats-Partitionen der Flug-Tabelle (nur PostgreSQL).
+
+Mit jedem Jahr Flugdaten wächst flights weiter. Die Flüge selbst liegen in der Faktentabelle flight_facts (die View flights
+setzt sie mit den Dimensionen zusammen, siehe dimensions.py). Partitioniert nach Monat (RANGE auf scheduled_departure) liegt jeder Monat
+in einer eigenen Tabelle flight_facts_JJJJ_MM:
+    - Abfragen mit Zeitfenster lesen nur die passenden Monate (Partition Pruning, siehe EXPLAIN: "Subplans Removed").
+    - Indizes aus models.py legt PostgreSQL automatisch auf jeder Partition an --> kleine Indizes pro Monat.
+    - Alte Monate lassen sich in Sekunden abhängen (DETACH PARTITION), statt Millionen Zeilen per DELETE zu löschen.
+Flüge ohne scheduled_departure oder aus Monaten ohne Partition landen in flight_facts_default.
+
+Einschränkung: Ein Primary Key auf einer partitionierten Tabelle muss die Partitionsspalte enthalten.
+flight_id ist deshalb nur pro Partition eindeutig (Unique-Index). Über alle Monate sorgt der INSERT-Trigger der View flights dafür
+(dimensions.py): Advisory Lock pro flight_id, dann Suche über alle Partitionen --> auch zwei gleichzeitige add/bulk derselben flight_id
+mit Abflug in verschiedenen Monaten legen den Flug nur einmal an.
+
+Was macht der Code?:
+    - ensure_fact_table: legt flight_facts partitioniert an bzw. baut eine bestehende normale Tabelle einmalig um (über dimensions.ensure_schema).
+    - ensure_partitions: legt Monats-Partitionen an (ingest.py vor dem Schreiben).
+    - split_default: verteilt Zeilen aus flight_facts_default auf (neue) Monats-Partitionen.
+    - detach_month: hängt einen Monat ab (Tabelle bleibt als Archiv, optional löschen) und rechnet ihn aus den Rollups heraus.
+
+Aufruf als Skript (im api-Ordner):
+    python partitions.py list                  # Partitionen mit Bereich und geschätzter Zeilenzahl
+    python partitions.py split                 # Zeilen aus flight_facts_default in Monats-Partitionen verschieben
+    python partitions.py detach 2023-01 [--drop]
+"""
+import os
+import sys
+from datetime import date, datetime
+from sqlalchemy import text, select, insert, delete, Table, MetaData, Column
+from models import FlightFact, IngestState
+import rollups
+import sketches
+
+FLIGHTS_PARTITIONED = os.getenv("FLIGHTS_PARTITIONED", "1") == "1" # 0 --> flight_facts bleibt eine normale Tabelle
+PARENT = FlightFact.__tablename__
+DEFAULT = f"{PARENT}_default"
+
+def enabled(conn) -> bool:
+    return FLIGHTS_PARTITIONED and conn.dialect.name == "postgresql"
+
+def relkind(conn, name=PARENT): # "p" = partitioniert, "r" = normale Tabelle, None = gibt es nicht
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": name}).scalar()
+
+def is_partitioned(conn) -> bool:
+    return conn.dialect.name == "postgresql" and relkind(conn) == "p"
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def month_bounds(month: date):
+    return month, date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+def table_like_facts(name): # Table-Objekt mit den Spalten von flight_facts (ohne Primary Key und Indizes)
+    return Table(name, MetaData(), *[Column(c.name, c.type) for c in FlightFact.__table__.columns])
+
+def existing_partitions(conn) -> set:
+    return set(conn.execute(text("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                                 "WHERE i.inhparent = to_regclass(:parent)"), {"parent": PARENT}).scalars())
+
+def needs_migration(conn) -> bool: # flight_facts gibt es als normale Tabelle, Partitionierung ist aber an
+    return enabled(conn) and relkind(conn) == "r"
+
+def ensure_fact_table(conn):
+    # Aufruf in einer Transaktion, von dimensions.ensure_schema (die View flights darf dabei nicht existieren).
+    # Nichts zu tun, wenn flight_facts schon partitioniert ist oder Partitionierung aus ist.
+    if not enabled(conn) or relkind(conn) == "p": return
+    migrate = relkind(conn) == "r"
+    if migrate: # Bestehende Tabelle (vor der Partitionierung angelegt) --> umbenennen, Daten gleich übernehmen
+        print(f"{PARENT} ist noch nicht partitioniert --> wird einmalig nach Monaten umgebaut")
+        conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {PARENT}_unpartitioned"))
+    parent = table_like_facts(PARENT)
+    parent.dialect_options["postgresql"]["partition_by"] = "RANGE (scheduled_departure)"
+    parent.create(conn)
+    conn.execute(text(f"CREATE TABLE {DEFAULT} PARTITION OF {PARENT} DEFAULT"))
+    conn.execute(text(f"CREATE UNIQUE INDEX {DEFAULT}_flight_id_key ON {DEFAULT} (flight_id)"))
+    if migrate:
+        months = conn.execute(text(f"SELECT DISTINCT date_trunc('month', scheduled_departure) FROM {PARENT}_unpartitioned "
+                                   "WHERE scheduled_departure IS NOT NULL")).scalars()
+        ensure_partitions(conn, months)
+        names = ", ".join(c.name for c in FlightFact.__table__.columns)
+        conn.execute(text(f"INSERT INTO {PARENT} ({names}) SELECT {names} FROM {PARENT}_unpartitioned"))
+        conn.execute(text(f"DROP TABLE {PARENT}_unpartitioned")) # entfernt auch die alten Indizes --> Namen wieder frei
+    for index in FlightFact.__table__.indexes: # Index auf der Elterntabelle --> PostgreSQL legt ihn auf jeder Partition an
+        index.create(conn, checkfirst=True)
+
+def ensure_partitions(conn, months) -> list:
+    # Legt für jeden Monat (date/datetime, beliebiger Tag) eine Partition an, falls sie fehlt. Gibt die neuen Namen zurück.
+    if not is_partitioned(conn): return []
+    existing = existing_partitions(conn)
+    created = []
+    for month in sorted({month_start(m) for m in months if m is not None}):
+        name = partition_name(month)
+        if name in existing: continue
+        start, end = month_bounds(month)
+        bounds = {"start": start, "end": end}
+        # Liegen Zeilen dieses Monats schon in der Default-Partition, verweigert PostgreSQL die neue Partition --> erst herausnehmen
+        moving = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT} WHERE scheduled_departure >= :start AND scheduled_departure < :end)"), bounds).scalar()
+        if moving:
+            conn.execute(text(f"CREATE TEMPORARY TABLE facts_moving AS SELECT * FROM {DEFAULT} WHERE scheduled_departure >= :start AND scheduled_departure < :end"), bounds)
+            conn.execute(text(f"DELETE FROM {DEFAULT} WHERE scheduled_departure >= :start AND scheduled_departure < :end"), bounds)
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES FROM ('{start}') TO ('{end}')"))
+        conn.execute(text(f"CREATE UNIQUE INDEX {name}_flight_id_key ON {name} (flight_id)")) # flight_id eindeutig innerhalb des Monats
+        if moving:
+            conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM facts_moving"))
+            conn.execute(text("DROP TABLE facts_moving"))
+        created.append(name)
+    return created
+
+def split_default(conn) -> list:
+    # Zeilen aus flight_facts_default (z.B. über die API angelegte Flüge eines neuen Monats) in Monats-Partitionen verschieben.
+    if not is_partitioned(conn): return []
+    months = conn.execute(text(f"SELECT DISTINCT date_trunc('month', scheduled_departure) FROM {DEFAULT} WHERE scheduled_departure IS NOT NULL")).scalars()
+    return ensure_partitions(conn, list(months))
+
+def list_partitions(conn) -> list:
+    return [dict(r) for r in conn.execute(text(
+        "SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bounds, greatest(c.reltuples, 0)::bigint AS rows_estimate, "
+        "pg_size_pretty(pg_total_relation_size(c.oid)) AS size FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:parent) ORDER BY c.relname"), {"parent": PARENT}).mappings()]
+
+def detach_month(conn, month: date, drop=False) -> str:
+    # Monat abhängen: DETACH ist eine reine Katalog-Änderung (keine Zeile wird bewegt). Die Tabelle flight_facts_JJJJ_MM bleibt als Archiv,
+    # mit drop=True wird sie gelöscht. Rollups und Sketches werden um genau diese Flüge verringert, die Cache-Generation der API erhöht.
+    # Fingerabdrücke bleiben --> die nächste Ingestion lädt den archivierten Monat nicht wieder, solange sich seine Zeilen nicht ändern.
+    name = partition_name(month_start(month))
+    if name not in existing_partitions(conn): raise ValueError(f"Partition {name} gibt es nicht")
+    from dimensions import wide_select # Hier statt oben: dimensions importiert partitions
+    flights = wide_select(table_like_facts(name)).subquery() # Partition + Dimensionen = dieselben Spalten wie flights
+    rollups.remove_table(conn, flights)
+    sketches.remove_table(conn, flights)
+    conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+    if drop: conn.execute(text(f"DROP TABLE {name}"))
+    state = conn.execute(select(IngestState.generation).where(IngestState.source == "partitions")).scalar()
+    conn.execute(delete(IngestState.__table__).where(IngestState.source == "partitions"))
+    conn.execute(insert(IngestState.__table__).values(source="partitions", generation=(state or 0) + 1, loaded_at=datetime.utcnow()))
+    return name
+
+if __name__ == "__main__":
+    from database import engine
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    with engine.begin() as conn:
+        if not is_partitioned(conn): sys.exit(f"{PARENT} ist nicht partitioniert (PostgreSQL + FLIGHTS_PARTITIONED=1, Tabelle wird beim API-Start bzw. von ingest.py angelegt).")
+        if command == "split":
+            print("Neue Partitionen:", split_default(conn) or "keine")
+        elif command == "detach":
+            year, month = map(int, sys.argv[2].split("-"))
+            name = detach_month(conn, date(year, month, 1), drop="--drop" in sys.argv)
+            print(f"{name} abgehängt" + (" und gelöscht" if "--drop" in sys.argv else f" (Archiv-Tabelle {name} bleibt bestehen)"))
+        else:
+            for p in list_partitions(conn): print(f"{p['name']:20} {p['bounds']:70} {p['rows_estimate']:>10} Zeilen  {p['size']}")
@@ -0,0 +1,107 @@
+"""Passwort-Hashing (bcrypt) in einem eigenen, begrenzten Prozess-Pool mit Zulassungskontrolle.
+
+bcrypt ist absichtlich langsam (pro Hash/Prüfung einige hundert Millisekunden CPU). Bisher lief es über run_in_threadpool im Threadpool
+von Starlette: ein Schwung Logins zu Schichtbeginn belegt dessen Threads, die im synchronen Modus (DB_ASYNC=0) jede Datenbankabfrage
+braucht, und alle CPU-Kerne --> Flugsuchen warten hinter den Logins.
+
+Was macht der Code?:
+    - PasswordPool: AUTH_WORKERS Prozesse nur für hash/verify (AUTH_POOL=thread: eigene Threads statt Prozesse, z.B. für Tests).
+      Die Suche läuft in keinem dieser Prozesse --> Logins können höchstens AUTH_WORKERS Kerne belegen.
+    - Zulassung: höchstens AUTH_MAX_PENDING Aufträge gleichzeitig (laufend + wartend). Darüber sofort AuthSaturated,
+      main.py antwortet mit 503 und Retry-After, statt eine lange Warteschlange aufzubauen, in der jeder Login in den Timeout läuft.
+    - Abgestürzter Worker (BrokenProcessPool): Pool herunterfahren und verwerfen, AuthPoolBroken --> 500 (kein "bitte gleich erneut").
+      Der nächste Auftrag startet einen neuen Pool.
+    - Messwerte (GET /metrics): Wartezeit in der Queue und reine Hash-Zeit pro Operation, abgewiesene Aufträge, Auslastung.
+Pool und Grenzen gelten pro API-Prozess (bei mehreren uvicorn-Workern also mehrfach).
+"""
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from passlib.context import CryptContext
+import metrics
+
+AUTH_POOL = os.getenv("AUTH_POOL", "process") # process oder thread
+AUTH_WORKERS = max(int(os.getenv("AUTH_WORKERS", str(min(2, os.cpu_count() or 1)))), 1)
+AUTH_MAX_PENDING = int(os.getenv("AUTH_MAX_PENDING", str(AUTH_WORKERS * 8))) # ca. 8 Hashes pro Worker --> gut 1-2 s Wartezeit im schlimmsten Fall
+AUTH_RETRY_AFTER = 1 # Sekunden (Header Retry-After der 503-Antwort)
+
+# 'deprecated="auto"' sorgt dafür, dass die Bibliothek veraltete (unsichere) Hashes erkennt
+# und diese bei einem Login automatisch auf den neuesten Stand (Bcrypt) aktualisiert.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+queue_wait = metrics.register(metrics.Histogram("flights_auth_queue_wait_seconds", "Wartezeit eines bcrypt-Auftrags bis ein Worker frei ist", ("op",)))
+hash_seconds = metrics.register(metrics.Histogram("flights_auth_hash_seconds", "Reine Rechenzeit von bcrypt pro Auftrag", ("op",)))
+rejected = metrics.register(metrics.Counter("flights_auth_rejected_total", "Abgewiesene bcrypt-Aufträge (Pool voll --> 503)", ("op",)))
+
+class AuthSaturated(Exception): # Pool voll --> 503
+    pass
+
+class AuthPoolBroken(Exception): # Worker-Prozess abgestürzt --> 500
+    pass
+
+def _run(op, args): # Läuft im Worker: pwd_context.hash bzw. verify. Startzeit (Uhrzeit, prozessübergreifend vergleichbar) + Dauer zurück
+    started = time.time()
+    t = time.perf_counter()
+    result = getattr(pwd_context, op)(*args)
+    return result, started, time.perf_counter() - t
+
+class PasswordPool:
+    def __init__(self, kind=AUTH_POOL, workers=AUTH_WORKERS, max_pending=AUTH_MAX_PENDING):
+        self.kind, self.workers, self.max_pending = kind, workers, max_pending
+        self.pending = 0 # laufende + wartende Aufträge; nur aus der Event-Loop verändert --> kein Lock nötig
+        self._executor = None
+
+    def executor(self):
+        # Erst beim ersten Login starten (Import von main.py durch Skripte startet keine Prozesse).
+        # spawn statt fork: der API-Prozess hat schon Threads und offene Verbindungen, die ein Fork mitkopieren würde.
+        if self._executor is None:
+            self._executor = (ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) if self.kind == "process"
+                              else ThreadPoolExecutor(self.workers, thread_name_prefix="bcrypt"))
+        return self._executor
+
+    async def run(self, op, *args):
+        if self.pending >= self.max_pending:
+            rejected.inc(op)
+            raise AuthSaturated(op)
+        loop = asyncio.get_running_loop()
+        submitted = time.time()
+        try:
+            future = self.executor().submit(_run, op, args)
+        except BrokenProcessPool as exc: # Worker abgestürzt --> Pool verwerfen, nächster Auftrag startet einen neuen
+            self._discard()
+            raise AuthPoolBroken(op) from exc
+        self.pending += 1
+        # Freigeben erst, wenn der Worker wirklich fertig ist --> auch bei abgebrochenem Request (Client weg) stimmt pending.
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            result, started, seconds = await asyncio.wrap_future(future)
+        except BrokenProcessPool as exc:
+            self._discard()
+            raise AuthPoolBroken(op) from exc
+        queue_wait.observe(max(started - submitted, 0.0), op)
+        hash_seconds.observe(seconds, op)
+        return result
+
+    def _release(self):
+        self.pending -= 1
+
+    def _discard(self):
+        # Kaputten Pool herunterfahren, ohne zu warten: wartende Aufträge abbrechen, übrige Prozesse und der Verwaltungs-Thread
+        # des Executors beenden sich --> bleiben nicht bei jedem Absturz liegen. Mehrere Aufträge können denselben Absturz melden.
+        executor, self._executor = self._executor, None
+        if executor is not None: executor.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password) -> str:
+        return await self.run("hash", password)
+
+    async def verify(self, password, hashed) -> bool:
+        return await self.run("verify", password, hashed)
+
+    def stats(self):
+        return {"workers": self.workers, "max_pending": self.max_pending, "pending": self.pending}
+
+password_pool = PasswordPool()
+metrics.register_collector(lambda: metrics.stat_lines("flights_auth_pool", password_pool.stats(), "bcrypt-Pool"))
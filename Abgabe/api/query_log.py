@@ -0,0 +1,72 @@
+"""Protokoll der Suchmuster (welche Filter werden zusammen benutzt?).
+
+Indizes lohnen sich nur für Filter-Kombinationen, die wirklich vorkommen. POST /flights/search und
+POST /flights/stats (mit Perzentilen) melden hier jede Abfrage, die tatsächlich an flights geht:
+welche Filter gesetzt waren, wie lange die Abfrage gedauert hat und welche Werte benutzt wurden.
+
+Was macht der Code?:
+    - QueryPatternLog.record: zählt eine Abfrage zu ihrem Muster (z.B. ("origin", "destination", "weekday")).
+      Jedes Prädikat der Suche zählt: "="-Filter, Regionen (origin/destination IN (...), Wert "JFK,EWR,LGA") und
+      Bereiche auf RANGE_COLUMNS (Zeitfenster, Uhrzeit; Wert "von..bis", leere Grenze = offen).
+    - range_value / list_value bzw. parse_value: Werte als Text für das Protokoll (JSON) und zurück (index_advisor.py).
+    - QueryPatternLog.patterns: Liste aller Muster mit Anzahl, Laufzeit (Mittel/Max) und den häufigsten Werten je Spalte
+      --> GET /search/patterns, wird von index_advisor.py gelesen.
+
+Nur im Speicher des API-Prozesses (wie die Cache-Zähler), nach einem Neustart beginnt die Zählung von vorn.
+"""
+import threading
+from datetime import datetime
+from collections import Counter
+
+MAX_VALUES = 20 # Pro Muster und Spalte werden die Werte gezählt, ab so vielen verschiedenen nur noch die bekannten
+RANGE_COLUMNS = ("scheduled_departure", "scheduled_arrival", "hour") # Bereichsfilter (>=, <) --> in einem Index hinter die "="-Spalten
+
+def range_value(low, high) -> str: # (von, bis) --> "von..bis", None = offen
+    text = lambda v: "" if v is None else v.isoformat() if isinstance(v, datetime) else str(v)
+    return f"{text(low)}..{text(high)}"
+
+def list_value(codes) -> str: # IN-Liste (Region) --> "JFK,EWR,LGA"
+    return ",".join(sorted(codes))
+
+def parse_value(column, value):
+    # Protokollierter Wert --> Bereich (von, bis), Liste (IN) oder einzelner Wert
+    if column in RANGE_COLUMNS:
+        parse = int if column == "hour" else datetime.fromisoformat
+        return tuple(parse(v) if v else None for v in str(value).split("..", 1))
+    return value.split(",") if isinstance(value, str) and "," in value else value
+
+class QueryPatternLog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._patterns = {} # Spalten-Tupel --> {"count", "timed", "total", "max", "values": {spalte: Counter}}
+
+    def record(self, filters: dict, seconds=None):
+        # filters: {spalte: wert} der gesetzten Filter. seconds=None, wenn die Laufzeit nicht messbar ist (NDJSON-Stream).
+        key = tuple(sorted(filters))
+        with self._lock:
+            p = self._patterns.get(key)
+            if p is None:
+                p = self._patterns[key] = {"count": 0, "timed": 0, "total": 0.0, "max": 0.0, "values": {c: Counter() for c in key}}
+            p["count"] += 1
+            if seconds is not None:
+                p["timed"] += 1
+                p["total"] += seconds
+                p["max"] = max(p["max"], seconds)
+            for column, value in filters.items():
+                values = p["values"][column]
+                if value in values or len(values) < MAX_VALUES: values[value] += 1
+
+    def patterns(self) -> list:
+        with self._lock:
+            return sorted(({
+                "columns": list(key),
+                "count": p["count"],
+                "avg_ms": p["total"] / p["timed"] * 1000 if p["timed"] else None,
+                "max_ms": p["max"] * 1000 if p["timed"] else None,
+                "values": {c: dict(v.most_common()) for c, v in p["values"].items()},
+            } for key, p in self._patterns.items()), key=lambda p: -p["count"])
+
+    def clear(self):
+        with self._lock: self._patterns.clear()
+
+search_patterns = QueryPatternLog()
@@ -0,0 +1,152 @@
+"""Rollup-Tabelle für Verspätungs- und Ausfall-Kennzahlen.
+
+Statt für jede Frage wie "durchschnittliche Verspätung pro Route und Wochentag" die ganze flights-Tabelle
+zu scannen, stehen in flight_rollups pro Zelle (airline_id, origin, destination, weekday, hour) schon die Summen:
+Anzahl Flüge, Anzahl Ausfälle, sowie Anzahl, Summe und Quadratsumme der Verspätungen.
+Daraus lassen sich Mittelwert, Standardabweichung und Ausfallquote für jede Gruppierung exakt berechnen,
+indem man einfach die passenden Zellen aufsummiert.
+
+Was macht der Code?:
+    - rebuild_rollups: baut die Tabelle komplett aus flights neu auf (ingest.py nach jedem Laden).
+    - apply_flights: zählt einzelne Flüge dazu (+1) oder heraus (-1) --> add_flight/delete_flight in main.py, gleiche Transaktion.
+    - query_rollups: beantwortet Aggregat-Abfragen aus den Zellen (POST /flights/stats).
+    - check_rollups: vergleicht die Tabelle mit einer kompletten Neuberechnung (Konsistenzprüfung).
+    - apply_table / remove_table: rechnet alle Flüge einer Tabelle dazu bzw. heraus (inkrementelle Ingestion, abgehängte Monats-Partition).
+
+Aufruf als Skript (im api-Ordner):  python rollups.py check   bzw.   python rollups.py rebuild
+"""
+import sys
+import math
+from sqlalchemy import select, func, case, delete, insert, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Flight, FlightRollup
+
+KEY_COLUMNS = ("airline_id", "origin", "destination", "weekday", "hour") # Schlüssel einer Zelle
+MISSING = {"airline_id": "", "origin": "", "destination": "", "weekday": "", "hour": -1} # Ersatzwerte für NULL (Primary Key darf nicht NULL sein)
+SUM_COLUMNS = ("flights", "cancelled", "dep_count", "dep_sum", "dep_sumsq", "arr_count", "arr_sum", "arr_sumsq")
+GROUP_KEYS = {"airline": "airline_id", "origin": "origin", "destination": "destination", "weekday": "weekday", "hour": "hour"} # API-Name --> Spalte
+
+rollup_table = FlightRollup.__table__
+
+def _dialect(conn): # Funktioniert mit Session (main.py) und Connection (ingest.py)
+    return conn.dialect if hasattr(conn, "dialect") else conn.get_bind().dialect
+
+def rollup_key(values: dict) -> dict: # Zellen-Schlüssel eines Flugs, NULL --> Ersatzwert
+    return {k: MISSING[k] if values.get(k) is None else values[k] for k in KEY_COLUMNS}
+
+def rollup_delta(values: dict, sign: int) -> dict: # Beitrag eines Flugs zu den Summen seiner Zelle (sign=-1 beim Löschen)
+    delta = {"flights": sign, "cancelled": sign if values.get("cancelled") else 0}
+    for prefix, column in (("dep", "departure_delay"), ("arr", "arrival_delay")):
+        x = values.get(column)
+        has = x is not None and not math.isnan(x)
+        delta[f"{prefix}_count"] = sign if has else 0
+        delta[f"{prefix}_sum"] = sign * x if has else 0.0
+        delta[f"{prefix}_sumsq"] = sign * x * x if has else 0.0
+    return delta
+
+def flight_values(flight) -> dict: # ORM-Objekt --> Dict mit allen Spalten
+    return {c.name: getattr(flight, c.name) for c in Flight.__table__.columns}
+
+def apply_flights(conn, flights, sign=1):
+    # Zählt Flüge (Liste von Dicts) zu den Rollups dazu bzw. heraus. Läuft in der Transaktion des Aufrufers.
+    # Erst pro Zelle zusammenfassen, dann ein Upsert pro Zelle: INSERT ... ON CONFLICT DO UPDATE SET x = x + excluded.x
+    cells = {}
+    for values in flights:
+        key = tuple(rollup_key(values).values())
+        delta = rollup_delta(values, sign)
+        if key in cells:
+            for c in SUM_COLUMNS: cells[key][c] += delta[c]
+        else:
+            cells[key] = delta
+    upsert_cells(conn, cells, remove_empty=sign < 0)
+
+def upsert_cells(conn, cells: dict, remove_empty=False):
+    # cells: Zellen-Schlüssel (Tupel) --> Summen, die dazugezählt werden (negativ = herausrechnen).
+    if not cells: return
+    ins = (pg_insert if _dialect(conn).name == "postgresql" else sqlite_insert)(rollup_table)
+    stmt = ins.on_conflict_do_update(index_elements=list(KEY_COLUMNS),
+                                     set_={c: rollup_table.c[c] + ins.excluded[c] for c in SUM_COLUMNS})
+    conn.execute(stmt, [{**dict(zip(KEY_COLUMNS, key)), **delta} for key, delta in cells.items()])
+    if remove_empty: # Leere Zellen entfernen, damit die Tabelle nicht mit Nullzeilen wächst: ein DELETE pro 1000 Zellen (wie sketches.py)
+        keys = list(cells)
+        for i in range(0, len(keys), 1000):
+            conn.execute(delete(rollup_table).where(tuple_(*[rollup_table.c[k] for k in KEY_COLUMNS]).in_(keys[i:i + 1000]), rollup_table.c.flights <= 0))
+
+def recompute_select(table=None): # Dieselben Summen direkt aus flights (GROUP BY) --> für Neuaufbau und Konsistenzprüfung
+    c = (table if table is not None else Flight.__table__).c # table: andere Tabelle mit denselben Spalten (z.B. eine Partition)
+    keys = [func.coalesce(c[k], MISSING[k]).label(k) for k in KEY_COLUMNS]
+    sums = [
+        func.count().label("flights"),
+        func.sum(case((c.cancelled, 1), else_=0)).label("cancelled"),
+        func.count(c.departure_delay).label("dep_count"),
+        func.coalesce(func.sum(c.departure_delay), 0.0).label("dep_sum"),
+        func.coalesce(func.sum(c.departure_delay * c.departure_delay), 0.0).label("dep_sumsq"),
+        func.count(c.arrival_delay).label("arr_count"),
+        func.coalesce(func.sum(c.arrival_delay), 0.0).label("arr_sum"),
+        func.coalesce(func.sum(c.arrival_delay * c.arrival_delay), 0.0).label("arr_sumsq"),
+    ]
+    return select(*keys, *sums).group_by(*keys)
+
+def apply_table(conn, table, sign=1):
+    # Alle Flüge aus table (Tabelle oder Unterabfrage mit den Spalten von flights) dazu- bzw. herausrechnen:
+    # ein GROUP BY über diese Zeilen statt Neuaufbau über ganz flights.
+    cells = {tuple(r[:5]): {c: sign * v for c, v in zip(SUM_COLUMNS, r[5:])} for r in conn.execute(recompute_select(table))}
+    upsert_cells(conn, cells, remove_empty=sign < 0)
+
+def remove_table(conn, table): # z.B. abgehängte Partition (partitions.py)
+    apply_table(conn, table, -1)
+
+def rebuild_rollups(conn): # Komplett neu aufbauen (ein Scan über flights)
+    conn.execute(delete(rollup_table))
+    conn.execute(insert(rollup_table).from_select(list(KEY_COLUMNS + SUM_COLUMNS), recompute_select()))
+
+def check_rollups(conn, tolerance=1e-6):
+    # Vergleicht die gespeicherten Zellen mit einer kompletten Neuberechnung.
+    # Gibt eine Liste (Schlüssel, gespeichert, erwartet) aller abweichenden Zellen zurück --> leer = konsistent.
+    stored = {tuple(r[:5]): tuple(r[5:]) for r in conn.execute(select(*[rollup_table.c[c] for c in KEY_COLUMNS + SUM_COLUMNS]))}
+    expected = {tuple(r[:5]): tuple(r[5:]) for r in conn.execute(recompute_select())}
+    mismatches = []
+    for key in stored.keys() | expected.keys():
+        a, b = stored.get(key), expected.get(key)
+        if a is None or b is None or any(not math.isclose(x, y, rel_tol=tolerance, abs_tol=tolerance) for x, y in zip(a, b)):
+            mismatches.append((key, a, b))
+    return mismatches
+
+def _mean_std(n, total, sumsq): # Mittelwert und Standardabweichung (Grundgesamtheit) aus Summen
+    if not n: return None, None
+    mean = total / n
+    return mean, math.sqrt(max(sumsq / n - mean * mean, 0.0)) # max(): Rundungsfehler können minimal negativ werden
+
+def query_rollups(conn, filters: dict, group_by: list):
+    # filters: {"airline_id": "AA", "origin": ["JFK", "EWR"], ...} (nur gesetzte Filter), group_by: API-Namen wie in FlightStatsQuery ("airline", "hour", ...)
+    groups = [rollup_table.c[GROUP_KEYS[g]].label(g) for g in group_by]
+    # Liste als Wert --> IN (...), z.B. alle Flughäfen einer Region (geo.py)
+    conds = [rollup_table.c[k].in_(v) if isinstance(v, (list, tuple, set)) else rollup_table.c[k] == v for k, v in filters.items()]
+    stmt = select(*groups, *[func.sum(rollup_table.c[c]).label(c) for c in SUM_COLUMNS]).where(*conds)
+    if groups: stmt = stmt.group_by(*groups).order_by(*groups)
+    out = []
+    for row in conn.execute(stmt).mappings():
+        item = {g: None if row[g] == MISSING[GROUP_KEYS[g]] else row[g] for g in group_by}
+        dep_mean, dep_std = _mean_std(row["dep_count"], row["dep_sum"], row["dep_sumsq"])
+        arr_mean, arr_std = _mean_std(row["arr_count"], row["arr_sum"], row["arr_sumsq"])
+        item.update(count=int(row["flights"] or 0),
+                    avg_departure_delay=dep_mean, std_departure_delay=dep_std,
+                    avg_arrival_delay=arr_mean, std_arrival_delay=arr_std,
+                    cancelled_rate=row["cancelled"] / row["flights"] if row["flights"] else None)
+        out.append(item)
+    return out
+
+if __name__ == "__main__":
+    from database import engine
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    with engine.begin() as conn:
+        if command == "rebuild":
+            rebuild_rollups(conn)
+            print("Rollups neu aufgebaut.")
+        else:
+            mismatches = check_rollups(conn)
+            for key, stored, expected in mismatches[:20]:
+                print(f"Abweichung {key}: gespeichert={stored} erwartet={expected}")
+            print("Rollups konsistent." if not mismatches else f"{len(mismatches)} abweichende Zellen.")
+            sys.exit(1 if mismatches else 0)
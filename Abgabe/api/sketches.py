@@ -0,0 +1,290 @@
+"""Verteilung der Verspätungen pro Zelle (Airline, Route, Wochentag) als Sketch --> Perzentile in Millisekunden.
+
+Ein exaktes Perzentil (percentile_cont in POST /flights/stats) sortiert alle passenden Flüge. Hier steht pro Zelle
+(airline_id, origin, destination, weekday) und Kennzahl (departure_delay, arrival_delay) nur, wie viele Flüge in welchem
+logarithmischen Bucket liegen (Verfahren wie DDSketch). Buckets verschiedener Zellen addiert man einfach --> jede Gruppierung
+(gesamt, pro Airline, pro Route, ...) entsteht beim Abfragen durch Aufsummieren, Löschen ist Abziehen.
+
+Genauigkeit (SKETCH_ALPHA, Standard 0.01):
+    - Bucket i enthält Beträge in (gamma^(i-1), gamma^i] mit gamma = (1 + alpha) / (1 - alpha), geschätzt wird 2 * gamma^i / (gamma + 1)
+      --> jeder Wert liegt höchstens alpha (1 %) relativ neben der Schätzung. Positive und negative Verspätungen getrennt (Vorzeichen im Bucket).
+    - Perzentil q = der erste Flug, bis zu dem mindestens q * n Flüge reichen (wie percentile_disc in PostgreSQL). Die Antwort weicht von dessen exakter
+      Verspätung höchstens alpha * |Wert| ab, z.B. p90 = 45 min --> 44,55 bis 45,45. Es gibt keinen zusätzlichen Rangfehler (Zählungen sind exakt).
+    - |Verspätung| < SKETCH_MIN (0,5 min) zählt als 0 (absoluter Fehler < 0,5 min), Beträge über SKETCH_MAX landen im obersten Bucket.
+    - percentile_cont (POST /flights/stats) interpoliert zwischen zwei Flügen, bei wenigen Flügen pro Gruppe kann es daher etwas mehr abweichen.
+
+Was macht der Code?:
+    - Tabelle flight_delay_sketches (models.py): eine Zeile pro Zelle, Kennzahl und belegtem Bucket (nur belegte, höchstens 2 pro Flug).
+      Aufbau und Pflege wie rollups.py: rebuild_sketches (ingest.py nach jedem Laden), apply_flights (add/delete/bulk in derselben
+      Transaktion), apply_table/remove_table (inkrementelle Ingestion, abgehängte Partition), check_sketches (Vergleich mit kompletter Neuberechnung).
+    - SketchIndex: die Tabelle als numpy-Arrays im Speicher der API (gebaut bei der ersten Abfrage und nach jeder neuen Ingestion,
+      add/delete werden nach dem Commit nachgetragen). query filtert Zellen, addiert die Buckets pro Gruppe und liest die Perzentile
+      aus den kumulierten Zählungen --> POST /flights/percentiles. Gilt pro API-Prozess (wie der Cache).
+
+Aufruf als Skript (im api-Ordner):  python sketches.py check   bzw.   python sketches.py rebuild
+"""
+import os
+import sys
+import math
+import threading
+from itertools import groupby
+import numpy as np
+from sqlalchemy import select, func, case, cast, delete, insert, literal, union_all, tuple_, Integer, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import Flight, FlightDelaySketch
+from rollups import MISSING, _dialect
+
+SKETCH_ALPHA = float(os.getenv("SKETCH_ALPHA", "0.01")) # Relative Genauigkeit. Nach einer Änderung: python sketches.py rebuild
+SKETCH_MIN = 0.5 # Minuten: kleinere Beträge --> Bucket 0 (pünktlich)
+SKETCH_MAX = 100000.0 # Minuten: größere Beträge --> oberster Bucket
+GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+OFFSET = math.ceil(math.log(SKETCH_MIN) / LOG_GAMMA) - 1 # Bucket 1 = Beträge ab SKETCH_MIN
+MAX_BUCKET = math.ceil(math.log(SKETCH_MAX) / LOG_GAMMA) - OFFSET
+BUCKETS = 2 * MAX_BUCKET + 1 # -MAX_BUCKET .. MAX_BUCKET
+KEY_COLUMNS = ("airline_id", "origin", "destination", "weekday") # Zelle (wie flight_rollups, ohne hour)
+METRICS = {"dep": "departure_delay", "arr": "arrival_delay"} # Kennzahl --> Spalte
+GROUP_KEYS = {"airline": "airline_id", "origin": "origin", "destination": "destination", "weekday": "weekday"} # API-Name --> Spalte
+DENSE_LIMIT = 2000000 # Gruppen x Kennzahlen x Buckets bis hierhin: ein dichtes Array (bincount), darüber sortieren (np.unique)
+PENDING_LIMIT = 4096 # Nachgetragene Änderungen (add/delete), ab dieser Anzahl in die Arrays einarbeiten
+
+sketch_table = FlightDelaySketch.__table__
+
+def bucket(x: float) -> int: # Bucket einer Verspätung (gleiche Rechnung wie bucket_expr in SQL)
+    a = abs(x)
+    if a < SKETCH_MIN: return 0
+    b = MAX_BUCKET if a > SKETCH_MAX else math.ceil(math.log(a) / LOG_GAMMA) - OFFSET
+    return b if x > 0 else -b
+
+def bucket_expr(column): # bucket() als SQL-Ausdruck (ln, ceil, abs: PostgreSQL, SQLite nur mit Mathe-Funktionen)
+    a = func.abs(column)
+    b = cast(func.ceil(func.ln(a) / LOG_GAMMA), Integer) - OFFSET
+    return case((a < SKETCH_MIN, 0), (a > SKETCH_MAX, case((column > 0, MAX_BUCKET), else_=-MAX_BUCKET)), (column > 0, b), else_=-b)
+
+def bucket_values(buckets: np.ndarray) -> np.ndarray: # Schätzwert (Minuten) pro Bucket
+    i = np.abs(buckets) + OFFSET
+    return np.where(buckets == 0, 0.0, np.sign(buckets) * 2 * GAMMA ** i / (GAMMA + 1))
+
+def flight_cells(flights, sign=1) -> dict:
+    # Beitrag von Flügen (Dicts) zu den Buckets: (Zelle..., Kennzahl, Bucket) --> +/-Anzahl. Gemeinsam für Tabelle und SketchIndex.
+    cells = {}
+    for values in flights:
+        cell = tuple(MISSING[k] if values.get(k) is None else values[k] for k in KEY_COLUMNS)
+        for metric, column in METRICS.items():
+            x = values.get(column)
+            if x is None or math.isnan(x): continue
+            key = (*cell, metric, bucket(x))
+            cells[key] = cells.get(key, 0) + sign
+    return cells
+
+def apply_flights(conn, flights, sign=1): # Wie rollups.apply_flights: Flüge dazu (+1) bzw. heraus (-1), in der Transaktion des Aufrufers
+    upsert_cells(conn, flight_cells(flights, sign), remove_empty=sign < 0)
+
+def upsert_cells(conn, cells: dict, remove_empty=False):
+    cells = {k: v for k, v in cells.items() if v}
+    if not cells: return
+    columns = (*KEY_COLUMNS, "metric", "bucket")
+    ins = (pg_insert if _dialect(conn).name == "postgresql" else sqlite_insert)(sketch_table)
+    stmt = ins.on_conflict_do_update(index_elements=list(columns), set_={"count": sketch_table.c.count + ins.excluded.count})
+    conn.execute(stmt, [{**dict(zip(columns, key)), "count": n} for key, n in cells.items()])
+    if remove_empty: # Leere Buckets entfernen: ein DELETE pro 1000 Buckets statt eines pro Bucket
+        keys = list(cells)
+        for i in range(0, len(keys), 1000):
+            conn.execute(delete(sketch_table).where(tuple_(*[sketch_table.c[c] for c in columns]).in_(keys[i:i + 1000]), sketch_table.c.count <= 0))
+
+def recompute_select(table=None): # Dieselben Zählungen direkt aus flights --> Neuaufbau und Konsistenzprüfung
+    c = (table if table is not None else Flight.__table__).c
+    keys = [func.coalesce(c[k], MISSING[k]).label(k) for k in KEY_COLUMNS]
+    # Bucket erst in einer Unterabfrage berechnen, dann gruppieren (GROUP BY über einen Ausdruck mit Parametern mag PostgreSQL nicht)
+    parts = [select(*keys, literal(metric).label("metric"), bucket_expr(c[column]).label("bucket")).where(c[column].isnot(None))
+             for metric, column in METRICS.items()]
+    inner = union_all(*parts).subquery()
+    columns = [inner.c[k] for k in (*KEY_COLUMNS, "metric", "bucket")]
+    return select(*columns, func.count().label("count")).group_by(*columns)
+
+def rebuild_sketches(conn): # Komplett neu aufbauen (ein Scan über flights pro Kennzahl)
+    conn.execute(delete(sketch_table))
+    conn.execute(insert(sketch_table).from_select([*KEY_COLUMNS, "metric", "bucket", "count"], recompute_select()))
+
+def apply_table(conn, table, sign=1): # Alle Flüge aus table (Tabelle oder Unterabfrage) dazu- bzw. herausrechnen, wie rollups.apply_table
+    upsert_cells(conn, {tuple(r[:6]): sign * r[6] for r in conn.execute(recompute_select(table))}, remove_empty=sign < 0)
+
+def remove_table(conn, table): # Abgehängte Partition (partitions.py)
+    apply_table(conn, table, -1)
+
+def check_sketches(conn):
+    # Gespeicherte Buckets gegen eine komplette Neuberechnung --> Liste (Schlüssel, gespeichert, erwartet), leer = konsistent.
+    columns = [sketch_table.c[c] for c in (*KEY_COLUMNS, "metric", "bucket", "count")]
+    stored = {tuple(r[:6]): r[6] for r in conn.execute(select(*columns))}
+    expected = {tuple(r[:6]): r[6] for r in conn.execute(recompute_select())}
+    return [(key, stored.get(key), expected.get(key)) for key in stored.keys() | expected.keys() if stored.get(key) != expected.get(key)]
+
+class SketchIndex:
+    def __init__(self):
+        self._state = None # (Werte je Schlüsselspalte, Code je Wert, Codes je Zelle, Zelle --> Index, Einträge) --> wird als Ganzes ausgetauscht
+        self._pending = {} # (Zellen-Index, Kennzahl, Bucket) --> Anzahl: add/delete seit dem letzten Einarbeiten
+        self._pending_arrays = None
+        self.generation = None # Cache-Generation, zu der der Index gebaut wurde
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def rebuild(self, db, generation=None):
+        # db: normale (synchrone) Session oder Connection --> in main.py über db.run_sync. Liest die ganze Sketch-Tabelle.
+        keys, entries, numbers = self._load(db)
+        codes = {k: {} for k in KEY_COLUMNS}
+        cell_of = {} # Zelle (Tupel) --> Index
+        cell_index = np.repeat(np.arange(len(keys), dtype=np.int32), entries) # Einträge einer Zelle stehen hintereinander
+        cells = []
+        for key in keys:
+            cell = tuple(key.split("\t"))
+            cell_of[cell] = len(cells)
+            cells.append([codes[k].setdefault(v, len(codes[k])) for k, v in zip(KEY_COLUMNS, cell)])
+        values = {k: list(codes[k]) for k in KEY_COLUMNS}
+        cell_codes = np.array(cells, dtype=np.int32).reshape(-1, len(KEY_COLUMNS))
+        arrays = (cell_index, numbers[:, 0].astype(np.int8), numbers[:, 1].astype(np.int32), numbers[:, 2])
+        with self._lock: # Austausch in einem Schritt
+            self._state = (values, codes, cell_codes, cell_of, arrays)
+            self._pending, self._pending_arrays = {}, None
+            self.generation = generation
+            self.rebuilds += 1
+
+    @staticmethod
+    def _load(db):
+        # --> (Zellen-Schlüssel als "airline\torigin\tdestination\tweekday", Anzahl Einträge pro Zelle, int64-Array [arr, bucket, count] pro Eintrag).
+        # Die Einträge stehen nach Zellen geordnet: die ersten entries[0] gehören zu keys[0] usw.
+        # PostgreSQL: pro Zelle eine Zeile (GROUP BY, Zahlen der Zelle als Text), darüber drei lange Texte (string_agg) statt eines
+        # Row-Objekts pro Eintrag (1 Mio. Flüge --> knapp 2 Mio. Einträge, aber nur ca. 55.000 Zellen); numpy liest die Zahlen am Stück.
+        # Alle drei Aggregate mit demselben ORDER BY (Schlüssel ist eindeutig) --> i-ter Schlüssel gehört sicher zu den i-ten Zahlen.
+        c = sketch_table.c
+        arr = case((c.metric == "arr", 1), else_=0)
+        if _dialect(db).name == "postgresql":
+            per_cell = (select(func.concat_ws("\t", *[c[k] for k in KEY_COLUMNS]).label("key"), func.count().label("entries"),
+                               func.string_agg(func.concat_ws(" ", arr, c.bucket, c["count"]), " ").label("numbers"))
+                        .group_by(*[c[k] for k in KEY_COLUMNS]).subquery())
+            ordered = lambda column, sep: func.string_agg(column, aggregate_order_by(literal(sep), per_cell.c.key))
+            key_text, entry_text, number_text = db.execute(select(ordered(per_cell.c.key, "\n"), ordered(cast(per_cell.c.entries, Text), " "),
+                                                                  ordered(per_cell.c.numbers, " "))).one()
+            if not key_text: return [], np.zeros(0, dtype=np.int64), np.zeros((0, 3), dtype=np.int64)
+            return (key_text.split("\n"), np.fromstring(entry_text, dtype=np.int64, sep=" "),
+                    np.fromstring(number_text, dtype=np.int64, sep=" ").reshape(-1, 3))
+        rows = db.execute(select(*[c[k] for k in KEY_COLUMNS], arr, c.bucket, c["count"]).order_by(*[c[k] for k in KEY_COLUMNS])).all()
+        groups = [("\t".join(cell), len(list(entries))) for cell, entries in groupby(rows, key=lambda row: tuple(row[:4]))]
+        return ([key for key, _ in groups], np.array([n for _, n in groups], dtype=np.int64),
+                np.array([row[4:] for row in rows], dtype=np.int64).reshape(-1, 3))
+
+    def apply_flights(self, flights, sign=1):
+        # Nach dem Commit von add/delete/bulk. Noch nicht gebaut --> nichts zu tun (rebuild liest die Tabelle mit diesen Flügen).
+        with self._lock:
+            if self._state is None: return
+            values, codes, cell_codes, cell_of, arrays = self._state
+            new_cells = []
+            for key, n in flight_cells(flights, sign).items():
+                cell = key[:4]
+                index = cell_of.get(cell)
+                if index is None: # Neue Zelle (z.B. neue Route): Codes und Zelle anhängen, Zustand neu zusammensetzen
+                    index = cell_of[cell] = len(cell_codes) + len(new_cells)
+                    for k, v in zip(KEY_COLUMNS, cell):
+                        if v not in codes[k]:
+                            codes[k][v] = len(values[k])
+                            values[k].append(v)
+                    new_cells.append([codes[k][v] for k, v in zip(KEY_COLUMNS, cell)])
+                entry = (index, key[4] == "arr", key[5])
+                self._pending[entry] = self._pending.get(entry, 0) + n
+            if new_cells: cell_codes = np.vstack([cell_codes, np.array(new_cells, dtype=np.int32)])
+            if len(self._pending) > PENDING_LIMIT: # Einarbeiten: Arrays einmal verlängern, Nullen fallen beim Abfragen raus
+                arrays = tuple(np.concatenate([a, p]) for a, p in zip(arrays, self._pending_entries()))
+                self._pending = {}
+            self._state = (values, codes, cell_codes, cell_of, arrays)
+            self._pending_arrays = None
+
+    def _pending_entries(self):
+        keys = list(self._pending)
+        return (np.array([k[0] for k in keys], dtype=np.int32), np.array([k[1] for k in keys], dtype=np.int8),
+                np.array([k[2] for k in keys], dtype=np.int32), np.array(list(self._pending.values()), dtype=np.int64))
+
+    def _snapshot(self):
+        with self._lock:
+            if self._pending_arrays is None: self._pending_arrays = self._pending_entries()
+            return self._state, self._pending_arrays
+
+    def query(self, filters: dict, group_by: list, quantiles: list) -> list:
+        # filters: {"airline_id": "AA", "origin": ["JFK", "EWR"], ...}, group_by: API-Namen ("airline", "origin", ...), quantiles: z.B. [0.5, 0.9, 0.99]
+        # --> [{gruppe..., "departure_delay": {"count": n, "p50": ..., ...}, "arrival_delay": {...}}], sortiert nach den Gruppenwerten.
+        state, pending = self._snapshot()
+        if state is None: return []
+        values, codes, cell_codes, _, arrays = state
+        cells = len(cell_codes)
+        mask = np.ones(cells, dtype=bool)
+        for column, wanted in filters.items():
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            mask &= np.isin(cell_codes[:, KEY_COLUMNS.index(column)], [codes[column][v] for v in wanted if v in codes[column]])
+        group_columns = [KEY_COLUMNS.index(GROUP_KEYS[g]) for g in group_by]
+        if group_columns: # Gruppe je Zelle: gleiche Codes in den Gruppenspalten = gleiche Gruppe
+            groups, inverse = np.unique(cell_codes[mask][:, group_columns], axis=0, return_inverse=True)
+        else:
+            groups, inverse = np.zeros((1, 0), dtype=np.int32), np.zeros(int(mask.sum()), dtype=np.int64) # immer eine Zeile (wie /flights/stats)
+        group_of_cell = np.full(cells, -1, dtype=np.int64)
+        group_of_cell[mask] = inverse.ravel()
+
+        cell, arr, buckets, counts = (np.concatenate([a, p]) for a, p in zip(arrays, pending))
+        group = group_of_cell[cell]
+        keep = group >= 0
+        segment = group[keep] * 2 + arr[keep] # Segment = (Gruppe, Kennzahl)
+        key = segment * BUCKETS + (buckets[keep] + MAX_BUCKET)
+        segments = len(groups) * 2
+        if segments * BUCKETS <= DENSE_LIMIT:
+            dense = np.bincount(key, weights=counts[keep], minlength=segments * BUCKETS)
+            keys = np.flatnonzero(dense)
+            sums = dense[keys]
+        else:
+            keys, inv = np.unique(key, return_inverse=True)
+            sums = np.bincount(inv.ravel(), weights=counts[keep])
+            keys, sums = keys[sums != 0], sums[sums != 0]
+        # Perzentile: Zählungen aller Segmente hintereinander kumuliert, Rang im Segment --> Position per Binärsuche
+        cumulative = np.cumsum(sums)
+        totals = np.bincount(keys // BUCKETS, weights=sums, minlength=segments)
+        before = np.concatenate(([0.0], np.cumsum(totals)[:-1]))
+        estimates = {}
+        for q in quantiles:
+            position = np.searchsorted(cumulative, before + np.maximum(np.ceil(q * totals), 1)) # erster Bucket mit >= q * n Flügen
+            position = np.minimum(position, len(keys) - 1) if len(keys) else position
+            estimates[q] = bucket_values(keys[position] % BUCKETS - MAX_BUCKET) if len(keys) else np.zeros(segments)
+
+        out = []
+        for g, group_codes in enumerate(groups):
+            item = {}
+            for name, column, code in zip(group_by, group_columns, group_codes):
+                value = values[KEY_COLUMNS[column]][code]
+                item[name] = None if value == MISSING[GROUP_KEYS[name]] else value
+            for metric, offset in (("departure_delay", 0), ("arrival_delay", 1)):
+                s = g * 2 + offset
+                n = int(totals[s])
+                item[metric] = {"count": n, **{quantile_name(q): round(float(estimates[q][s]), 2) if n else None for q in quantiles}}
+            out.append(item)
+        return sorted(out, key=lambda item: tuple((item[g] is None, item[g] or "") for g in group_by))
+
+    def stats(self) -> dict:
+        state = self._state
+        return {"cells": 0 if state is None else len(state[2]), "entries": 0 if state is None else len(state[4][0]),
+                "pending": len(self._pending), "rebuilds": self.rebuilds}
+
+def quantile_name(q: float) -> str: # 0.5 --> "p50", 0.999 --> "p99.9"
+    return f"p{round(q * 100, 6):g}"
+
+sketch_index = SketchIndex()
+
+if __name__ == "__main__":
+    from database import engine
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    with engine.begin() as conn:
+        if command == "rebuild":
+            rebuild_sketches(conn)
+            print("Sketches neu aufgebaut.")
+        else:
+            mismatches = check_sketches(conn)
+            for key, stored, expected in mismatches[:20]:
+                print(f"Abweichung {key}: gespeichert={stored} erwartet={expected}")
+            print("Sketches konsistent." if not mismatches else f"{len(mismatches)} abweichende Buckets.")
+            sys.exit(1 if mismatches else 0)
@@ -0,0 +1,250 @@
+"""Lasttest für die Flights API: gemischte Last mit parallelen Clients, Latenz-Perzentile, Durchsatz und Speicher pro Endpunkt.
+
+/flights/search, /flights/{id} und /login verhalten sich unter Last völlig unterschiedlich (Index-Scan, Cache-Treffer, bcrypt).
+--concurrency Clients schicken gleichzeitig Anfragen, jede Anfrage wählt ihren Endpunkt zufällig nach --mix (reproduzierbar über --seed).
+Ohne --url läuft die API im selben Prozess (httpx über ASGI, kein Netzwerk), mit --url gegen eine laufende API (uvicorn, Docker).
+
+Was macht der Code?:
+    - sample_targets: holt sich über die API echte flight_ids, Airlines, Routen, Zeitfenster und Präfixe für die Anfragen.
+    - measure_memory: (nur ohne --url) jede Anfrage-Art einzeln mit tracemalloc --> Speicherspitze pro Request.
+    - run_load: Aufwärmen (--warmup), dann --duration Sekunden Last; Latenz jeder Anfrage pro Endpunkt.
+    - summarize: p50/p95/p99/max, Durchsatz, Fehler und Statuscodes pro Endpunkt und gesamt, RSS des API-Prozesses, /pool/stats.
+    - Ergebnis als JSON (--out, mit Git-Commit und Einstellungen). --compare alt.json zeigt die Abweichung und endet mit
+      Exit-Code 1, wenn p95 oder Durchsatz eines Endpunkts um mehr als --tolerance schlechter ist (Regression zwischen Versionen).
+
+Daten: bench/seed_flights.py --load (Flüge + Benchmark-User für /login).
+
+Aufruf (im Ordner Abgabe, DATABASE_URL wie beim Seeden):
+    python bench/bench_load.py --duration 30 --concurrency 16 --out bench/results/baseline.json
+    python bench/bench_load.py --duration 30 --concurrency 16 --compare bench/results/baseline.json
+    python bench/bench_load.py --url http://localhost:8000 --server-pid 1234 --mix search=50,get=50
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+import httpx
+import pyotp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "api"))
+from seed_flights import BENCH_USER, BENCH_PASSWORD, BENCH_OTP_SECRET
+
+DEFAULT_MIX = "search=30,search_window=10,get=30,stats=15,autocomplete=10,login=5"
+PAGE_LIMIT = 100 # Seitengröße der Suchanfragen
+
+# Anfrage-Arten: Name --> (Endpunkt für den Bericht, Funktion (client, rng, targets) --> Response)
+def op_search(client, rng, t):
+    airline, origin, _ = rng.choice(t["routes"])
+    return client.post("/flights/search", params={"limit": PAGE_LIMIT}, json={"airline": airline, "origin": origin})
+
+def op_search_window(client, rng, t): # Zeitfenster von 7 Tagen ab einem echten Abflug
+    start = datetime.fromisoformat(rng.choice(t["departures"]))
+    return client.post("/flights/search", params={"limit": PAGE_LIMIT},
+                       json={"origin": rng.choice(t["routes"])[1], "departure_from": start.isoformat(), "departure_to": (start + timedelta(days=7)).isoformat()})
+
+def op_get(client, rng, t):
+    return client.get(f"/flights/{rng.choice(t['flight_ids'])}")
+
+def op_stats(client, rng, t):
+    return client.post("/flights/stats", json={"airline": rng.choice(t["routes"])[0], "group_by": ["origin"]})
+
+def op_autocomplete(client, rng, t):
+    return client.get("/autocomplete", params={"q": rng.choice(t["prefixes"]), "kind": "airport", "limit": 10})
+
+async def op_login(client, rng, t):
+    # Die API prüft den Duo-Code erst nach bcrypt (Wartezeit im Pool). Fällt dazwischen die 30-Sekunden-Grenze, kommt 401
+    # --> einmal mit frischem Code wiederholen, sonst zählt der Lasttest seine eigenen abgelaufenen Codes als Login-Fehler.
+    login = lambda: client.post("/login", json={"username": BENCH_USER, "password": BENCH_PASSWORD, "otp_code": pyotp.TOTP(BENCH_OTP_SECRET).now()})
+    r = await login()
+    return await login() if r.status_code == 401 else r
+
+OPERATIONS = {
+    "search": ("POST /flights/search", op_search),
+    "search_window": ("POST /flights/search (Zeitfenster)", op_search_window),
+    "get": ("GET /flights/{flight_id}", op_get),
+    "stats": ("POST /flights/stats", op_stats),
+    "autocomplete": ("GET /autocomplete", op_autocomplete),
+    "login": ("POST /login", op_login),
+}
+
+def parse_mix(text): # "search=30,get=70" --> {"search": 30.0, "get": 70.0}
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS: raise SystemExit(f"Unbekannte Anfrage-Art {name!r}, möglich: {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return {k: v for k, v in mix.items() if v > 0}
+
+async def sample_targets(client, seed):
+    # Echte Werte aus der API, damit die Anfragen Treffer haben (und nicht nur leere Ergebnisse messen).
+    r = await client.post("/flights/stats", json={"group_by": ["airline", "origin", "destination"]})
+    r.raise_for_status()
+    groups = r.json()
+    routes = [(g["airline"], g["origin"], g["destination"]) for g in groups if g["airline"] and g["origin"] and g["destination"]]
+    r = await client.post("/flights/search", params={"limit": 1000}, json={})
+    r.raise_for_status()
+    items = r.json()["items"]
+    if not routes or not items: raise SystemExit("Keine Flüge in der Datenbank --> erst bench/seed_flights.py --load")
+    rng = random.Random(seed)
+    prefixes = sorted({code[:rng.randint(1, 3)] for _, origin, destination in routes for code in (origin, destination)})
+    return {"rows": sum(g["count"] for g in groups), "routes": routes, "flight_ids": [i["flight_id"] for i in items],
+            "departures": [i["scheduled_departure"] for i in items if i.get("scheduled_departure")], "prefixes": prefixes}
+
+def percentile(values, p): # Nearest-Rank auf sortierten Werten
+    return values[min(len(values) - 1, max(math.ceil(p / 100 * len(values)) - 1, 0))] if values else None
+
+def latency_summary(latencies, errors, seconds, statuses=None):
+    values = sorted(latencies)
+    ms = lambda x: round(x * 1000, 3) if x is not None else None
+    return {"requests": len(values), "errors": errors, "status_codes": dict(sorted((statuses or {}).items())), "throughput_rps": round(len(values) / seconds, 2) if seconds else None,
+            "mean_ms": ms(statistics.fmean(values)) if values else None,
+            "p50_ms": ms(percentile(values, 50)), "p95_ms": ms(percentile(values, 95)), "p99_ms": ms(percentile(values, 99)), "max_ms": ms(values[-1] if values else None)}
+
+def process_memory(pid): # RSS und Spitze (VmHWM) in MB aus /proc (nur Linux, sonst None)
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            fields = dict(line.split(":", 1) for line in fh if ":" in line)
+        return {"rss_mb": round(int(fields["VmRSS"].split()[0]) / 1024, 1), "rss_peak_mb": round(int(fields["VmHWM"].split()[0]) / 1024, 1)}
+    except (OSError, KeyError, ValueError):
+        return None
+
+async def measure_memory(client, mix, targets, samples, seed):
+    # Jede Anfrage-Art einzeln (nacheinander): Speicherspitze, die ein Request in Python belegt (Bytes über dem Stand davor).
+    # tracemalloc bremst stark --> nur hier, nicht während des Lasttests. C-Speicher (z.B. bcrypt, asyncpg-Puffer) sieht es nicht.
+    rng = random.Random(seed)
+    out = {}
+    tracemalloc.start()
+    try:
+        for name in mix:
+            peaks = []
+            for _ in range(samples):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                await OPERATIONS[name][1](client, rng, targets)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            out[name] = {"median_kib": round(statistics.median(peaks) / 1024, 1), "max_kib": round(max(peaks) / 1024, 1)}
+    finally:
+        tracemalloc.stop()
+    return out
+
+async def run_load(client, mix, targets, concurrency, duration, warmup, seed):
+    names, weights = list(mix), list(mix.values())
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    statuses = {name: {} for name in names} # Statuscode (bzw. Name der httpx-Exception) --> Anzahl, zeigt, woher Fehler kommen
+    start = time.perf_counter()
+    measure_from, deadline = start + warmup, start + warmup + duration
+
+    async def worker(n):
+        rng = random.Random(seed * 1000 + n) # eigener Zufall pro Client --> gleiche Folge bei gleichem --seed
+        while (began := time.perf_counter()) < deadline:
+            name = rng.choices(names, weights)[0]
+            try: status = str((await OPERATIONS[name][1](client, rng, targets)).status_code)
+            except httpx.HTTPError as exc: status = type(exc).__name__
+            if began < measure_from: continue # Aufwärmen: Caches, Pool, JIT des Planners
+            statuses[name][status] = statuses[name].get(status, 0) + 1
+            if status.isdigit() and int(status) < 400: latencies[name].append(time.perf_counter() - began)
+            else: errors[name] += 1
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return latencies, errors, statuses, time.perf_counter() - measure_from
+
+def git_revision():
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip())
+        return head + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def benchmark(args, mix):
+    if args.url:
+        client, pid = httpx.AsyncClient(base_url=args.url, timeout=60, limits=httpx.Limits(max_connections=args.concurrency)), args.server_pid
+    else:
+        import main # API im selben Prozess: Import legt Schema und Speicher-Indizes an (wie beim Start von uvicorn)
+        client, pid = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=60), os.getpid()
+    async with client:
+        targets = await sample_targets(client, args.seed)
+        memory = await measure_memory(client, mix, targets, args.memory_samples, args.seed) if not args.url and args.memory_samples else {}
+        latencies, errors, statuses, seconds = await run_load(client, mix, targets, args.concurrency, args.duration, args.warmup, args.seed)
+        pool = (await client.get("/pool/stats")).json()
+    endpoints = {name: {"endpoint": OPERATIONS[name][0], **latency_summary(latencies[name], errors[name], seconds, statuses[name]), "memory_peak": memory.get(name)}
+                 for name in mix}
+    return {
+        "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "git": git_revision(), "target": args.url or "in-process (ASGI)",
+                 "db_async": os.getenv("DB_ASYNC", "1") if not args.url else None, "rows": targets["rows"], "concurrency": args.concurrency,
+                 "duration_s": round(seconds, 2), "warmup_s": args.warmup, "mix": mix, "seed": args.seed,
+                 "python": platform.python_version(), "cpus": os.cpu_count()},
+        "total": latency_summary([x for v in latencies.values() for x in v], sum(errors.values()), seconds,
+                                 {code: sum(s.get(code, 0) for s in statuses.values()) for code in {c for s in statuses.values() for c in s}}),
+        "endpoints": endpoints,
+        "process_memory": process_memory(pid) if pid else None,
+        "pool": pool,
+    }
+
+def print_results(result):
+    m = result["meta"]
+    print(f"{m['rows']:,} Flüge, {m['concurrency']} Clients, {m['duration_s']}s, Ziel: {m['target']}, Commit {m['git']}\n")
+    print(f"{'Anfrage':<15}{'Anzahl':>8}{'Fehler':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'Speicher KiB':>14}")
+    for name, e in [*result["endpoints"].items(), ("gesamt", result["total"])]:
+        mem = (e.get("memory_peak") or {}).get("median_kib")
+        fmt = lambda x: f"{x:>9.1f}" if x is not None else f"{'-':>9}"
+        print(f"{name:<15}{e['requests']:>8}{e['errors']:>8}{fmt(e['throughput_rps'])}{fmt(e['p50_ms'])}{fmt(e['p95_ms'])}{fmt(e['p99_ms'])}{fmt(e['max_ms'])}"
+              f"{mem if mem is not None else '-':>14}")
+    failed = {name: {c: n for c, n in e["status_codes"].items() if not (c.isdigit() and int(c) < 400)} for name, e in result["endpoints"].items()}
+    for name, codes in failed.items():
+        if codes: print(f"  Fehler {name}: " + ", ".join(f"{c} x{n}" for c, n in codes.items()))
+    if result["process_memory"]: print(f"\nAPI-Prozess: RSS {result['process_memory']['rss_mb']} MB, Spitze {result['process_memory']['rss_peak_mb']} MB")
+
+def compare(baseline, result, tolerance):
+    # Regression: p95 mehr als tolerance langsamer oder Durchsatz mehr als tolerance niedriger als in der Baseline.
+    regressions = []
+    print(f"\nVergleich mit Baseline (Commit {baseline['meta'].get('git')}, Toleranz {tolerance:.0%}):")
+    for name, e in result["endpoints"].items():
+        b = baseline["endpoints"].get(name)
+        if not b or not b["p95_ms"] or not e["p95_ms"] or not b["throughput_rps"]: continue
+        p95, rps = e["p95_ms"] / b["p95_ms"] - 1, e["throughput_rps"] / b["throughput_rps"] - 1
+        worse = p95 > tolerance or rps < -tolerance
+        if worse: regressions.append(name)
+        print(f"  {name:<15} p95 {b['p95_ms']:>8.1f} --> {e['p95_ms']:>8.1f} ms ({p95:+.0%})   req/s {b['throughput_rps']:>8.1f} --> {e['throughput_rps']:>8.1f} ({rps:+.0%})"
+              + ("   REGRESSION" if worse else ""))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Laufende API (z.B. http://localhost:8000); ohne: API im selben Prozess")
+    parser.add_argument("--server-pid", type=int, help="Mit --url: PID des API-Prozesses für RSS (nur Linux)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Gleichzeitige Clients")
+    parser.add_argument("--duration", type=float, default=20, help="Sekunden Messung")
+    parser.add_argument("--warmup", type=float, default=3, help="Sekunden Aufwärmen (nicht gemessen)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Gewichte der Anfrage-Arten, z.B. search=50,get=50")
+    parser.add_argument("--memory-samples", type=int, default=20, help="Requests pro Anfrage-Art für die Speichermessung (0 = aus)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Ergebnis-JSON (Standard: bench/results/load-<Zeitstempel>.json)")
+    parser.add_argument("--compare", help="Baseline-JSON eines früheren Laufs")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Erlaubte Verschlechterung gegenüber der Baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args, parse_mix(args.mix)))
+    print_results(result)
+    out = args.out or os.path.join(BENCH_DIR, "results", f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as fh: json.dump(result, fh, indent=2, ensure_ascii=False)
+    print(f"\nErgebnis: {out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh: baseline = json.load(fh)
+        regressions = compare(baseline, result, args.tolerance)
+        if regressions: sys.exit(f"Regression bei: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+    main()
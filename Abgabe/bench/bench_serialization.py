@@ -0,0 +1,72 @@
+"""Benchmark: alter Lesepfad (ORM + Pydantic) gegen den neuen Schnellpfad (SQLAlchemy Core + orjson).
+
+Liest die komplette flights-Tabelle (oder einen Filter) auf drei Arten und misst, wie lange es dauert,
+bis der fertige JSON-Body im Speicher liegt:
+    1. orm_pydantic: db.query(Flight).all() --> FlightBase pro Zeile --> jsonable_encoder --> json.dumps (so wie FastAPI mit response_model)
+    2. core_orjson:  select(alle Spalten) --> dict pro Zeile --> orjson.dumps (neuer Standard in main.py)
+    3. core_fields:  wie 2., aber nur mit den Spalten aus --fields (Projektion)
+
+Aufruf (im Ordner Abgabe, DB-Verbindung wie in api/database.py):
+    python bench/bench_serialization.py --repeat 5 --fields flight_id,origin,destination,departure_delay
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from database import SessionLocal
+from models import Flight
+from main import FlightBase, select_columns
+
+def orm_pydantic(db):
+    flights = db.query(Flight).all()
+    return json.dumps(jsonable_encoder([FlightBase.model_validate(f) for f in flights])).encode()
+
+def core_orjson(db, fields=None):
+    result = db.execute(select(*select_columns(fields)))
+    keys = list(result.keys())
+    return orjson.dumps([dict(zip(keys, row)) for row in result])
+
+def measure(name, fn, repeat):
+    times, size = [], 0
+    for _ in range(repeat):
+        db = SessionLocal() # Neue Session pro Lauf --> keine Objekte aus der Identity-Map wiederverwenden.
+        try:
+            start = time.perf_counter()
+            body = fn(db)
+            times.append(time.perf_counter() - start)
+            size = len(body)
+        finally:
+            db.close()
+    return {"path": name, "median_s": statistics.median(times), "best_s": min(times), "bytes": size}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Wiederholungen pro Pfad (Median wird berichtet)")
+    parser.add_argument("--fields", default="flight_id,airline_id,origin,destination,weekday,departure_delay,cancelled", help="Spalten für den Projektions-Pfad")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rows = db.query(Flight).count()
+    print(f"flights: {rows} Zeilen, {args.repeat} Wiederholungen\n")
+
+    results = [
+        measure("orm_pydantic", orm_pydantic, args.repeat),
+        measure("core_orjson", core_orjson, args.repeat),
+        measure("core_fields", lambda db: core_orjson(db, args.fields), args.repeat),
+    ]
+    base = results[0]["median_s"]
+    print(f"{'Pfad':<14}{'Median [s]':>12}{'Best [s]':>10}{'Zeilen/s':>12}{'MB':>9}{'Speedup':>9}")
+    for r in results:
+        print(f"{r['path']:<14}{r['median_s']:>12.3f}{r['best_s']:>10.3f}{rows / r['median_s']:>12,.0f}"
+              f"{r['bytes'] / 1e6:>9.1f}{base / r['median_s']:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
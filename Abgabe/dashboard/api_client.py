@@ -0,0 +1,148 @@
+"""API-Client des Dashboards: eine gemeinsame HTTP-Verbindung, Antworten mit Ablaufzeit zwischengespeichert.
+
+Streamlit führt app.py bei jeder Eingabe komplett neu aus. Mit requests.post(...) direkt hieß das: jeder Tastendruck, jeder Klick
+baut neue TCP-Verbindungen zur API auf und schickt Kennzahlen, Suche und Vorschläge erneut, obwohl sich an den Filtern nichts geändert hat.
+
+Was macht der Code?:
+    - ApiClient: ein requests.Session mit Verbindungspool (Keep-Alive) für alle Anfragen. app.py hält genau einen Client über
+      st.cache_resource --> er überlebt Reruns und wird von allen Browser-Sitzungen geteilt (Token geht pro Aufruf mit, nicht im Client).
+    - TTLCache: Antworten von Suche, Kennzahlen, Einzelflug und Vorschlägen pro Anfrage (Art + Payload) für CACHE_TTL Sekunden.
+      Änderungen anderer Nutzer sieht das Dashboard also spätestens nach CACHE_TTL Sekunden.
+    - invalidate: nach Hinzufügen/Löschen sofort: Suche, Kennzahlen und Vorschläge komplett, Einzelflüge nur die betroffenen IDs.
+    - revalidated: Einzelflüge und Suchseiten werden mit ETag gespeichert. Nach Ablauf der CACHE_TTL wird mit If-None-Match nachgefragt,
+      bei 304 (nichts geändert) bleibt der gespeicherte Wert --> kein Body, kein erneutes Einlesen von JSON/Arrow.
+    - search_page: eine Seite der Treffer als DataFrame (Arrow-Export nach flight_id), die nächste Seite beginnt nach der letzten flight_id.
+"""
+import json
+import time
+import threading
+from collections import OrderedDict
+import requests
+import pyarrow as pa # Suchergebnisse kommen als Arrow-Stream (spaltenweise) statt JSON.
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 10 # Offene Verbindungen zur API (gleichzeitige Reruns mehrerer Sitzungen)
+TIMEOUT = (3, 60) # Sekunden: Verbindungsaufbau, Antwort (große Bulk-Pakete brauchen etwas)
+CACHE_TTL = 30 # Sekunden, die eine Antwort gültig bleibt
+CACHE_ENTRIES = 256 # Höchstens so viele Antworten, danach fliegt die am längsten unbenutzte raus
+AUTOCOMPLETE_TTL = 300 # Vorschläge (Airlines, Flughäfen) ändern sich kaum
+BULK_BATCH = 5000 # So viele Flüge schickt das Dashboard pro Bulk-Request (API erlaubt bis 100.000).
+WRITE_KINDS = ("search", "stats", "autocomplete") # Diese Antworten kann jeder neue/gelöschte Flug verändern
+
+class TTLCache: # Dict mit Ablaufzeit pro Eintrag und LRU-Grenze. Mit Lock, weil Streamlit jede Sitzung in einem eigenen Thread ausführt.
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_ENTRIES):
+        self.ttl, self.max_entries = ttl, max_entries
+        self.entries = OrderedDict() # Schlüssel --> (gültig bis, Wert)
+        self.lock = threading.Lock()
+
+    def get(self, key, stale=False): # --> (gefunden, Wert). stale=True: auch abgelaufene Einträge (zum Nachfragen per ETag)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None: return False, None
+            if entry[0] < time.monotonic() and not stale: return False, None # bleibt liegen (LRU verdrängt ihn), falls er per ETag bestätigt wird
+            self.entries.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+
+    def discard(self, match): # Alle Einträge entfernen, deren Schlüssel match(key) erfüllt
+        with self.lock:
+            for key in [k for k in self.entries if match(k)]: del self.entries[key]
+
+class ApiClient:
+    def __init__(self, base_url, ttl=CACHE_TTL, max_entries=CACHE_ENTRIES):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        # connect=2: Verbindungsaufbau wiederholen (z.B. API-Container startet neu), bereits gesendete Anfragen nicht (read=0).
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.cache = TTLCache(ttl, max_entries)
+
+    def request(self, method, path, token=None, check=True, timeout=TIMEOUT, etag=None, **kwargs) -> requests.Response:
+        headers = {"Authorization": f"Bearer {token}"} if token else {} # OAuth2 Token im Header (geschützte Endpunkte)
+        if etag: headers["If-None-Match"] = etag # Version, die wir schon haben --> API antwortet ggf. 304 ohne Body
+        r = self.session.request(method, f"{self.base_url}{path}", headers=headers, timeout=timeout, **kwargs)
+        if check: r.raise_for_status() # HTTP-Fehler --> Exception, fehlgeschlagene Anfragen landen nie im Cache (304 ist kein Fehler)
+        return r
+
+    @staticmethod
+    def key(kind, value): # Cache-Schlüssel: Art + Payload als JSON mit sortierten Schlüsseln (gleiche Filter = gleicher Schlüssel)
+        return kind, json.dumps(value, sort_keys=True, default=str)
+
+    def cached(self, kind, value, fetch, ttl=None):
+        key = self.key(kind, value)
+        found, result = self.cache.get(key)
+        if not found:
+            result = fetch()
+            self.cache.set(key, result, ttl)
+        return result
+
+    def revalidated(self, kind, value, fetch, ttl=None):
+        # Wie cached, der Eintrag ist (ETag, Wert). fetch(etag) --> Response; 304 --> gespeicherter Wert gilt weiter (neue TTL).
+        key = self.key(kind, value)
+        found, entry = self.cache.get(key)
+        if found: return entry[1]
+        _, old = self.cache.get(key, stale=True)
+        r = fetch(old[0] if old else None)
+        entry = old if r.status_code == 304 and old else (r.headers.get("ETag"), self.parse(kind, r))
+        self.cache.set(key, entry, ttl)
+        return entry[1]
+
+    @staticmethod
+    def parse(kind, r):
+        if kind == "search": # Arrow liest direkt aus dem Antwort-Puffer (kein Dict pro Flug).
+            return pa.ipc.open_stream(pa.py_buffer(r.content)).read_all().to_pandas(split_blocks=True, self_destruct=True)
+        if r.status_code == 404: return None # Flug gibt es nicht (wird auch gemerkt, bis er hinzugefügt wird)
+        r.raise_for_status()
+        return r.json()
+
+    def invalidate(self, flight_ids=None): # Nach Schreibzugriffen. flight_ids=None --> auch alle Einzelflüge verwerfen
+        flights = None if flight_ids is None else {self.key("flight", i) for i in flight_ids}
+        self.cache.discard(lambda key: key[0] in WRITE_KINDS or key[0] == "flight" and (flights is None or key in flights))
+
+    # Lesen (mit Cache). Ergebnisse werden zwischen Reruns geteilt --> nicht verändern.
+    def search_page(self, payload, after=None, limit=1000):
+        # Eine Seite: die ersten limit Treffer mit flight_id > after, als DataFrame.
+        fetch = lambda etag: self.request("POST", "/flights/export", etag=etag, json=payload, params={"format": "arrow", "limit": limit, "after": after})
+        return self.revalidated("search", {"payload": payload, "after": after, "limit": limit}, fetch)
+
+    def flight_stats(self, payload):
+        return self.cached("stats", payload, lambda: self.request("POST", "/flights/stats", json=payload).json())
+
+    def autocomplete(self, q, kind, limit=10):
+        params = {"q": q, "kind": kind, "limit": limit}
+        return self.cached("autocomplete", params, lambda: self.request("GET", "/autocomplete", params=params, timeout=2).json(), AUTOCOMPLETE_TTL)
+
+    def get_flight(self, flight_id): # None, wenn es den Flug nicht gibt
+        return self.revalidated("flight", flight_id, lambda etag: self.request("GET", f"/flights/{flight_id}", check=False, etag=etag))
+
+    # Schreiben (ohne Cache, danach invalidieren)
+    def add_flight(self, payload, token):
+        try: return self.request("POST", "/flights/add", token, json=payload).json()
+        finally: self.invalidate([payload.get("flight_id")])
+
+    def delete_flight(self, flight_id, token):
+        try: return self.request("DELETE", f"/flights/{flight_id}", token).json()
+        finally: self.invalidate([flight_id])
+
+    def bulk_add_flights(self, rows, token): # In Paketen (POST /flights/bulk). Gibt die Status pro Flug zurück.
+        items = []
+        try:
+            for i in range(0, len(rows), BULK_BATCH):
+                items += self.request("POST", "/flights/bulk", token, json=rows[i:i + BULK_BATCH]).json()["items"]
+        finally: self.invalidate([row.get("flight_id") for row in rows]) # Auch bei Fehler: frühere Pakete sind schon geschrieben
+        return items
+
+    def bulk_delete_flights(self, flight_ids, token): # POST /flights/bulk/delete, in Paketen
+        items = []
+        try:
+            for i in range(0, len(flight_ids), BULK_BATCH):
+                items += self.request("POST", "/flights/bulk/delete", token, json={"flight_ids": flight_ids[i:i + BULK_BATCH]}).json()["items"]
+        finally: self.invalidate(flight_ids)
+        return items
@@ -3,16 +3,18 @@ Streamlit Dashboard für die Flugverwaltung.
 
 Dieser Code bildet das Frontend der Anwendung und ist verantwortlich für:
 1. Benutzeroberfläche: Darstellung von Login, Registrierung und Flugdaten.
-2. API-Kommunikation: Abfrage der FastAPI-Endpunkte mittels der "requests"-Bibliothek.
+2. API-Kommunikation: Abfrage der FastAPI-Endpunkte über api_client.py (eine gemeinsame requests-Session, Antworten kurz zwischengespeichert).
 3. Sicherheit: Handhabung von OAuth2-Tokens und Darstellung von Duo Mobile QR-Codes (2FA).
 4. Zustandsverwaltung: Nutzung von "st.session_state" zur Speicherung von Login-Status und Tokens.
 """
 
 import streamlit as st # importiert Streamlit für die Web-App-Oberfläche.
 import pandas as pd 
-import requests # Importiert Requests für HTTP-Anfragen an die FastAPI-API.
+import requests # Für die Fehlerklasse requests.RequestException (Anfragen selbst laufen über api_client.py).
+from api_client import ApiClient # HTTP-Verbindungspool + Cache für die FastAPI-API.
 import qrcode # Importiert die qrcode-Bibliothek zur Generierung von QR-Codes für die 2FA.
 from io import BytesIO # Erlaubt das Speichern des QR-Bildes im Arbeitsspeicher.
+from datetime import timedelta # Für das Datums-Fenster der Suche.
 
 API_URL = "http://api:8000"  # Docker-Compose Service Name # Definiert die URL der API unter Verwendung des Docker Service Namens "api".
 
@@ -24,46 +26,77 @@ if "logged_in" not in st.session_state:
     st.session_state.logged_in = False # Setzt Standard auf "nicht eingeloggt".
     st.session_state.token = None
 
-# Hilfsfunktion für geschützte Anfragen --> Token ist im Header
-def get_auth_header():
-    return {"Authorization": f"Bearer {st.session_state.token}"} # Fügt das Token als "Bearer" hinzu.
+# Ein Client für alle Reruns und alle Sitzungen: Verbindungen zur API bleiben offen (Keep-Alive), der Cache wird geteilt.
+@st.cache_resource
+def get_client():
+    return ApiClient(API_URL)
+
+client = get_client()
 
 # Funktionen zur API-Kommunikation
 
-def search_flights(payload): # Definiert die Funktion zum Suchen von Flügen (POST-Anfrage).
+PAGE_SIZE = 1000 # So viele Flüge zeigt das Dashboard pro Seite der Tabelle an.
+
+def search_page(payload, after=None): # Eine Seite der Treffer als DataFrame: die ersten PAGE_SIZE Flüge mit flight_id > after.
     try: 
-        r = requests.post(f"{API_URL}/flights/search", json=payload) # Sendet POST-Anfrage an den Such-Endpunkt der API.
-        r.raise_for_status() # Löst bei HTTP-Fehlern (z.B. 404, 500) eine Exception aus.
-        return r.json() # Gibt die JSON-Antwort (Liste der Flüge) zurück.
+        return client.search_page(payload, after, PAGE_SIZE) # Gleiche Filter wie die Suche, Antwort als Arrow-Stream.
     except: # Fängt alle Fehler ab. --> ohne würde das Dashboard abstürzen. --> Daher try und except!
-        return [] # Gibt eine leere Liste bei Fehler zurück.
+        return pd.DataFrame() # Gibt eine leere Tabelle bei Fehler zurück.
+
+def flight_stats(payload): # Kennzahlen (Anzahl, Verspätung, Ausfallquote) rechnet die Datenbank aus --> nur wenige Zeilen statt aller Flüge.
+    try:
+        return client.flight_stats(payload) # Liste mit einer Zeile pro Gruppe (ohne group_by: genau eine Zeile).
+    except:
+        return []
+
+def autocomplete(q, kind): # Vorschläge beim Tippen (aus dem Speicher der API, keine Datenbankabfrage).
+    try:
+        return client.autocomplete(q, kind) # [{"kind", "value", "label"}]
+    except:
+        return []
+
+def autocomplete_input(container, label, kind): # Textfeld + Auswahl aus den Vorschlägen. Gibt den gewählten Code zurück (oder den Text, wenn es keine Vorschläge gibt).
+    text = container.text_input(label, key=f"{label}_text")
+    if not text: return ""
+    suggestions = autocomplete(text, kind)
+    if not suggestions:
+        container.caption("Keine Vorschläge")
+        return text
+    options = [s["value"] for s in suggestions]
+    labels = {s["value"]: f"{s['value']} – {s['label']}" if s["label"] else s["value"] for s in suggestions}
+    return container.selectbox(f"{label} auswählen", options, format_func=labels.get, key=f"{label}_choice")
 
 def get_flight(flight_id): # Definiert die Funktion zum Abrufen eines einzelnen Fluges (GET-Anfrage).
     try: 
-        r = requests.get(f"{API_URL}/flights/{flight_id}") # Sendet GET-Anfrage an den /flights/{id} Endpunkt.
-        r.raise_for_status() # Überprüft auf HTTP-Fehler.
-        return r.json() # Gibt die JSON-Antwort (den Flug) zurück.
+        return client.get_flight(flight_id) # Der Flug als Dict, None wenn es ihn nicht gibt.
     except: # Fängt alle Fehler ab.
         return None # Gibt None bei Fehler zurück.
 
+# Schreibende Anfragen: NUTZEN DEN OAUTH2 TOKEN IM HEADER!!! --> ist 300 min gültig. Danach verwirft der Client betroffene Antworten aus dem Cache.
 def add_flight(payload): # Definiert die Funktion zum Hinzufügen eines Fluges (POST-Anfrage).
     try: # Beginnt den Fehlerbehandlungsblock.
-        # NUTZT DEN OAUTH2 TOKEN IM HEADER!!! --> ist 300 min gültig
-        r = requests.post(f"{API_URL}/flights/add", json=payload, headers=get_auth_header()) # Sendet POST-Anfrage zum Hinzufügen.
-        r.raise_for_status() # Überprüft auf HTTP-Fehler.
-        return r.json() # Gibt die JSON-Antwort (den hinzugefügten Flug) zurück.
+        return client.add_flight(payload, st.session_state.token) # Gibt die JSON-Antwort (den hinzugefügten Flug) zurück.
     except: # Fängt alle Fehler ab.
         return None # Gibt None bei Fehler zurück.
 
 def delete_flight(flight_id): # Definiert die Funktion zum Löschen eines Fluges (DELETE-Anfrage).
     try: # Beginnt den Fehlerbehandlungsblock.
-        # NUTZT DEN OAUTH2 TOKEN IM HEADER!!! --> ist 300 min gültig
-        r = requests.delete(f"{API_URL}/flights/{flight_id}", headers=get_auth_header()) # Sendet DELETE-Anfrage zum Löschen.
-        r.raise_for_status() # Überprüft auf HTTP-Fehler.
-        return r.json() # Gibt die JSON-Antwort (Bestätigung) zurück.
+        return client.delete_flight(flight_id, st.session_state.token) # Gibt die JSON-Antwort (Bestätigung) zurück.
     except: # Fängt alle Fehler ab.
         return None # Gibt None bei Fehler zurück.
 
+def bulk_add_flights(rows): # Viele Flüge auf einmal (POST /flights/bulk), in Paketen. Gibt die Status pro Flug zurück.
+    return client.bulk_add_flights(rows, st.session_state.token) # Fehler (z.B. ungültige Werte in der CSV) --> Anzeige im Dashboard
+
+def bulk_delete_flights(flight_ids): # Viele Flüge auf einmal löschen (POST /flights/bulk/delete).
+    return client.bulk_delete_flights(flight_ids, st.session_state.token)
+
+def show_bulk_result(items): # Zusammenfassung (Anzahl pro Status) + Tabelle aller Einträge, die nicht geklappt haben.
+    result = pd.DataFrame(items, columns=["flight_id", "status"])
+    st.write(result["status"].value_counts().to_dict())
+    problems = result[~result["status"].isin(["created", "deleted"])]
+    if not problems.empty: st.dataframe(problems, use_container_width=True)
+
 # Login und Registrierung
 if not st.session_state.logged_in: # Falls der User nicht eingeloggt ist
     st.title("🔐 Login") # Titel der Login-Seite.
@@ -75,7 +108,7 @@ if not st.session_state.logged_in: # Falls der User nicht eingeloggt ist
         otp = st.text_input("Duo Mobile Code (6-stellig)") # Feld für den 2. Faktor hinzugefügt
         if st.button("Login"):
             # Sendet  Username, Passwort und den Duo-Code an die API
-            res = requests.post(f"{API_URL}/login", json={"username":u, "password":p, "otp_code":otp})
+            res = client.request("POST", "/login", check=False, json={"username":u, "password":p, "otp_code":otp})
             if res.status_code == 200: # --> Erfolgreicher Login
                 st.session_state.token = res.json().get("access_token") # Speichert den OAuth2 Token
                 st.session_state.logged_in = True # Status auf "eingeloggt" setzen.
@@ -88,7 +121,7 @@ if not st.session_state.logged_in: # Falls der User nicht eingeloggt ist
         st.subheader("Registrierung nur möglich mit @FlughafenABC als Endung") 
         ru, re, rp = st.text_input("Wunsch-Username"), st.text_input("E-Mail"), st.text_input("Passwort ", type="password") # Feld für Username., E-Mail, Passwort
         if st.button("Konto erstellen"): # Bei Klick auf "Konto erstellen", wird alles an die API gesendet.
-            res = requests.post(f"{API_URL}/register", json={"username":ru, "email":re, "password":rp})
+            res = client.request("POST", "/register", check=False, json={"username":ru, "email":re, "password":rp})
             if res.status_code == 200: # Falls erfolgreich erstellt. 
                 data = res.json()
                 st.session_state.temp_secret = data.get("otp_secret") # Secret temporär für QR-Code merken. --> müsste im State sein.
@@ -119,26 +152,56 @@ if st.sidebar.button("Logout"): # Logout-Button in der Seitenleiste.
     st.session_state.logged_in = False # Wenn Logout dann, Login-Status zurücksetzen.
     st.session_state.token = None # Token entfernen.
     if "temp_secret" in st.session_state: del st.session_state.temp_secret # Entfernen temporärer QR-Daten, falls vorhanden.
+    st.session_state.pop("search", None) # Gemerkte Suche verwerfen.
     st.rerun() # Seite wird neu geladen --> es erscheint wieder die Login-Seite.
 
 # Suche 
 st.header("1️⃣ Flüge suchen") # Überschrift 
 cols = st.columns(4) # Erstellt vier Spalten für die Eingabefelder.
-airline = cols[0].text_input("Airline") # Erstellt ein Textfeld in Spalte 1 für die Airline-Eingabe.
-origin = cols[1].text_input("Origin") # Erstellt ein Textfeld in Spalte 2 für die Origin-Eingabe.
-destination = cols[2].text_input("Destination") # Erstellt ein Textfeld in Spalte 3 für die Destination-Eingabe.
+airline = autocomplete_input(cols[0], "Airline", "airline") # Textfeld in Spalte 1, darunter Vorschläge (Code oder Name tippen, z.B. "delta").
+origin = autocomplete_input(cols[1], "Origin", "airport") # Textfeld in Spalte 2, Vorschläge für Flughäfen (z.B. "kennedy" --> JFK).
+destination = autocomplete_input(cols[2], "Destination", "airport") # Textfeld in Spalte 3, ebenso.
 weekday = cols[3].text_input("Weekday") # Erstellt ein Textfeld in Spalte 4 für die Wochentags-Eingabe.
+cols_time = st.columns(4) # Optionale Zeitfenster: Abflug-Datum von/bis und Uhrzeit von/bis.
+date_from = cols_time[0].date_input("Abflug ab (Datum)", value=None) # value=None --> Feld bleibt leer = kein Filter.
+date_to = cols_time[1].date_input("Abflug bis (Datum, inklusive)", value=None)
+hour_from = cols_time[2].selectbox("Uhrzeit ab", [None] + list(range(24)), format_func=lambda h: "egal" if h is None else f"{h:02d} Uhr")
+hour_to = cols_time[3].selectbox("Uhrzeit bis", [None] + list(range(24)), format_func=lambda h: "egal" if h is None else f"{h:02d} Uhr") # "22 bis 5" = über Mitternacht.
+
+group_by = st.multiselect("Gruppieren nach", ["airline", "origin", "destination", "weekday", "hour"]) # Optional: Kennzahlen pro Gruppe.
+
+def turn_page(step): # Blättern (on_click läuft vor dem Rerun --> die Tabelle zeigt gleich die neue Seite).
+    st.session_state.search["page"] += step
 
 if st.button("Suchen"): # Prüft, ob der "Suchen"-Button geklickt wurde.
     payload = {k:v if v else None for k,v in {"airline":airline,"origin":origin,"destination":destination,"weekday":weekday}.items()} # Erstellt das Such-Payload-Dictionary und setzt leere Strings auf None.
-    results = search_flights(payload) # Ruft die Suchfunktion auf, um Ergebnisse von der API zu holen.
-    if results: # Prüft, ob Ergebnisse zurückgegeben wurden.
-        df = pd.DataFrame(results) # Erstellt ein Pandas DataFrame aus den JSON-Ergebnissen.
-        st.dataframe(df) # Zeigt das Dashboard als interaktive Tabelle im Dashboard an.
-        avg_delay = df['departure_delay'].dropna().mean() if 'departure_delay' in df else 0 # Berechnet die durchschnittliche Abflugverspätung.
-        cancelled_pct = df['cancelled'].mean() if 'cancelled' in df else 0 # Berechnet den Anteil ausgefallener Flüge.
-        st.write(f"Durchschnittliche Verspätung: {avg_delay:.2f} Minuten") # Zeigt die Durchschnittsverspätung an.
-        st.write(f"Anteil ausgefallene Flüge: {cancelled_pct*100:.1f}%") # Zeigt den Prozentsatz an.
+    payload.update(departure_from=date_from.isoformat() if date_from else None, # API-Fenster ist halboffen [from, to) --> "bis" = Folgetag 0 Uhr.
+                   departure_to=(date_to + timedelta(days=1)).isoformat() if date_to else None,
+                   hour_from=hour_from, hour_to=hour_to)
+    # Suche im Session State merken: Blättern löst einen Rerun aus, die Ergebnisse sollen dabei stehen bleiben.
+    # starts[i] = letzte flight_id vor Seite i (Seite 0: None) --> Seiten werden erst geladen, wenn man hinblättert.
+    st.session_state.search = {"payload": payload, "group_by": group_by, "starts": [None], "page": 0}
+
+search = st.session_state.get("search")
+if search: # Antworten kommen bei unveränderter Suche aus dem Cache des Clients --> Reruns kosten keine Anfrage.
+    payload = search["payload"]
+    summary = flight_stats(payload) # Kennzahlen über alle Treffer, berechnet in der Datenbank.
+    if summary and summary[0]["count"]: # Prüft, ob es Treffer gibt.
+        total = summary[0]
+        st.write(f"Treffer: {total['count']}")
+        st.write(f"Durchschnittliche Verspätung: {total['avg_departure_delay'] or 0:.2f} Minuten") # Zeigt die Durchschnittsverspätung an.
+        st.write(f"Anteil ausgefallene Flüge: {(total['cancelled_rate'] or 0)*100:.1f}%") # Zeigt den Prozentsatz an.
+        if search["group_by"]: # Kennzahlen pro Gruppe als Tabelle.
+            st.dataframe(pd.DataFrame(flight_stats({**payload, "group_by": search["group_by"]})))
+        page = search["page"]
+        results = search_page(payload, search["starts"][page]) # Nur die aktuelle Seite (schon als DataFrame).
+        has_next = len(results) == PAGE_SIZE and (page + 1) * PAGE_SIZE < total["count"]
+        if has_next and len(search["starts"]) == page + 1: search["starts"].append(results["flight_id"].iloc[-1]) # Start der nächsten Seite
+        st.dataframe(results) # Zeigt die Flüge als interaktive Tabelle im Dashboard an.
+        nav = st.columns([1, 1, 6])
+        nav[0].button("◀ Zurück", on_click=turn_page, args=(-1,), disabled=page == 0)
+        nav[1].button("Weiter ▶", on_click=turn_page, args=(1,), disabled=not has_next)
+        nav[2].caption(f"Seite {page + 1} von {-(-total['count'] // PAGE_SIZE)}: Flüge {page * PAGE_SIZE + 1} bis {page * PAGE_SIZE + len(results)} von {total['count']}")
     else: # Falls keine Ergebnisse gefunden wurden.
         st.warning("Keine Ergebnisse") 
 
@@ -171,6 +234,22 @@ if st.button("Hinzufügen"): # Prüft, ob der "Hinzufügen"-Button geklickt wurd
     else: 
         st.error("Fehler beim Hinzufügen. (Berechtigung fehlt oder ID existiert?)") # Fehlermeldung.
 
+# Mehrere Flüge per CSV hinzufügen --> Spaltennamen wie die Felder der API (flight_id ist Pflicht, alle anderen optional).
+TEXT_COLUMNS = ["flight_id", "airline_id", "airline", "aircraft_id", "manufacturer", "model", "max_weight_pounds",
+                "origin", "name_origin", "destination", "name_destination", "weekday"] # Als Text einlesen (z.B. max_weight_pounds "174200" statt Zahl)
+with st.expander("Mehrere Flüge aus CSV hinzufügen"):
+    upload = st.file_uploader("CSV-Datei", type="csv")
+    if upload is not None and st.button("CSV hochladen"):
+        df = pd.read_csv(upload, dtype={c: str for c in TEXT_COLUMNS})
+        if "flight_id" not in df.columns:
+            st.error("Die CSV braucht eine Spalte flight_id.")
+        else:
+            df = df.astype(object).where(df.notna(), None) # NaN --> None (JSON null), sonst lehnt die API die Werte ab
+            try:
+                show_bulk_result(bulk_add_flights(df.to_dict("records")))
+            except requests.RequestException as e:
+                st.error(f"Fehler beim Hochladen (Berechtigung fehlt oder ungültige Werte?): {e}")
+
 # Flug löschen 
 st.header("4️⃣ Flug löschen") # Zeigt die Überschrift an.
 del_id = st.text_input("Flight ID löschen") # Erstellt ein Textfeld zur Eingabe der Flight ID.
@@ -179,6 +258,15 @@ if st.button("Löschen"): # Prüft, ob der "Löschen"-Button geklickt wurde.
     if res: st.success("Flug erfolgreich gelöscht.") 
     else: st.error("Fehler beim Löschen (Berechtigung fehlt?)")
 
+with st.expander("Mehrere Flüge löschen"):
+    del_ids = st.text_area("Flight IDs (eine pro Zeile)")
+    if st.button("Alle löschen"):
+        ids = [line.strip() for line in del_ids.splitlines() if line.strip()]
+        try:
+            show_bulk_result(bulk_delete_flights(ids))
+        except requests.RequestException as e:
+            st.error(f"Fehler beim Löschen (Berechtigung fehlt?): {e}")
+
 
 # Da das Skript bei jeder Benutzerinteraktion (z.B.  Texteingabe oder ein Button-Klick) vollständig von oben nach unten neu ausgeführt wird, würden normalerweise alle zuvor erhobenen Daten gelöscht werden. 
 # Damit das nicht passiert habe ichden sogenannten Session State implementiert.
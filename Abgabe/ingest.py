@@ -1,9 +1,25 @@
 import pandas as pd
+import numpy as np
 import os
+import io
+import sys
 import time
-from sqlalchemy import create_engine
+import hashlib
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import create_engine, inspect, insert, delete, select, func, Table, MetaData, Column, BigInteger
 from dotenv import load_dotenv
 
+# models.py liegt im api-Ordner (lokal) bzw. direkt neben ingest.py (im Container, siehe ingest.dockerfile)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from models import Flight, FlightFingerprint, IngestState, FlightRollup, FlightDelaySketch # Das Flight-Modell ist die "Wahrheit" für Spalten, Typen und Indizes
+from rollups import rebuild_rollups, check_rollups # Vorberechnete Kennzahlen, werden nach jedem Laden neu aufgebaut
+from sketches import rebuild_sketches, check_sketches # Verteilung der Verspätungen pro Zelle (Perzentile), ebenso
+import rollups # apply_table: inkrementelle Ingestion rechnet nur die geänderten Zeilen nach
+import sketches
+import partitions # Monats-Partitionen von flight_facts (nur PostgreSQL)
+import dimensions # flights = View über flight_facts + airports/airlines/aircraft (nur PostgreSQL)
+
 # .env laden
 load_dotenv()
 
@@ -11,13 +27,24 @@ load_dotenv()
 POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 # Hier 'db' statt 'localhost' nutzen, wegen docker Netzwerk
-DATABASE_URL = f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/flights"
+# DATABASE_URL kann überschrieben werden (z.B. sqlite:///test.db für lokale Tests)
+DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql+psycopg2://{POSTGRES_USER}:{POSTGRES_PASSWORD}@db:5432/flights")
+
+CSV_PATH = os.getenv("INGEST_CSV", "flights_clean.csv")
+# "incremental" = nur neue/geänderte Zeilen schreiben (Standard)
+# "stream" = komplett neu laden (Chunks + Prozess-Pool + COPY), "replace" = alter Weg über df.to_sql
+INGEST_MODE = os.getenv("INGEST_MODE", "incremental")
+CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000")) # Zeilen pro Chunk --> begrenzt den Speicherverbrauch
+WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2))) # Anzahl Prozesse zum Parsen
+SQLITE_BATCH = 5000 # Batchgröße für executemany, wenn kein PostgreSQL da ist (Tests)
+ROLLUP_DELTA_MAX = 0.5 # Inkrementell: ändert sich mehr als dieser Anteil der Zeilen, ist ein Neuaufbau der Rollups billiger als das Delta
+CHECK_ROLLUPS = os.getenv("INGEST_CHECK_ROLLUPS", "0") == "1" # Nach dem Laden Rollups gegen eine komplette Neuberechnung prüfen
 
 def run_ingestion():
     print("Starte Daten-Ingestion...")
     
     # CSV laden
-    df = pd.read_csv("flights_clean.csv")
+    df = pd.read_csv(CSV_PATH)
     
     # Eindeutige flight_id generieren
     df["flight_id"] = df["flight"].astype(str) + (df.index + 1).astype(str)
@@ -31,7 +58,329 @@ def run_ingestion():
     
     print(f"Erfolgreich {len(df)} Zeilen in die Datenbank geladen!")
 
+# Streaming-Loader
+# Statt die ganze CSV in einen DataFrame zu laden, wird die Datei in Blöcken von CHUNK_ROWS Zeilen gelesen.
+# Jeder Block wird in einem eigenen Prozess geparst (Typen kommen aus dem Flight-Modell) und dann per
+# COPY FROM STDIN in die bestehende flights-Tabelle geschrieben. So bleiben Indizes und Typen aus models.py erhalten.
+
+def flight_column_types():
+    # Liefert (Spaltenname, Python-Typname) für alle Spalten des Flight-Modells, z.B. ("hour", "int").
+    # Nur einfache Strings, damit die Liste an die Worker-Prozesse übergeben (gepickelt) werden kann.
+    return [(c.name, c.type.python_type.__name__) for c in Flight.__table__.columns]
+
+def _to_bool(series):
+    # CSV enthält je nach Export True/False oder 1/0 --> beides wird erkannt
+    mapping = {"true": True, "1": True, "1.0": True, "false": False, "0": False, "0.0": False}
+    return series.str.strip().str.lower().map(mapping).astype("boolean")
+
+def parse_chunk(header, lines, start_row, columns, target):
+    # Wird im Worker-Prozess ausgeführt. Parst einen Block CSV-Zeilen mit den Typen aus dem Modell.
+    # start_row ist die laufende Zeilennummer (0-basiert) des ersten Datensatzes im Block (wird nur noch für Meldungen gebraucht).
+    df = pd.read_csv(io.StringIO(header + "".join(lines)), dtype=str, keep_default_na=True)
+
+    out = pd.DataFrame(index=df.index)
+    for name, kind in columns:
+        if name not in df: # Spalte fehlt in der CSV --> NULL
+            out[name] = None
+            continue
+        s = df[name]
+        if kind == "float":
+            out[name] = pd.to_numeric(s, errors="coerce")
+        elif kind == "int":
+            out[name] = pd.to_numeric(s, errors="coerce").round().astype("Int64")
+        elif kind == "bool":
+            out[name] = _to_bool(s)
+        elif kind == "datetime":
+            out[name] = pd.to_datetime(s, errors="coerce")
+        else:
+            out[name] = s
+    out["flight_id"] = flight_ids(df) # aus den Rohwerten: flight ist keine Spalte des Modells
+    ids = out["flight_id"].to_numpy()
+
+    if target == "frame":
+        # Für die inkrementelle Ingestion: DataFrame + Fingerabdruck pro Zeile (64-Bit Hash über alle Spalten).
+        # hash_pandas_object ist deterministisch (fester Schlüssel) --> gleicher Inhalt = gleicher Hash, auch über Prozesse hinweg.
+        out["row_hash"] = pd.util.hash_pandas_object(out, index=False).values.view("int64")
+        return ids, out
+    return ids, frame_to_payload(out, target)
+
+def flight_ids(df):
+    # flight_id aus dem natürlichen Schlüssel: flight + geplanter Abflug (Minute) + origin, z.B. "AA12-202301011000-JFK".
+    # Hängt nicht von der Zeilennummer ab --> eine neue Zeile in der CSV verschiebt keine anderen flight_ids (inkrementelle Ingestion).
+    # Abflug hat immer 12 Ziffern und steht zwischen zwei Trennzeichen --> verschiedene Schlüssel ergeben nie dieselbe flight_id.
+    departure = pd.to_datetime(df["scheduled_departure"], errors="coerce").dt.strftime("%Y%m%d%H%M").fillna("")
+    return df["flight"].fillna("").astype(str) + "-" + departure + "-" + df["origin"].fillna("").astype(str)
+
+def drop_duplicates(ids, data, seen, target):
+    # Gleicher Schlüssel mehrfach in der CSV (im Chunk oder schon in einem früheren Chunk) --> nur das erste Vorkommen wird geladen.
+    # seen sammelt die flight_ids aller bisherigen Chunks. Gibt (ids, data, Anzahl übersprungener Zeilen) zurück.
+    ids = pd.Series(ids)
+    dup = ids.duplicated().to_numpy() | np.fromiter((i in seen for i in ids), bool, len(ids))
+    seen.update(ids)
+    if not dup.any():
+        return ids, data, 0
+    keep = ~dup
+    if target == "frame":
+        data = data[keep]
+    elif target == "copy": # Selten: CSV-Text noch einmal lesen und ohne die doppelten Zeilen schreiben (leere Felder bleiben NULL)
+        rows = pd.read_csv(io.StringIO(data), header=None, dtype=str, keep_default_na=False)
+        data = rows[keep].to_csv(header=False, index=False)
+    else:
+        data = [row for row, k in zip(data, keep) if k]
+    return ids[keep], data, int(dup.sum())
+
+def report_duplicates(duplicates):
+    if duplicates:
+        print(f"WARNUNG: {duplicates} doppelte Zeilen (gleicher Flug, Abflug und Ursprung) übersprungen, geladen wurde jeweils die erste")
+
+def frame_to_payload(df, target):
+    if target == "copy":
+        # CSV-Text für COPY: leere, nicht gequotete Felder werden von PostgreSQL als NULL gelesen
+        return df.to_csv(header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+    # Für executemany (SQLite): Liste von Dicts, NaN/NaT --> None
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+def iter_csv_chunks(path, chunk_rows):
+    # Liest die Datei zeilenweise und gibt Blöcke von chunk_rows Datensätzen zurück.
+    # Ein Datensatz endet nur dort, wo keine Anführungszeichen mehr offen sind (Zeilenumbrüche in "..." sind erlaubt).
+    with open(path, encoding="utf-8", newline="") as fh:
+        header = fh.readline()
+        lines, records, start_row, open_quote = [], 0, 0, False
+        for line in fh:
+            lines.append(line)
+            if line.count('"') % 2:
+                open_quote = not open_quote
+            if not open_quote:
+                records += 1
+                if records == chunk_rows:
+                    yield header, lines, start_row
+                    start_row += records
+                    lines, records = [], 0
+        if lines:
+            yield header, lines, start_row
+
+def parsed_chunks(path, chunk_rows, workers, columns, target):
+    # Verteilt die Chunks auf den Prozess-Pool und gibt die Ergebnisse in Dateireihenfolge zurück.
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for header, lines, start_row in iter_csv_chunks(path, chunk_rows):
+            pending.append(pool.submit(parse_chunk, header, lines, start_row, columns, target))
+            # Höchstens 2 Chunks pro Worker gleichzeitig im Speicher --> Speicherverbrauch bleibt begrenzt
+            while len(pending) >= workers * 2:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+def prepare_flights_table(engine):
+    # Stellt sicher, dass die flights-Tabelle (und die Hilfstabellen) so aussehen wie in models.py.
+    # Der alte Loader (to_sql mit "replace") hat eine Tabelle ohne Primary Key angelegt --> die wird einmalig ersetzt.
+    # Eine partitionierte flights-Tabelle hat absichtlich keinen Primary Key (siehe partitions.py) und bleibt natürlich stehen,
+    # ebenso die View flights (PostgreSQL, siehe dimensions.py).
+    insp = inspect(engine)
+    with engine.connect() as conn:
+        partitioned = partitions.relkind(conn, "flights") == "p" if conn.dialect.name == "postgresql" else False
+    if insp.has_table("flights") and "flights" not in insp.get_view_names() and not partitioned and not insp.get_pk_constraint("flights").get("constrained_columns"):
+        print("Alte flights-Tabelle ohne Primary Key gefunden --> wird nach models.py neu angelegt")
+        Flight.__table__.drop(engine)
+    with engine.begin() as conn: # PostgreSQL: Fakten (nach Monaten partitioniert) + Dimensionen + View anlegen bzw. einmalig umbauen
+        dimensions.ensure_schema(conn)
+    for model in (Flight, FlightFingerprint, IngestState, FlightRollup, FlightDelaySketch):
+        model.__table__.create(engine, checkfirst=True)
+    with engine.begin() as conn: # Neue Indizes aus models.py auch auf einer schon vorhandenen Tabelle anlegen
+        dimensions.ensure_indexes(conn)
+
+def csv_months(path):
+    # Alle Monate (scheduled_departure) der CSV --> Partitionen vor dem COPY anlegen, sonst landet alles in flights_default.
+    # Liest nur diese eine Spalte, blockweise --> wenig Speicher.
+    months = set()
+    for chunk in pd.read_csv(path, usecols=["scheduled_departure"], chunksize=500000):
+        months.update(pd.to_datetime(chunk["scheduled_departure"], errors="coerce").dropna().dt.to_period("M").dt.to_timestamp())
+    return months
+
+def write_copy(cursor, table_name, columns, csv_text):
+    # PostgreSQL: ein COPY pro Chunk --> um Größenordnungen schneller als einzelne INSERTs
+    cols = ", ".join(name for name, _ in columns)
+    cursor.copy_expert(f"COPY {table_name} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '')", io.StringIO(csv_text))
+
+def write_rows(conn, table, rows):
+    # Fallback ohne COPY (z.B. SQLite in Tests): gebündeltes executemany
+    for i in range(0, len(rows), SQLITE_BATCH):
+        conn.execute(insert(table), rows[i:i + SQLITE_BATCH])
+
+def write_chunk(conn, table, columns, data):
+    # Schreibt einen geparsten Chunk: PostgreSQL per COPY (data = CSV-Text), sonst per executemany (data = Liste von Dicts)
+    if conn.dialect.name == "postgresql":
+        write_copy(conn.connection.cursor(), table.name, columns, data)
+    else:
+        write_rows(conn, table, data)
+
+def payload_target(engine):
+    return "copy" if engine.dialect.name == "postgresql" else "rows"
+
+def run_stream_ingestion(path=CSV_PATH, chunk_rows=CHUNK_ROWS, workers=WORKERS, engine=None):
+    print(f"Starte Streaming-Ingestion ({workers} Worker, {chunk_rows} Zeilen pro Chunk)...")
+    start = time.perf_counter()
+    engine = engine or create_engine(DATABASE_URL)
+    prepare_flights_table(engine)
+    columns = flight_column_types()
+    target = payload_target(engine)
+
+    total, duplicates, seen = 0, 0, set()
+    # Alles in einer Transaktion: bis zum Commit bleibt der alte Stand gültig, bei einem Fehler bleibt alles beim Alten
+    with engine.begin() as conn:
+        dimensions.truncate(conn)
+        if partitions.is_partitioned(conn): partitions.ensure_partitions(conn, csv_months(path))
+        # PostgreSQL: flights ist eine View --> COPY in eine Staging-Tabelle, dann ein mengenbasiertes Aufteilen in Fakten + Dimensionen
+        staging = staging_table() if dimensions.enabled(conn) else Flight.__table__
+        if staging is not Flight.__table__: staging.create(conn)
+        for ids, data in parsed_chunks(path, chunk_rows, workers, columns, target):
+            ids, data, skipped = drop_duplicates(ids, data, seen, target)
+            write_chunk(conn, staging, columns, data)
+            total += len(ids)
+            duplicates += skipped
+        if staging is not Flight.__table__:
+            dimensions.insert_from(conn, staging)
+            staging.drop(conn)
+        # Nach einem kompletten Neuladen passen die Fingerabdrücke nicht mehr --> der nächste inkrementelle Lauf vergleicht alles neu
+        conn.execute(delete(FlightFingerprint.__table__))
+        conn.execute(delete(IngestState.__table__).where(IngestState.source == os.path.basename(path)))
+        partitions.split_default(conn) # Zeilen, die trotzdem in flights_default gelandet sind (z.B. über die API angelegt)
+        refresh_rollups(conn)
+
+    report_duplicates(duplicates)
+    elapsed = time.perf_counter() - start
+    print(f"Erfolgreich {total} Zeilen in {elapsed:.1f}s geladen ({total / max(elapsed, 1e-9):,.0f} Zeilen/s)")
+    return total
+
+def refresh_rollups(conn):
+    # Rollups (Summen pro Airline/Route/Wochentag/Stunde) und Sketches (Buckets pro Airline/Route/Wochentag) in derselben Transaktion
+    # neu aufbauen --> passen immer zu flights
+    rebuild_rollups(conn)
+    rebuild_sketches(conn)
+    check_consistency(conn)
+
+def apply_to_rollups(conn, table, sign):
+    # Inkrementelle Ingestion: nur die Zeilen aus table (Staging-Tabelle bzw. alte Fassung ersetzter/entfernter Flüge)
+    # dazu- (+1) bzw. herausrechnen (-1) statt Rollups und Sketches über ganz flights neu aufzubauen
+    rollups.apply_table(conn, table, sign)
+    sketches.apply_table(conn, table, sign)
+
+def check_consistency(conn):
+    if CHECK_ROLLUPS:
+        mismatches = check_rollups(conn)
+        print("Rollups konsistent" if not mismatches else f"WARNUNG: {len(mismatches)} Rollup-Zellen weichen ab")
+        mismatches = check_sketches(conn)
+        print("Sketches konsistent" if not mismatches else f"WARNUNG: {len(mismatches)} Sketch-Buckets weichen ab")
+
+# Inkrementelle Ingestion
+# Statt flights bei jedem Start zu leeren, wird nur geschrieben, was sich seit dem letzten Lauf geändert hat:
+#   1. SHA-256 der Datei gleich wie beim letzten Mal --> sofort fertig, keine einzige Schreiboperation.
+#   2. Sonst bekommt jede Zeile einen Fingerabdruck (Hash über alle Spalten), Schlüssel ist die flight_id.
+#      Die flight_id kommt aus dem natürlichen Schlüssel (flight_ids) --> eingefügte oder gelöschte Zeilen verschieben keine anderen.
+#      Nur neue oder geänderte Zeilen landen in einer Staging-Tabelle.
+#   3. In EINER Transaktion werden die Staging-Zeilen in flights übernommen und Zeilen entfernt, die nicht mehr in der CSV stehen.
+#      PostgreSQL zeigt Lesern bis zum Commit den alten Stand (MVCC) --> die API liefert die ganze Zeit Daten.
+# Flüge, die über POST /flights/add angelegt wurden, haben keinen Fingerabdruck und bleiben erhalten.
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def staging_table():
+    # Temporäre Tabelle mit den Spalten von flights + row_hash, ohne Indizes (schnelles Befüllen).
+    # TEMPORARY --> gehört nur dieser Verbindung und verschwindet spätestens mit ihr.
+    cols = [Column(c.name, c.type) for c in Flight.__table__.columns]
+    return Table("flights_staging", MetaData(), *cols, Column("row_hash", BigInteger), prefixes=["TEMPORARY"])
+
+def run_incremental_ingestion(path=CSV_PATH, chunk_rows=CHUNK_ROWS, workers=WORKERS, engine=None):
+    print("Starte inkrementelle Ingestion...")
+    start = time.perf_counter()
+    engine = engine or create_engine(DATABASE_URL)
+    source = os.path.basename(path)
+    file_hash = file_sha256(path)
+
+    prepare_flights_table(engine)
+    with engine.connect() as conn:
+        state = conn.execute(select(IngestState.file_hash, IngestState.generation).where(IngestState.source == source)).first()
+        has_flights = conn.execute(select(Flight.flight_id).limit(1)).first() is not None
+        rollups_missing = has_flights and any(conn.execute(select(column).limit(1)).first() is None for column in (FlightRollup.flights, FlightDelaySketch.count))
+    if state is not None and state.file_hash == file_hash:
+        if rollups_missing: # z.B. erster Start nach dem Update: Daten sind da, Rollups bzw. Sketches noch nicht
+            with engine.begin() as conn:
+                refresh_rollups(conn)
+            print("Rollups/Sketches fehlten --> neu aufgebaut")
+        print(f"{source} unverändert (Generation {state.generation}) --> nichts zu tun ({time.perf_counter() - start:.1f}s)")
+        return 0
+
+    columns = flight_column_types()
+    staging = staging_table()
+    target = payload_target(engine)
+    seen, changed, total, duplicates = set(), 0, 0, 0
+
+    with engine.begin() as conn:
+        # Bekannte Fingerabdrücke einmal laden: flight_id --> row_hash
+        known = dict(conn.execute(select(FlightFingerprint.flight_id, FlightFingerprint.row_hash)).all())
+        staging.create(conn)
+
+        for ids, df in parsed_chunks(path, chunk_rows, workers, columns, "frame"):
+            ids, df, skipped = drop_duplicates(ids, df, seen, "frame")
+            total += len(ids)
+            duplicates += skipped
+            # Neu (nicht in known) oder geändert (anderer Hash) --> in die Staging-Tabelle
+            new_or_changed = df[df["flight_id"].map(known) != df["row_hash"]]
+            if not new_or_changed.empty:
+                changed += len(new_or_changed)
+                write_chunk(conn, staging, columns + [("row_hash", "int")], frame_to_payload(new_or_changed, target))
+
+        removed = [fid for fid in known if fid not in seen] # stehen nicht mehr in der CSV
+        # Rollups/Sketches als Delta: vor dem Löschen die alte Fassung heraus-, nach dem Einfügen die Staging-Zeilen dazurechnen.
+        # Fehlen sie noch ganz (erster Lauf nach dem Update) oder ist fast alles neu, werden sie am Ende einmal komplett aufgebaut.
+        delta = not rollups_missing and changed + len(removed) <= ROLLUP_DELTA_MAX * max(total, len(known))
+        staged = select(staging.c.flight_id)
+
+        # Partitionen für alle Monate in der Staging-Tabelle anlegen, bevor die Zeilen in flights landen
+        if partitions.is_partitioned(conn):
+            partitions.ensure_partitions(conn, conn.execute(select(func.date_trunc("month", staging.c.scheduled_departure)).distinct()).scalars().all())
+
+        # Merge: geänderte Zeilen ersetzen, neue einfügen, entfernte löschen (Fakten direkt, Dimensionen über dimensions.insert_from)
+        facts, flights = dimensions.fact_table(conn), Flight.__table__
+        if delta: apply_to_rollups(conn, select(flights).where(flights.c.flight_id.in_(staged)).subquery(), -1)
+        conn.execute(delete(facts).where(facts.c.flight_id.in_(staged)))
+        dimensions.insert_from(conn, staging)
+        if delta: apply_to_rollups(conn, staging, 1)
+        conn.execute(delete(FlightFingerprint.__table__).where(FlightFingerprint.flight_id.in_(staged)))
+        conn.execute(insert(FlightFingerprint.__table__).from_select(["flight_id", "row_hash"], select(staging.c.flight_id, staging.c.row_hash)))
+        for i in range(0, len(removed), SQLITE_BATCH):
+            batch = removed[i:i + SQLITE_BATCH]
+            if delta: apply_to_rollups(conn, select(flights).where(flights.c.flight_id.in_(batch)).subquery(), -1)
+            conn.execute(delete(facts).where(facts.c.flight_id.in_(batch)))
+            conn.execute(delete(FlightFingerprint.__table__).where(FlightFingerprint.flight_id.in_(batch)))
+        staging.drop(conn)
+        partitions.split_default(conn)
+        if delta: check_consistency(conn)
+        else: refresh_rollups(conn)
+
+        # Zustand merken: beim nächsten Start mit gleicher Datei ist nichts zu tun
+        generation = (state.generation if state is not None else 0) + 1
+        conn.execute(delete(IngestState.__table__).where(IngestState.source == source))
+        conn.execute(insert(IngestState.__table__).values(source=source, file_hash=file_hash, rows=total,
+                                                          generation=generation, loaded_at=datetime.utcnow()))
+
+    report_duplicates(duplicates)
+    elapsed = time.perf_counter() - start
+    print(f"{total} Zeilen geprüft: {changed} neu/geändert, {len(removed)} entfernt, Generation {generation} "
+          f"({elapsed:.1f}s, {total / max(elapsed, 1e-9):,.0f} Zeilen/s)")
+    return changed + len(removed)
+
 if __name__ == "__main__":
     # Kleiner Delay, damit die DB sicher bereit ist
     time.sleep(5) 
-    run_ingestion()
\ No newline at end of file
+    if INGEST_MODE == "replace":
+        run_ingestion()
+    elif INGEST_MODE == "stream":
+        run_stream_ingestion()
+    else:
+        run_incremental_ingestion()